@@ -1,19 +1,42 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from uvicorn import run as app_run
 from typing import Optional
 
-from src.pipeline.predict import VisaData, VisaClassifier
-from src.pipeline.train import TrainPipeline
+from src.pipeline.predict import VisaData, VisaClassifier, get_case_status
+from src.pipeline.micro_batcher import get_micro_batcher_metrics
+from src.pipeline.inference_executor import (InferenceExecutor, predict_visa_data, predict_batch_content,
+                                             get_prediction_cache_stats)
+from src.pipeline.training_jobs import TrainingJobManager
+from src.metrics import ServerTimingMiddleware, measure, render_prometheus
 from src.constants import APP_HOST, APP_PORT
 
 
+# Inference runs in this executor so that the event loop only handles I/O
+inference_executor = InferenceExecutor()
+# Train pipelines run as background jobs in separate processes
+training_job_manager = TrainingJobManager()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start the executor and preload the model before serving requests
+    await asyncio.to_thread(inference_executor.start)
+    yield
+    inference_executor.shutdown()
+    training_job_manager.shutdown()
+
+
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Serve static files with FastAPI
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -27,6 +50,9 @@ app.add_middleware(CORSMiddleware,
                    allow_methods=["*"],
                    allow_headers=["*"])
 
+# Time the stages of prediction requests and report them in the Server-Timing header and /metrics
+app.add_middleware(ServerTimingMiddleware, paths=["/predict"])
+
 
 class DataForm:
     def __init__(self, request: Request):
@@ -57,26 +83,85 @@ class DataForm:
         self.yr_of_estab = form.get("yr_of_estab")
 
 
+class BatchDataForm:
+    """Reads a batch upload sent either as a multipart file or as a raw JSON, JSON Lines or CSV body."""
+    content_types = {
+        "application/json": "json",
+        "application/jsonl": "jsonl",
+        "application/x-jsonlines": "jsonl",
+        "application/x-ndjson": "jsonl",
+        "text/csv": "csv",
+    }
+    file_extensions = {".json": "json", ".jsonl": "jsonl", ".ndjson": "jsonl", ".csv": "csv"}
+
+    def __init__(self, request: Request):
+        self.request: Request = request
+        self.content: Optional[bytes] = None
+        self.data_format: Optional[str] = None
+
+
+    async def get_batch_data(self):
+        content_type = self.request.headers.get("content-type", "").split(";")[0].strip().lower()
+        self.data_format = self.request.query_params.get("format")
+        if content_type == "multipart/form-data":
+            form = await self.request.form()
+            upload = form.get("file")
+            if upload is None:
+                raise ValueError("Expected the batch file in the 'file' field")
+            self.content = await upload.read()
+            if self.data_format is None:
+                extension = os.path.splitext(upload.filename or "")[1].lower()
+                self.data_format = self.file_extensions.get(extension)
+        else:
+            self.content = await self.request.body()
+            if self.data_format is None:
+                self.data_format = self.content_types.get(content_type)
+        if self.data_format is None:
+            raise ValueError("Unable to determine the batch format; pass ?format=json|jsonl|csv")
+
+
 @app.get("/")
 async def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request, "context": "???"})
 
 
 @app.get("/train")
-async def trigger_training_pipeline():
+@app.post("/train")
+async def trigger_training_pipeline(resume: bool = False):
     try:
-        train_pipeline = TrainPipeline()
-        train_pipeline.run_pipeline()
-        return Response("Train: Success")
+        # /train?resume=true continues the latest interrupted run from its checkpoint
+        job = training_job_manager.submit(resume=resume)
+        return JSONResponse(job.to_dict(), status_code=202)
     except Exception as e:
-        return Response(f"Train: Error Occurred [{e}]")
+        return JSONResponse({"status": False, "error": f"{e}"}, status_code=500)
+
+
+@app.get("/train/{job_id}")
+async def get_training_job(job_id: str):
+    job = training_job_manager.get(job_id)
+    if job is None:
+        return JSONResponse({"status": False, "error": f"Training job {job_id} not found"}, status_code=404)
+    return job.to_dict()
+
+
+@app.delete("/train/{job_id}")
+async def cancel_training_job(job_id: str):
+    try:
+        # Stopping a running job waits for its process to exit
+        job = await asyncio.to_thread(training_job_manager.cancel, job_id)
+        if job is None:
+            return JSONResponse({"status": False, "error": f"Training job {job_id} not found"}, status_code=404)
+        return job.to_dict()
+    except Exception as e:
+        return JSONResponse({"status": False, "error": f"{e}"}, status_code=500)
 
 
 @app.post("/predict")
 async def predict_visa_status(request: Request):
     try:
         form = DataForm(request)
-        await form.get_visa_data()
+        with measure("parse_form"):
+            await form.get_visa_data()
         visa_data = VisaData(continent=form.continent,
                              employee_education=form.education_of_employee,
                              has_job_experience=form.has_job_experience,
@@ -88,21 +173,54 @@ async def predict_visa_status(request: Request):
                              full_time_position=form.full_time_position,
                              yr_of_estab=int(form.yr_of_estab))
 
-        visa_df = visa_data.convert_to_dataframe()
+        # Set PREDICTION_USE_S3=true to predict with the production model (AWS S3) instead of the local one
         model = VisaClassifier()
-
-        # Use in local deployment
-        outcome = model.predict_local(dataframe=visa_df)[0]
-
-        # Use in production (AWS S3)
-        # outcome = model.predict_s3(dataframe=visa_df)[0]
-
-        status = "Certified" if outcome == 1 else "Denied"
+        if model.prediction_pipeline_config.micro_batching:
+            # Score the row together with other concurrent requests
+            future = model.submit_to_micro_batcher(dataframe=visa_data.convert_to_dataframe(),
+                                                   predict_fn=inference_executor.predict_dataframe)
+            with measure("micro_batch"):
+                outcome = (await asyncio.wrap_future(future))[0]
+            status = get_case_status(outcome)
+        else:
+            status = await inference_executor.run(predict_visa_data, visa_data)
         # Return the predicted outcome as JSON response
         return {"context": status}
     except Exception as e:
         return {"status": False, "error": f"{e}"}
 
 
+@app.post("/predict/batch")
+async def predict_visa_status_batch(request: Request):
+    try:
+        form = BatchDataForm(request)
+        with measure("parse_form"):
+            await form.get_batch_data()
+        # Set PREDICTION_USE_S3=true to predict with the production model (AWS S3) instead of the local one
+        results = await inference_executor.run(predict_batch_content, form.content, form.data_format)
+
+        error_count = sum(1 for result in results if "error" in result)
+        return {"count": len(results), "error_count": error_count, "results": results}
+    except Exception as e:
+        return {"status": False, "error": f"{e}"}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Serves the stage latency histograms and p50/p95/p99 quantiles in Prometheus text format."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/micro_batcher")
+async def micro_batcher_metrics():
+    return get_micro_batcher_metrics()
+
+
+@app.get("/metrics/prediction_cache")
+async def prediction_cache_metrics():
+    # With a process executor, each worker has its own cache and this reports the worker that ran the call
+    return await inference_executor.run(get_prediction_cache_stats)
+
+
 if __name__ == "__main__":
     app_run(app, host=APP_HOST, port=APP_PORT)
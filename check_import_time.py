@@ -0,0 +1,79 @@
+"""Checks the startup cost of the serving app.
+
+Imports the app in a fresh interpreter with `python -X importtime`, prints the total import time and the slowest
+top-level imports, and fails when the import takes longer than the budget or loads a module that the serving path
+should only load on first use (training, drift and cloud modules).
+
+    python check_import_time.py --budget 1.5 --repeat 3
+"""
+import os
+import sys
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+
+IMPORT_TIME_BUDGET_SECONDS: float = 1.5
+# Modules that must not be loaded by `import app`
+LAZY_MODULES: List[str] = [
+    "boto3",
+    "botocore",
+    "pymongo",
+    "evidently",
+    "sklearn",
+    "scipy",
+    "src.pipeline.train",
+    "src.components",
+    "src.cloud_storage",
+    "src.configuration",
+    "src.entity.s3_estimator",
+]
+
+
+def measure_import(module: str) -> Tuple[float, Dict[str, Tuple[int, float]]]:
+    """Imports module in a new interpreter and returns its import time and the (depth, seconds) of every import."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}:\n{result.stderr}")
+
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.setdefault(name.strip(), (depth, int(cumulative) / 1e6))
+    return imports[module][1], imports
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check the import time budget of the serving app")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget", type=float, default=IMPORT_TIME_BUDGET_SECONDS, help="seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="report the fastest of this many imports")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to show")
+    args = parser.parse_args()
+
+    # The fastest run is the least disturbed by a cold disk cache or other processes
+    total, imports = min((measure_import(args.module) for _ in range(args.repeat)), key=lambda run: run[0])
+    print(f"import {args.module}: {total:.3f}s (budget: {args.budget:.3f}s)")
+    top_level = sorted(((seconds, name) for name, (depth, seconds) in imports.items() if depth == 1), reverse=True)
+    for seconds, name in top_level[:args.top]:
+        print(f"  {seconds:8.3f}s  {name}")
+
+    failed = False
+    if total > args.budget:
+        print(f"FAIL: import {args.module} exceeds the budget by {total - args.budget:.3f}s")
+        failed = True
+    eager_modules = [name for name in LAZY_MODULES if name in imports]
+    if eager_modules:
+        print(f"FAIL: import {args.module} loads modules that should be imported on first use: "
+              f"{', '.join(eager_modules)}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -33,6 +33,15 @@ class SimpleStorageService:
             raise CustomException(e, sys)
 
 
+    def get_object_etag(self, bucket_name: str, s3_key: str) -> str:
+        """Retrieves the ETag of the s3_key object in bucket_name bucket without downloading its body."""
+        try:
+            response = self.s3_client.head_object(Bucket=bucket_name, Key=s3_key)
+            return response["ETag"]
+        except Exception as e:
+            raise CustomException(e, sys)
+
+
     @staticmethod
     def read_object(object_name: str, decode: bool = True, make_readable: bool = False) -> Union[StringIO, str]:
         """Reads the object_name object with kwargs."""
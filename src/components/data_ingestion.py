@@ -1,60 +1,272 @@
 import os
 import sys
+import shutil
+from typing import Optional
 
+import numpy as np
+import pandas as pd
+from bson import json_util
 from pandas import DataFrame
-from sklearn.model_selection import train_test_split
+from dataclasses import replace
 
 from src.data_access.visa_data import VisaData
-from src.entity.config_entity import DataIngestionConfig
+from src.entity.config_entity import DataIngestionConfig, with_file_format
 from src.entity.artifact_entity import DataIngestionArtifact
+from src.entity.artifact_cache import ArtifactCache
 
 from src.exception import CustomException
 from src.logger import logging
-from src.constants import SEED
+from src.constants import SCHEMA_FILE_PATH
+from src.utils import read_yaml_file, save_dataframe, get_dataframe_file_format
 
 
 class DataIngestion:
-    def __init__(self, data_ingestion_config=DataIngestionConfig()):
+    def __init__(self, data_ingestion_config=DataIngestionConfig(), artifact_cache: Optional[ArtifactCache] = None):
         try:
-            self.data_ingestion_config = data_ingestion_config
+            self.data_ingestion_config = self.resolve_file_format(data_ingestion_config)
+            self.artifact_cache = artifact_cache if artifact_cache is not None else ArtifactCache(in_memory=False)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    @staticmethod
+    def resolve_file_format(data_ingestion_config: DataIngestionConfig) -> DataIngestionConfig:
+        """Returns the config with the file format that can be written here, and the file paths of that format."""
+        file_format = get_dataframe_file_format(data_ingestion_config.file_format)
+        if file_format == data_ingestion_config.file_format:
+            return data_ingestion_config
+        file_path_fields = ("feature_store_file_path", "training_file_path", "testing_file_path")
+        return replace(data_ingestion_config, file_format=file_format,
+                       **{field: with_file_format(getattr(data_ingestion_config, field), file_format)
+                          for field in file_path_fields})
+
+
+    @staticmethod
+    def get_column_types() -> dict:
+        """Returns the column types of the schema by column name, in schema order."""
+        return {column: column_type for column_spec in read_yaml_file(SCHEMA_FILE_PATH)["columns"]
+                for column, column_type in column_spec.items()}
+
+
+    def to_schema_dtypes(self, dataframe: DataFrame) -> DataFrame:
+        """Converts the category columns of the schema to pandas categoricals, which the columnar formats keep."""
+        category_columns = [column for column, column_type in self.get_column_types().items()
+                            if column_type == "category" and column in dataframe.columns]
+        return dataframe.astype({column: "category" for column in category_columns})
+
+
+    def get_part_file_path(self, set_name: str, part_index: int) -> str:
+        """Returns the file of a part of the train or test set of the persistent feature store."""
+        return os.path.join(self.data_ingestion_config.persistent_feature_store_dir, set_name,
+                            f"part-{part_index:05d}.{self.data_ingestion_config.file_format}")
+
+
+    def read_watermark(self) -> Optional[dict]:
+        """
+        Returns the watermark state of the persistent feature store, or None when the store has to be rebuilt.
+
+        The state holds the collection, the watermark field and value, the split and file format of the store, and the
+        number of train and test part files written up to the watermark. Parts written by a run that failed before
+        saving its watermark are deleted. The store is rebuilt when it has no watermark, misses one of its parts, or
+        was exported from another collection, with another watermark field, split or file format.
+
+        """
+        try:
+            watermark_file_path = self.data_ingestion_config.watermark_file_path
+            if not os.path.exists(watermark_file_path):
+                return None
+            with open(watermark_file_path) as watermark_file:
+                watermark_state = json_util.loads(watermark_file.read())
+            # Stores of an older version are a single CSV file, without part files
+            expected_state = {"collection_name": self.data_ingestion_config.collection_name,
+                              "watermark_field": self.data_ingestion_config.watermark_field,
+                              "split_key_column": self.data_ingestion_config.split_key_column,
+                              "train_test_split_ratio": self.data_ingestion_config.train_test_split_ratio,
+                              "file_format": self.data_ingestion_config.file_format}
+            if any(watermark_state.get(key) != value for key, value in expected_state.items()):
+                logging.info(f"Watermark {watermark_state} does not match the config: rebuilding the feature store")
+                return None
+            for set_name in ("train", "test"):
+                part_file_paths = {self.get_part_file_path(set_name, part_index)
+                                   for part_index in range(watermark_state["part_count"])}
+                if not all(os.path.exists(part_file_path) for part_file_path in part_file_paths):
+                    logging.info(f"The feature store misses {set_name} parts of watermark {watermark_state}: "
+                                 f"rebuilding it")
+                    return None
+                set_dir = os.path.join(self.data_ingestion_config.persistent_feature_store_dir, set_name)
+                for file_name in os.listdir(set_dir):
+                    if os.path.join(set_dir, file_name) not in part_file_paths:
+                        logging.info(f"Deleting {set_name} part {file_name} of an interrupted ingestion")
+                        os.remove(os.path.join(set_dir, file_name))
+            return watermark_state
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def save_watermark(self, watermark: object, overlap_documents: list, part_count: int) -> None:
+        try:
+            watermark_state = {
+                "collection_name": self.data_ingestion_config.collection_name,
+                "watermark_field": self.data_ingestion_config.watermark_field,
+                "split_key_column": self.data_ingestion_config.split_key_column,
+                "train_test_split_ratio": self.data_ingestion_config.train_test_split_ratio,
+                "file_format": self.data_ingestion_config.file_format,
+                "watermark": watermark,
+                # The documents read again by the next run, which are skipped
+                "overlap_documents": overlap_documents,
+                "part_count": part_count
+            }
+            tmp_file_path = f"{self.data_ingestion_config.watermark_file_path}.tmp"
+            with open(tmp_file_path, "w") as watermark_file:
+                watermark_file.write(json_util.dumps(watermark_state))
+            os.replace(tmp_file_path, self.data_ingestion_config.watermark_file_path)
+            logging.info(f"Saved watermark {watermark} with {len(overlap_documents)} overlap documents and "
+                         f"{part_count} parts")
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def export_new_data_into_feature_store(self) -> int:
+        """
+        Splits the documents added to MongoDB since the last run into a new train and a new test part file of the
+        persistent feature store, so that a run reads and writes only the new documents.
+
+        Returns:
+            The number of new train rows.
+
+        """
+        try:
+            feature_store_dir = self.data_ingestion_config.persistent_feature_store_dir
+            watermark_state = self.read_watermark()
+            if watermark_state is None and os.path.exists(feature_store_dir):
+                shutil.rmtree(feature_store_dir)
+            os.makedirs(feature_store_dir, exist_ok=True)
+            watermark = watermark_state["watermark"] if watermark_state is not None else None
+            overlap_documents = watermark_state["overlap_documents"] if watermark_state is not None else []
+            part_count = watermark_state["part_count"] if watermark_state is not None else 0
+            logging.info(f"Exporting the data after {self.data_ingestion_config.watermark_field} {watermark} "
+                         f"from MongoDB")
+
+            # The new documents are streamed to a CSV file of their own, then split into the part files
+            new_documents_file_path = os.path.join(feature_store_dir, "new_documents.csv")
+            if os.path.exists(new_documents_file_path):
+                os.remove(new_documents_file_path)
+            n_documents, watermark, overlap_documents = VisaData().export_new_documents_to_csv(
+                collection_name=self.data_ingestion_config.collection_name,
+                file_path=new_documents_file_path,
+                column_types=self.get_column_types(),
+                watermark_field=self.data_ingestion_config.watermark_field,
+                watermark=watermark,
+                batch_size=self.data_ingestion_config.export_batch_size,
+                n_partitions=self.data_ingestion_config.read_partitions,
+                partition_field=self.data_ingestion_config.partition_field,
+                overlap_seconds=self.data_ingestion_config.watermark_overlap_seconds,
+                overlap_documents=overlap_documents
+            )
+            n_new_train_rows = 0
+            if n_documents > 0:
+                dataframe = self.to_schema_dtypes(pd.read_csv(new_documents_file_path))
+                test_mask = self.get_test_mask(dataframe)
+                save_dataframe(self.get_part_file_path("train", part_count), dataframe[~test_mask])
+                save_dataframe(self.get_part_file_path("test", part_count), dataframe[test_mask])
+                n_new_train_rows = int((~test_mask).sum())
+                part_count += 1
+            # The parts are committed with the watermark
+            self.save_watermark(watermark, overlap_documents, part_count)
+            if os.path.exists(new_documents_file_path):
+                os.remove(new_documents_file_path)
+            logging.info(f"Added {n_new_train_rows} train and {n_documents - n_new_train_rows} test rows to the "
+                         f"feature store, in {part_count} parts")
+            return n_new_train_rows
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def link_feature_store_parts(self, set_name: str, dir_path: str) -> None:
+        """
+        Links the committed part files of the train or test set of the persistent feature store into dir_path, which
+        load_dataframe reads as one dataframe. The parts are never rewritten, so the links keep the data of this run
+        without copying it; a filesystem without hard links gets copies.
+
+        """
+        try:
+            if os.path.exists(dir_path):
+                shutil.rmtree(dir_path)
+            os.makedirs(dir_path)
+            set_dir = os.path.join(self.data_ingestion_config.persistent_feature_store_dir, set_name)
+            for file_name in sorted(os.listdir(set_dir)):
+                try:
+                    os.link(os.path.join(set_dir, file_name), os.path.join(dir_path, file_name))
+                except OSError:
+                    shutil.copyfile(os.path.join(set_dir, file_name), os.path.join(dir_path, file_name))
+            logging.info(f"Linked the {set_name} parts of the feature store into {dir_path}")
         except Exception as e:
             raise CustomException(e, sys) from e
 
 
     def export_data_into_feature_store(self) -> DataFrame:
-        """Exports data from MongoDB to CSV file."""
+        """Exports data from MongoDB to the feature store file, in the file format of the config."""
         try:
             logging.info(f"Exporting data from MongoDB")
             visa_data = VisaData()
+            feature_store_file_path  = self.data_ingestion_config.feature_store_file_path
+            if self.data_ingestion_config.streaming_export:
+                column_types = self.get_column_types()
+                # The export streams CSV, which is converted once to the file format of the feature store
+                csv_file_path = with_file_format(feature_store_file_path, "csv")
+                logging.info(f"Streaming exported data into feature store file path: {csv_file_path}")
+                visa_data.export_collection_to_csv(collection_name=self.data_ingestion_config.collection_name,
+                                                   file_path=csv_file_path,
+                                                   column_types=column_types,
+                                                   batch_size=self.data_ingestion_config.export_batch_size,
+                                                   n_partitions=self.data_ingestion_config.read_partitions,
+                                                   partition_field=self.data_ingestion_config.partition_field)
+                dataframe = self.to_schema_dtypes(pd.read_csv(csv_file_path))
+                if csv_file_path != feature_store_file_path:
+                    self.artifact_cache.save(feature_store_file_path, dataframe, save_dataframe)
+                    os.remove(csv_file_path)
+                logging.info(f"Shape of dataframe: {dataframe.shape}")
+                return dataframe
+
             dataframe = visa_data.export_collection_as_dataframe(
                 collection_name=self.data_ingestion_config.collection_name
             )
+            dataframe = self.to_schema_dtypes(dataframe)
             logging.info(f"Shape of dataframe: {dataframe.shape}")
-            feature_store_file_path  = self.data_ingestion_config.feature_store_file_path
-            dir_path = os.path.dirname(feature_store_file_path)
-            os.makedirs(dir_path, exist_ok=True)
             logging.info(f"Saving exported data into feature store file path: {feature_store_file_path}")
-            dataframe.to_csv(feature_store_file_path, index=False, header=True)
+            self.artifact_cache.save(feature_store_file_path, dataframe, save_dataframe)
             return dataframe
         except Exception as e:
             raise CustomException(e, sys) from e
 
 
+    def get_test_mask(self, dataframe: DataFrame) -> np.ndarray:
+        """
+        Returns which rows belong to the test set, by a hash of their split key column (of the whole row without it).
+
+        A row is in the same set in every run, so the rows the production model was trained on never move to the test
+        set as the feature store grows.
+
+        """
+        split_key_column = self.data_ingestion_config.split_key_column
+        if split_key_column in dataframe.columns:
+            hashes = pd.util.hash_array(dataframe[split_key_column].astype(str).to_numpy(dtype=object))
+        else:
+            hashes = pd.util.hash_pandas_object(dataframe, index=False).to_numpy()
+        return hashes % 10000 < self.data_ingestion_config.train_test_split_ratio * 10000
+
+
     def split_data_into_train_test(self, dataframe: DataFrame) -> None:
-        """Splits the dataframe into train and test sets based on the split ratio."""
+        """Splits the dataframe into train and test sets based on the split ratio, keeping the order of the rows."""
         logging.info("Entered split_data_into_train_test method of DataIngestion class")
         try:
-            train_set, test_set = train_test_split(dataframe,
-                                                   test_size=self.data_ingestion_config.train_test_split_ratio,
-                                                   random_state=SEED)
+            test_mask = self.get_test_mask(dataframe)
+            train_set, test_set = dataframe[~test_mask], dataframe[test_mask]
             logging.info("Performed train test split on the dataframe")
 
-            dir_path = os.path.dirname(self.data_ingestion_config.training_file_path)
-            os.makedirs(dir_path, exist_ok=True)
-
             logging.info(f"Exporting train and test file path")
-            train_set.to_csv(self.data_ingestion_config.training_file_path, index=False, header=True)
-            test_set.to_csv(self.data_ingestion_config.testing_file_path, index=False, header=True)
+            self.artifact_cache.save(self.data_ingestion_config.training_file_path, train_set, save_dataframe)
+            self.artifact_cache.save(self.data_ingestion_config.testing_file_path, test_set, save_dataframe)
             logging.info(f"Exported train and test file path.")
             logging.info("Exited split_data_into_train_test method of DataIngestion class")
         except Exception as e:
@@ -65,16 +277,28 @@ class DataIngestion:
         """Initiates the data ingestion component of training pipeline."""
         logging.info("Entered initiate_data_ingestion method of DataIngestion class")
         try:
-            dataframe = self.export_data_into_feature_store()
-            logging.info("Retrieved data from MongoDB")
+            if self.data_ingestion_config.incremental_ingestion:
+                new_train_row_count = self.export_new_data_into_feature_store()
+                logging.info("Split the new data from MongoDB into the feature store")
+                # Directories of the part files, without the file format extension
+                train_file_path = os.path.splitext(self.data_ingestion_config.training_file_path)[0]
+                test_file_path = os.path.splitext(self.data_ingestion_config.testing_file_path)[0]
+                self.link_feature_store_parts("train", train_file_path)
+                self.link_feature_store_parts("test", test_file_path)
+                data_ingestion_artifact = DataIngestionArtifact(train_file_path=train_file_path,
+                                                                test_file_path=test_file_path,
+                                                                new_train_row_count=new_train_row_count)
+            else:
+                dataframe = self.export_data_into_feature_store()
+                logging.info("Retrieved data from MongoDB")
 
-            self.split_data_into_train_test(dataframe)
-            logging.info("Performed train test split on the dataset")
+                self.split_data_into_train_test(dataframe)
+                logging.info("Performed train test split on the dataset")
 
-            data_ingestion_artifact = DataIngestionArtifact(
-                train_file_path=self.data_ingestion_config.training_file_path,
-                test_file_path=self.data_ingestion_config.testing_file_path
-            )
+                data_ingestion_artifact = DataIngestionArtifact(
+                    train_file_path=self.data_ingestion_config.training_file_path,
+                    test_file_path=self.data_ingestion_config.testing_file_path
+                )
             logging.info(f"Data ingestion artifact: {data_ingestion_artifact}")
             logging.info("Exited initiate_data_ingestion method of DataIngestion class")
             return data_ingestion_artifact
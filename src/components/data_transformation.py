@@ -1,4 +1,5 @@
 import sys
+from typing import Optional
 
 import numpy as np
 import pandas as pd
@@ -10,30 +11,39 @@ from sklearn.compose import ColumnTransformer
 from src.constants import TARGET_COLUMN, SCHEMA_FILE_PATH, DATASET_YEAR
 from src.entity.config_entity import DataTransformationConfig
 from src.entity.artifact_entity import DataTransformationArtifact, DataIngestionArtifact, DataValidationArtifact
+from src.entity.artifact_cache import ArtifactCache
 
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import save_object, save_numpy_array_data, read_yaml_file, drop_columns
+from src.utils import save_object, save_numpy_array_data, read_yaml_file, drop_columns, load_dataframe
 
 
 class DataTransformation:
     def __init__(self,
                  data_ingestion_artifact: DataIngestionArtifact,
                  data_transformation_config: DataTransformationConfig,
-                 data_validation_artifact: DataValidationArtifact):
+                 data_validation_artifact: DataValidationArtifact,
+                 artifact_cache: Optional[ArtifactCache] = None):
         try:
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_transformation_config = data_transformation_config
             self.data_validation_artifact = data_validation_artifact
+            self.artifact_cache = artifact_cache if artifact_cache is not None else ArtifactCache(in_memory=False)
             self._schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
         except Exception as e:
             raise CustomException(e, sys) from e
 
 
+    @staticmethod
+    def save_input_data(file_path: str, dataframe: pd.DataFrame) -> None:
+        """Saves input features as CSV, the format the serving app receives them in."""
+        dataframe.to_csv(file_path, index=False)
+
+
     @staticmethod
     def read_data(file_path) -> pd.DataFrame:
         try:
-            return pd.read_csv(file_path)
+            return load_dataframe(file_path)
         except Exception as e:
             raise CustomException(e, sys) from e
 
@@ -81,8 +91,10 @@ class DataTransformation:
                 preprocessor = self.get_data_transformer_object()
                 logging.info("Retrieved the preprocessor object")
 
-                train_df = DataTransformation.read_data(file_path=self.data_ingestion_artifact.train_file_path)
-                test_df = DataTransformation.read_data(file_path=self.data_ingestion_artifact.test_file_path)
+                train_df = self.artifact_cache.load(self.data_ingestion_artifact.train_file_path,
+                                                    DataTransformation.read_data)
+                test_df = self.artifact_cache.load(self.data_ingestion_artifact.test_file_path,
+                                                   DataTransformation.read_data)
 
                 input_feature_train_df = train_df.drop(columns=[TARGET_COLUMN], axis=1)
                 target_feature_train_df = train_df[TARGET_COLUMN]
@@ -110,26 +122,29 @@ class DataTransformation:
                 logging.info("Applied transform to the test features")
 
                 logging.info("Creating train array and test array")
-                train_arr = np.c_[input_feature_train_arr, np.array(target_feature_train_df)]
-                test_arr = np.c_[input_feature_test_arr, np.array(target_feature_test_df)]
-                save_object(
-                    file_path=self.data_transformation_config.transformed_object_file_path,
-                    obj=preprocessor
-                )
-                save_numpy_array_data(
-                    file_path=self.data_transformation_config.transformed_train_file_path,
-                    array=train_arr
-                )
-                save_numpy_array_data(
-                    file_path=self.data_transformation_config.transformed_test_file_path,
-                    array=test_arr
-                )
-                logging.info("Saved the preprocessor, train array, and test array")
+                # Column-major, so that the features and the target of a memory-mapped array are contiguous views
+                train_arr = np.asfortranarray(np.c_[input_feature_train_arr, np.array(target_feature_train_df)])
+                test_arr = np.asfortranarray(np.c_[input_feature_test_arr, np.array(target_feature_test_df)])
+                self.artifact_cache.save(self.data_transformation_config.transformed_object_file_path, preprocessor,
+                                         save_object)
+                self.artifact_cache.save(self.data_transformation_config.transformed_train_file_path, train_arr,
+                                         save_numpy_array_data)
+                self.artifact_cache.save(self.data_transformation_config.transformed_test_file_path, test_arr,
+                                         save_numpy_array_data)
+                self.artifact_cache.save(self.data_transformation_config.input_train_file_path, input_feature_train_df,
+                                         DataTransformation.save_input_data)
+                self.artifact_cache.save(self.data_transformation_config.input_test_file_path, input_feature_test_df,
+                                         DataTransformation.save_input_data)
+                logging.info("Saved the preprocessor, train array, test array and input features")
 
                 data_transformation_artifact = DataTransformationArtifact(
                     transformed_object_file_path=self.data_transformation_config.transformed_object_file_path,
                     transformed_train_file_path=self.data_transformation_config.transformed_train_file_path,
-                    transformed_test_file_path=self.data_transformation_config.transformed_test_file_path
+                    transformed_test_file_path=self.data_transformation_config.transformed_test_file_path,
+                    input_train_file_path=self.data_transformation_config.input_train_file_path,
+                    input_test_file_path=self.data_transformation_config.input_test_file_path,
+                    # Runs resumed from a checkpoint of an older version do not know their new rows
+                    new_train_row_count=getattr(self.data_ingestion_artifact, "new_train_row_count", None)
                 )
                 logging.info("Exited initiate_data_transformation method of DataTransformation class")
                 return data_transformation_artifact
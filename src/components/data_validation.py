@@ -1,6 +1,6 @@
 import sys
+from typing import Optional
 
-import pandas as pd
 from pandas import DataFrame
 import json
 
@@ -9,18 +9,21 @@ from evidently.metric_preset import DataDriftPreset
 
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import read_yaml_file, write_yaml_file
+from src.utils import read_yaml_file, write_yaml_file, load_dataframe
 from src.constants import SCHEMA_FILE_PATH
 
 from src.entity.artifact_entity import DataIngestionArtifact, DataValidationArtifact
 from src.entity.config_entity import DataValidationConfig
+from src.entity.artifact_cache import ArtifactCache
 
 
 class DataValidation:
-    def __init__(self, data_ingestion_artifact: DataIngestionArtifact, data_validation_config: DataValidationConfig):
+    def __init__(self, data_ingestion_artifact: DataIngestionArtifact, data_validation_config: DataValidationConfig,
+                 artifact_cache: Optional[ArtifactCache] = None):
         try:
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_validation_config = data_validation_config
+            self.artifact_cache = artifact_cache if artifact_cache is not None else ArtifactCache(in_memory=False)
             self._schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
         except Exception as e:
             raise CustomException(e, sys) from e
@@ -63,7 +66,7 @@ class DataValidation:
     @staticmethod
     def read_data(file_path) -> DataFrame:
         try:
-            return pd.read_csv(file_path)
+            return load_dataframe(file_path)
         except Exception as e:
             raise CustomException(e, sys) from e
 
@@ -92,8 +95,10 @@ class DataValidation:
         try:
             validation_error_msg = ""
             logging.info("Starting data validation")
-            train_df, test_df = (DataValidation.read_data(file_path=self.data_ingestion_artifact.train_file_path),
-                                 DataValidation.read_data(file_path=self.data_ingestion_artifact.test_file_path))
+            train_df, test_df = (self.artifact_cache.load(self.data_ingestion_artifact.train_file_path,
+                                                          DataValidation.read_data),
+                                 self.artifact_cache.load(self.data_ingestion_artifact.test_file_path,
+                                                          DataValidation.read_data))
             status = self.validate_number_of_columns(dataframe=train_df)
             logging.info(f"All required columns are present in train dataframe: {status}")
             if not status:
@@ -111,6 +116,7 @@ class DataValidation:
                 validation_error_msg += f"Columns are missing in test dataframe."
 
             is_validated = len(validation_error_msg) == 0
+            drift_exist = False
             if is_validated:
                 drift_exist = self.detect_dataset_drift(train_df, test_df)
                 if drift_exist:
@@ -124,7 +130,8 @@ class DataValidation:
             data_validation_artifact = DataValidationArtifact(
                 is_validated=is_validated,
                 message=validation_error_msg,
-                drift_report_file_path=self.data_validation_config.drift_report_file_path
+                drift_report_file_path=self.data_validation_config.drift_report_file_path,
+                is_drift_detected=drift_exist
             )
             logging.info(f"Data validation artifact: {data_validation_artifact}")
             return data_validation_artifact
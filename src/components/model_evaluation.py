@@ -1,5 +1,4 @@
 import sys
-import pandas as pd
 from typing import Optional
 from dataclasses import dataclass
 
@@ -9,10 +8,12 @@ from src.entity.config_entity import ModelEvaluationConfig
 from src.entity.artifact_entity import ModelTrainerArtifact, DataIngestionArtifact, ModelEvaluationArtifact
 from src.entity.estimator import VisaModel
 from src.entity.s3_estimator import VisaEstimator
+from src.entity.artifact_cache import ArtifactCache
 
 from src.exception import CustomException
 from src.logger import logging
 from src.constants import TARGET_COLUMN, CURRENT_YEAR
+from src.utils import load_dataframe
 
 
 @dataclass
@@ -27,11 +28,13 @@ class ModelEvaluation:
     def __init__(self,
                  model_eval_config: ModelEvaluationConfig,
                  data_ingestion_artifact: DataIngestionArtifact,
-                 model_trainer_artifact: ModelTrainerArtifact):
+                 model_trainer_artifact: ModelTrainerArtifact,
+                 artifact_cache: Optional[ArtifactCache] = None):
         try:
             self.model_eval_config = model_eval_config
             self.data_ingestion_artifact = data_ingestion_artifact
             self.model_trainer_artifact = model_trainer_artifact
+            self.artifact_cache = artifact_cache if artifact_cache is not None else ArtifactCache(in_memory=False)
         except Exception as e:
             raise CustomException(e, sys) from e
 
@@ -53,7 +56,7 @@ class ModelEvaluation:
     def evaluate_model(self) -> EvaluateModelResponse:
         """Evaluates trained model against production model and returns the evaluation result."""
         try:
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
+            test_df = self.artifact_cache.load(self.data_ingestion_artifact.test_file_path, load_dataframe)
             test_df['company_age'] = CURRENT_YEAR - test_df['yr_of_estab']
             X_test, y_test = test_df.drop(TARGET_COLUMN, axis=1), test_df[TARGET_COLUMN]
             y_test = (y_test == 'Certified').astype(int)
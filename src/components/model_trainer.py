@@ -1,76 +1,297 @@
 import sys
+import copy
+import math
+from functools import partial
 
 import numpy as np
-from typing import Tuple
+import pandas as pd
+from typing import List, Optional, Tuple
 
 from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
-from src.models.model_factory import ModelFactory
+from src.models.model_factory import ModelFactory, BestModel
 
 from src.entity.config_entity import ModelTrainerConfig
-from src.entity.artifact_entity import DataTransformationArtifact, ModelTrainerArtifact, ClassificationMetricArtifact
+from src.entity.artifact_entity import (DataTransformationArtifact, DataValidationArtifact, ModelTrainerArtifact,
+                                        ClassificationMetricArtifact)
+from src.entity.artifact_cache import ArtifactCache
 from src.entity.estimator import VisaModel
+from src.entity.s3_estimator import VisaEstimator
 
 from src.exception import CustomException
 from src.logger import logging
 from src.utils import load_numpy_array_data, load_object, save_object
 
 
+# Params that set the number of boosting stages, trees or iterations of warm_start estimators
+WARM_START_STAGE_PARAMS = ("n_estimators", "max_iter")
+
+
 class ModelTrainer:
     def __init__(self, data_transformation_artifact: DataTransformationArtifact,
-                 model_trainer_config: ModelTrainerConfig):
+                 model_trainer_config: ModelTrainerConfig,
+                 data_validation_artifact: Optional[DataValidationArtifact] = None,
+                 artifact_cache: Optional[ArtifactCache] = None):
         self.data_transformation_artifact = data_transformation_artifact
         self.model_trainer_config = model_trainer_config
+        self.data_validation_artifact = data_validation_artifact
+        self.artifact_cache = artifact_cache if artifact_cache is not None else ArtifactCache(in_memory=False)
+
 
+    @staticmethod
+    def get_metric_artifact(y_true, y_pred) -> ClassificationMetricArtifact:
+        return ClassificationMetricArtifact(accuracy=accuracy_score(y_true, y_pred),
+                                            f1_score=f1_score(y_true, y_pred),
+                                            precision=precision_score(y_true, y_pred),
+                                            recall=recall_score(y_true, y_pred))
 
-    def get_model_report(self, train: np.array, test: np.array) -> Tuple[object, object]:
-        """Retrieves the best model report."""
+
+    def get_model_report(self, train: np.array, test: np.array, preprocessor: object = None,
+                         input_test_df: Optional[pd.DataFrame] = None) -> Tuple[object, object]:
+        """Retrieves the best model report; the preprocessor and raw test features are used to time the models."""
         try:
-            model_factory = ModelFactory(model_config_path=self.model_trainer_config.model_config_file_path)
+            model_factory = ModelFactory(
+                model_config_path=self.model_trainer_config.model_config_file_path,
+                checkpoint_file_path=self.model_trainer_config.search_checkpoint_file_path,
+                search_report_file_path=self.model_trainer_config.search_report_file_path
+            )
             logging.info("Retrieved best model object and its report")
 
             X_train, y_train, X_test, y_test = train[:, :-1], train[:, -1], test[:, :-1], test[:, -1]
             best_model_report = model_factory.get_best_model(
-                X=X_train, y=y_train, base_accuracy=self.model_trainer_config.expected_accuracy
+                X=X_train, y=y_train, base_accuracy=self.model_trainer_config.expected_accuracy,
+                preprocessor=preprocessor, benchmark_dataframe=input_test_df
             )
             best_model = best_model_report.best_model
             y_pred = best_model.predict(X_test)
-            accuracy = accuracy_score(y_test, y_pred)
-            f1 = f1_score(y_test, y_pred)
-            precision = precision_score(y_test, y_pred)
-            recall = recall_score(y_test, y_pred)
-            metric_artifact = ClassificationMetricArtifact(accuracy=accuracy,
-                                                           f1_score=f1,
-                                                           precision=precision,
-                                                           recall=recall)
+            metric_artifact = self.get_metric_artifact(y_test, y_pred)
             return best_model_report, metric_artifact
         except Exception as e:
             raise CustomException(e, sys) from e
 
 
+    def get_production_model(self) -> Optional[VisaModel]:
+        """Retrieves the production model from s3 storage, or None when there is none or it cannot be loaded."""
+        try:
+            visa_estimator = VisaEstimator(bucket_name=self.model_trainer_config.bucket_name,
+                                           model_path=self.model_trainer_config.s3_model_key_path)
+            if not visa_estimator.is_model_present(model_path=self.model_trainer_config.s3_model_key_path):
+                return None
+            return visa_estimator.load_model()
+        except Exception as e:
+            # Updating the production model only saves time, so an unreachable registry must not fail the run
+            logging.info(f"Cannot load the production model: {e}")
+            return None
+
+
+    @staticmethod
+    def supports_incremental_training(model: object) -> bool:
+        params = model.get_params() if hasattr(model, "get_params") else {}
+        if "warm_start" in params:
+            return any(param in params for param in WARM_START_STAGE_PARAMS)
+        return hasattr(model, "partial_fit")
+
+
+    @staticmethod
+    def get_stage_param(model: object) -> Optional[str]:
+        """Returns the param that sets the number of stages of a warm_start estimator, or None for other models."""
+        params = model.get_params()
+        if "warm_start" not in params:
+            return None
+        return next(param for param in WARM_START_STAGE_PARAMS if param in params)
+
+
+    def update_model(self, model: object, X, y, max_stages: Optional[int] = None) -> Optional[object]:
+        """
+        Continues training a fitted model on the new rows X and y.
+
+        A warm_start estimator keeps its fitted stages and adds warm_start_stages_ratio more of them, fitted on X,
+        unless that makes more than max_stages stages: then None is returned. Another incremental estimator makes one
+        partial_fit pass over X. The given model is not changed.
+
+        """
+        model = copy.deepcopy(model)
+        stage_param = self.get_stage_param(model)
+        if stage_param is not None:
+            warm_start = model.get_params()["warm_start"]
+            n_stages = model.get_params()[stage_param]
+            n_new_stages = max(1, math.ceil(n_stages * self.model_trainer_config.warm_start_stages_ratio))
+            if max_stages is not None and n_stages + n_new_stages > max_stages:
+                logging.info(f"{n_stages} + {n_new_stages} {stage_param} would exceed {max_stages}")
+                return None
+            model.set_params(warm_start=True, **{stage_param: n_stages + n_new_stages}).fit(X, y)
+            # Later clones of the model are fitted from scratch again
+            model.set_params(warm_start=warm_start)
+            logging.info(f"Added {n_new_stages} to the {n_stages} {stage_param} of {type(model).__name__}, "
+                         f"fitted on {len(X)} new rows")
+        else:
+            model.partial_fit(X, y)
+            logging.info(f"Updated {type(model).__name__} with partial_fit on {len(X)} new rows")
+        return model
+
+
+    def get_serving_violations(self, visa_model: VisaModel, metric_artifact: ClassificationMetricArtifact,
+                               input_test_df: pd.DataFrame) -> List[str]:
+        """
+        Benchmarks an updated model like the winner of a model search, against the limits of the serving_constraints
+        config, and writes the search report with its benchmark.
+
+        Returns:
+            The violated limits; none without a serving_constraints config.
+
+        """
+        try:
+            model_factory = ModelFactory(model_config_path=self.model_trainer_config.model_config_file_path)
+            violations = []
+            if model_factory.serving_constraints_config is not None:
+                trained_model = visa_model.trained_model
+                stage_param = self.get_stage_param(trained_model)
+                best_model = BestModel(model_serial_number="incremental", model=trained_model, best_model=trained_model,
+                                       best_parameters=({stage_param: trained_model.get_params()[stage_param]}
+                                                        if stage_param is not None else {}),
+                                       best_score=metric_artifact.accuracy)
+                benchmark = model_factory.benchmark_best_model(best_model, visa_model.preprocessor, input_test_df)
+                violations = benchmark["violations"]
+            model_factory.write_search_report(self.model_trainer_config.search_report_file_path)
+            return violations
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def get_incremental_model_report(self, train: np.array,
+                                     test: np.array) -> Optional[Tuple[VisaModel, ClassificationMetricArtifact]]:
+        """
+        Updates the production model with the new train rows, or returns None when the model has to be searched from
+        scratch: new rows that are not known, no production model or none that can be loaded, a model that cannot be
+        trained incrementally, data drift, input the production preprocessor cannot encode (e.g. new categories), a
+        score drop of the production model on the test set, a model that would grow beyond warm_start_max_stages_ratio
+        times the stages it was searched with, or an updated model that violates the serving constraints.
+
+        The production preprocessor is kept, so that the update sees the features the model was trained on. The test
+        set holds the same rows in every run, none of which the production model was trained on.
+
+        """
+        try:
+            new_train_row_count = getattr(self.data_transformation_artifact, "new_train_row_count", None)
+            if new_train_row_count is None:
+                logging.info("The new train rows are not known without incremental ingestion: training from scratch")
+                return None
+            if self.data_validation_artifact is not None and self.data_validation_artifact.is_drift_detected:
+                logging.info("Data drift detected: training from scratch")
+                return None
+            production_model = self.get_production_model()
+            if production_model is None:
+                logging.info("No production model: training from scratch")
+                return None
+            if not self.supports_incremental_training(production_model.trained_model):
+                logging.info(f"{type(production_model.trained_model).__name__} cannot be trained incrementally: "
+                             f"training from scratch")
+                return None
+
+            input_train_df = self.artifact_cache.load(self.data_transformation_artifact.input_train_file_path,
+                                                      pd.read_csv)
+            input_test_df = self.artifact_cache.load(self.data_transformation_artifact.input_test_file_path,
+                                                     pd.read_csv)
+            # The new rows are the last ones of the train set
+            new_rows = slice(len(input_train_df) - new_train_row_count, len(input_train_df))
+            try:
+                X_new = production_model.preprocessor.transform(input_train_df.iloc[new_rows])
+                X_test = production_model.preprocessor.transform(input_test_df)
+            except Exception as e:
+                logging.info(f"The production preprocessor cannot encode the new data, training from scratch: {e}")
+                return None
+            y_new, y_test = train[new_rows, -1], test[:, -1]
+
+            production_metric_artifact = self.get_metric_artifact(y_test,
+                                                                  production_model.trained_model.predict(X_test))
+            logging.info(f"Production model on the new test set: {production_metric_artifact}")
+            # Models saved before the metrics were kept only have the expected accuracy as baseline
+            baseline = getattr(production_model, "metric_artifact", None)
+            min_accuracy = self.model_trainer_config.expected_accuracy
+            if baseline is not None:
+                min_accuracy = max(min_accuracy, baseline.accuracy - self.model_trainer_config.max_score_drop)
+            if production_metric_artifact.accuracy < min_accuracy:
+                logging.info(f"Production model accuracy dropped below {min_accuracy}: training from scratch")
+                return None
+
+            # Models saved before the searched stages were kept were searched, not updated
+            stage_param = self.get_stage_param(production_model.trained_model)
+            searched_stages = getattr(production_model, "searched_stages", None)
+            if searched_stages is None and stage_param is not None:
+                searched_stages = production_model.trained_model.get_params()[stage_param]
+            if new_train_row_count == 0:
+                logging.info("No new train rows: keeping the production model")
+                trained_model = production_model.trained_model
+            else:
+                max_stages = (math.floor(searched_stages * self.model_trainer_config.warm_start_max_stages_ratio)
+                              if searched_stages is not None else None)
+                trained_model = self.update_model(production_model.trained_model, X_new, y_new, max_stages=max_stages)
+                if trained_model is None:
+                    logging.info("The updated model would be too large: training from scratch")
+                    return None
+            metric_artifact = self.get_metric_artifact(y_test, trained_model.predict(X_test))
+            visa_model = VisaModel(preprocessor=production_model.preprocessor, trained_model=trained_model)
+            visa_model.searched_stages = searched_stages
+            violations = self.get_serving_violations(visa_model, metric_artifact, input_test_df)
+            if violations:
+                logging.info(f"The updated model violates the serving constraints, training from scratch: {violations}")
+                return None
+            return visa_model, metric_artifact
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
     def initiate_model_trainer(self) -> ModelTrainerArtifact:
         """Initiates the model trainer steps and returns model trainer artifact."""
         logging.info("Entered initiate_model_trainer method of ModelTrainer class")
         try:
-            train_arr = load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_train_file_path)
-            test_arr = load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_test_file_path)
-            best_model_report, metric_artifact = self.get_model_report(train=train_arr, test=test_arr)
-            preprocessor = load_object(file_path=self.data_transformation_artifact.transformed_object_file_path)
-
-            # Set an evaluation threshold that aligns with business goals
-            if best_model_report.best_score < self.model_trainer_config.expected_accuracy:
-                logging.info("No best model found")
-                raise CustomException("No best model found")
-            logging.info("Best model found")
-
-            visa_model = VisaModel(preprocessor=preprocessor,
-                                   trained_model=best_model_report.best_model)
-            logging.info("Created VisaModel object with preprocessor and best model")
-            save_object(self.model_trainer_config.trained_model_file_path, visa_model)
+            # Memory-mapped when read from disk: the feature and target slices, and the search workers, read the
+            # same file pages
+            load_array = partial(load_numpy_array_data, mmap_mode="r")
+            train_arr = self.artifact_cache.load(self.data_transformation_artifact.transformed_train_file_path,
+                                                 load_array)
+            test_arr = self.artifact_cache.load(self.data_transformation_artifact.transformed_test_file_path,
+                                                load_array)
+
+            incremental_model_report = None
+            if self.model_trainer_config.incremental_training:
+                incremental_model_report = self.get_incremental_model_report(train=train_arr, test=test_arr)
+            if incremental_model_report is not None:
+                visa_model, metric_artifact = incremental_model_report
+                logging.info("Updated the production model")
+            else:
+                preprocessor = self.artifact_cache.load(self.data_transformation_artifact.transformed_object_file_path,
+                                                        load_object)
+                # Runs resumed from a checkpoint of an older version have no test input features
+                input_test_file_path = getattr(self.data_transformation_artifact, "input_test_file_path", None)
+                input_test_df = (self.artifact_cache.load(input_test_file_path, pd.read_csv) if input_test_file_path
+                                 else None)
+                best_model_report, metric_artifact = self.get_model_report(train=train_arr, test=test_arr,
+                                                                           preprocessor=preprocessor,
+                                                                           input_test_df=input_test_df)
+
+                # Set an evaluation threshold that aligns with business goals
+                if best_model_report.best_score < self.model_trainer_config.expected_accuracy:
+                    logging.info("No best model found")
+                    raise CustomException("No best model found")
+                logging.info("Best model found")
+
+                visa_model = VisaModel(preprocessor=preprocessor,
+                                       trained_model=best_model_report.best_model)
+                logging.info("Created VisaModel object with preprocessor and best model")
+                stage_param = self.get_stage_param(visa_model.trained_model)
+                # The stages the warm starts of later runs may grow from
+                visa_model.searched_stages = (visa_model.trained_model.get_params()[stage_param]
+                                              if stage_param is not None else None)
+            visa_model.metric_artifact = metric_artifact
+            visa_model.compile_fast_encoder()
+            self.artifact_cache.save(self.model_trainer_config.trained_model_file_path, visa_model, save_object)
             logging.info("Saved the VisaModel object")
 
             model_trainer_artifact = ModelTrainerArtifact(
                 trained_model_file_path=self.model_trainer_config.trained_model_file_path,
-                metric_artifact=metric_artifact
+                metric_artifact=metric_artifact,
+                search_report_file_path=self.model_trainer_config.search_report_file_path,
+                is_incremental=incremental_model_report is not None
             )
             logging.info(f"Model trainer artifact: {model_trainer_artifact}")
             return model_trainer_artifact
@@ -14,6 +14,9 @@ SEED: int = 42
 FILE_NAME: str = "data.csv"
 TRAIN_FILE_NAME: str = "train.csv"
 TEST_FILE_NAME: str = "test.csv"
+# File format of the feature store and train/test artifacts: parquet or feather (npz without pyarrow), npz or csv
+DATAFRAME_FILE_FORMAT: str = os.getenv("DATAFRAME_FILE_FORMAT", "parquet")
+DATAFRAME_FILE_FORMATS = ("parquet", "feather", "npz", "csv")
 
 MODEL_FILE_NAME: str = "model.pkl"
 PREPROCESSOR_FILE_NAME = "preprocessor.pkl"
@@ -30,18 +33,58 @@ CLASS_KEY = "class"
 PARAM_KEY = "params"
 MODEL_SELECTION_KEY = "model_selection"
 SEARCH_PARAM_GRID_KEY = "search_param_grid"
+PARALLEL_SEARCH_KEY = "parallel_search"
+CPU_BUDGET_KEY = "cpu_budget"
+MAX_PARALLEL_MODELS_KEY = "max_parallel_models"
+RANDOM_STATE_KEY = "random_state"
+TRIAL_CACHE_KEY = "trial_cache"
+FILE_PATH_KEY = "file_path"
+MAX_ENTRIES_KEY = "max_entries"
+MAX_SIZE_MB_KEY = "max_size_mb"
+SERVING_CONSTRAINTS_KEY = "serving_constraints"
+BATCH_SIZES_KEY = "batch_sizes"
+REPEAT_KEY = "repeat"
+MAX_P99_LATENCY_MS_KEY = "max_p99_latency_ms"
+MAX_MODEL_SIZE_MB_KEY = "max_model_size_mb"
+LATENCY_PENALTY_PER_MS_KEY = "latency_penalty_per_ms"
 MODEL_CONFIG_FILE_NAME = "model.yaml"
 
 AWS_ACCESS_KEY_ID_ENV_KEY = "AWS_ACCESS_KEY_ID"
 AWS_SECRET_ACCESS_KEY_ENV_KEY = "AWS_SECRET_ACCESS_KEY"
 REGION_NAME = "ap-southeast-1"
 
+# Stages of the train pipeline in the order they run
+TRAIN_PIPELINE_STAGES = ["data_ingestion", "data_validation", "data_transformation",
+                         "model_trainer", "model_evaluation", "model_pusher"]
+# The artifacts of the finished stages of a run, which a resumed run does not repeat
+TRAIN_PIPELINE_CHECKPOINT_FILE_NAME: str = "train_pipeline_checkpoint.pkl"
+
 # Constants for Data Ingestion
 DATA_INGESTION_COLLECTION_NAME: str = "visa_data"
 DATA_INGESTION_DIR_NAME: str = "data_ingestion"
 DATA_INGESTION_FEATURE_STORE_DIR: str = "feature_store"
 DATA_INGESTION_INGESTED_DIR: str = "ingested"
 DATA_INGESTION_TRAIN_TEST_SPLIT_RATIO: float = 0.2
+# The column whose hash puts a row in the train or test set, so that a row stays in its set as the data grows
+DATA_INGESTION_SPLIT_KEY_COLUMN: str = "case_id"
+# Stream the collection to the feature store in batches instead of loading it whole, e.g. DATA_INGESTION_STREAMING=false
+DATA_INGESTION_STREAMING: bool = os.getenv("DATA_INGESTION_STREAMING", "true").lower() == "true"
+# Documents read from the MongoDB cursor and written to the feature store at a time
+DATA_INGESTION_EXPORT_BATCH_SIZE: int = 10000
+# Ranges of DATA_INGESTION_PARTITION_FIELD (an indexed field) read from MongoDB concurrently by the streaming export
+DATA_INGESTION_READ_PARTITIONS: int = int(os.getenv("DATA_INGESTION_READ_PARTITIONS", "1"))
+DATA_INGESTION_PARTITION_FIELD: str = os.getenv("DATA_INGESTION_PARTITION_FIELD", "_id")
+# Append only the documents added since the last run to a feature store kept across runs, e.g.
+# DATA_INGESTION_INCREMENTAL=true. The watermark is the last exported value of DATA_INGESTION_WATERMARK_FIELD.
+DATA_INGESTION_INCREMENTAL: bool = os.getenv("DATA_INGESTION_INCREMENTAL", "false").lower() == "true"
+# Warning: ObjectIds are generated by the clients, so a document can be committed after the watermark was taken with
+# a smaller _id. Documents up to DATA_INGESTION_WATERMARK_OVERLAP_SECONDS older than an ObjectId or date watermark are
+# read again and deduplicated on _id; later ones are missed. A number field must be set increasing by the server.
+DATA_INGESTION_WATERMARK_FIELD: str = os.getenv("DATA_INGESTION_WATERMARK_FIELD", "_id")
+DATA_INGESTION_WATERMARK_OVERLAP_SECONDS: float = float(os.getenv("DATA_INGESTION_WATERMARK_OVERLAP_SECONDS", 300))
+# The persistent feature store holds a train and a test part file per run, of the documents that run added
+DATA_INGESTION_PERSISTENT_FEATURE_STORE_DIR: str = os.path.join(ARTIFACT_DIR, "feature_store")
+DATA_INGESTION_WATERMARK_FILE_NAME: str = "watermark.json"
 
 # Constants for Data Validation
 DATA_VALIDATION_DIR_NAME: str = "data_validation"
@@ -52,6 +95,9 @@ DATA_VALIDATION_DRIFT_REPORT_FILE_NAME: str = "report.yaml"
 DATA_TRANSFORMATION_DIR_NAME: str = "data_transformation"
 DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR: str = "transformed"
 DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR: str = "transformed_object"
+# Input features before preprocessing, as the serving app receives them
+DATA_TRANSFORMATION_INPUT_TRAIN_FILE_NAME: str = "train_input.csv"
+DATA_TRANSFORMATION_INPUT_TEST_FILE_NAME: str = "test_input.csv"
 
 # Constants for Model Trainer
 MODEL_TRAINER_DIR_NAME: str = "model_trainer"
@@ -59,12 +105,63 @@ MODEL_TRAINER_TRAINED_MODEL_DIR: str = "trained_model"
 MODEL_TRAINER_TRAINED_MODEL_NAME: str = "model.pkl"
 MODEL_TRAINER_EXPECTED_SCORE: float = 0.7
 MODEL_TRAINER_MODEL_CONFIG_FILE_PATH: str = os.path.join("config", MODEL_CONFIG_FILE_NAME)
+# The trials of the model search, saved as they finish so that a resumed run does not fit them again
+MODEL_TRAINER_SEARCH_CHECKPOINT_FILE_NAME: str = "search_checkpoint.sqlite"
+# Fit and score time, peak memory and CV scores of every candidate of the model search
+MODEL_TRAINER_SEARCH_REPORT_FILE_NAME: str = "search_report.json"
+# Update the production model with the new data instead of searching from scratch, e.g. MODEL_TRAINER_INCREMENTAL=true.
+# The new train rows are only known with DATA_INGESTION_INCREMENTAL=true.
+MODEL_TRAINER_INCREMENTAL: bool = os.getenv("MODEL_TRAINER_INCREMENTAL", "false").lower() == "true"
+# Search from scratch when the production model scores this much below its training time accuracy on the new test set
+MODEL_TRAINER_INCREMENTAL_MAX_SCORE_DROP: float = 0.02
+# Stages (trees or iterations) added by a warm start, as a fraction of the stages of the production model
+MODEL_TRAINER_WARM_START_STAGES_RATIO: float = 0.1
+# Search from scratch instead of growing a warm started model beyond this multiple of the stages it was searched with
+MODEL_TRAINER_WARM_START_MAX_STAGES_RATIO: float = 1.5
 
 # Constants for Model Evaluation
 MODEL_EVALUATION_CHANGED_THRESHOLD_SCORE: float = 0.02
 MODEL_BUCKET_NAME = "visa-model2025"
 MODEL_PUSHER_S3_KEY = "model-registry"
 
+# Constants for Prediction
+# Change the local model path as needed after model training
+PREDICTION_LOCAL_MODEL_FILE_PATH: str = os.path.join(ARTIFACT_DIR, "02_20_2025_13_04_04", MODEL_TRAINER_DIR_NAME,
+                                                     MODEL_TRAINER_TRAINED_MODEL_DIR, MODEL_FILE_NAME)
+PREDICTION_MODEL_CHECK_INTERVAL_SECONDS: float = 30.0
+# Encode small inputs with the compiled fast encoder instead of the preprocessor, e.g. PREDICTION_FAST_ENCODER=false
+PREDICTION_FAST_ENCODER: bool = os.getenv("PREDICTION_FAST_ENCODER", "true").lower() == "true"
+PREDICTION_FAST_ENCODER_MAX_ROWS: int = 256
+# Cache of predictions for repeated applicant profiles, e.g. PREDICTION_CACHE=true
+PREDICTION_CACHE: bool = os.getenv("PREDICTION_CACHE", "false").lower() == "true"
+PREDICTION_CACHE_MAX_SIZE: int = int(os.getenv("PREDICTION_CACHE_MAX_SIZE", 10000))
+PREDICTION_CACHE_TTL_SECONDS: float = float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", 3600))
+# Evict the least recently used ("lru") or the oldest ("fifo") prediction when the cache is full
+PREDICTION_CACHE_EVICTION: str = os.getenv("PREDICTION_CACHE_EVICTION", "lru")
+# Serve the production model from AWS S3 instead of the local artifact folder, e.g. PREDICTION_USE_S3=true
+PREDICTION_USE_S3: bool = os.getenv("PREDICTION_USE_S3", "false").lower() == "true"
+# Inference runs off the event loop in a "thread" or "process" pool
+PREDICTION_EXECUTOR_TYPE: str = os.getenv("PREDICTION_EXECUTOR_TYPE", "thread")
+PREDICTION_EXECUTOR_WORKERS: int = int(os.getenv("PREDICTION_EXECUTOR_WORKERS", 4))
+PREDICTION_BATCH_CHUNK_SIZE: int = 1000
+PREDICTION_BATCH_MAX_RECORDS: int = 100000
+# Micro-batching of concurrent /predict requests is opt-in, e.g. PREDICTION_MICRO_BATCHING=true
+PREDICTION_MICRO_BATCHING: bool = os.getenv("PREDICTION_MICRO_BATCHING", "false").lower() == "true"
+PREDICTION_MICRO_BATCH_MAX_SIZE: int = int(os.getenv("PREDICTION_MICRO_BATCH_MAX_SIZE", 32))
+PREDICTION_MICRO_BATCH_MAX_WAIT_MS: float = float(os.getenv("PREDICTION_MICRO_BATCH_MAX_WAIT_MS", 5.0))
+
+# Constants for Training Jobs
+TRAINING_JOB_MAX_CONCURRENT: int = int(os.getenv("TRAINING_JOB_MAX_CONCURRENT", 1))
+# Number of CPUs a training job may use, 0 for no limit
+TRAINING_JOB_CPU_BUDGET: int = int(os.getenv("TRAINING_JOB_CPU_BUDGET", 0))
+# Lower the scheduling priority of training jobs so that serving stays responsive
+TRAINING_JOB_NICENESS: int = 10
+
+# Constants for Metrics
+# Per-stage latency histograms and the Server-Timing header of the serving path, e.g. METRICS_ENABLED=false
+METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_NAMESPACE: str = "visa"
+
 # Constants for FastAPI
 APP_HOST = "0.0.0.0"
 APP_PORT = 9696
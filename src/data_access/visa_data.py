@@ -1,30 +1,47 @@
+import os
 import sys
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import numpy as np
 import pandas as pd
 
 from src.constants import DATABASE_NAME
 from src.configuration.mongo_db_connection import MongoDBClient
 from src.exception import CustomException
+from src.logger import logging
 
-from typing import Optional
+from typing import Dict, List, Optional, TextIO, Tuple
+
+import pymongo
+from bson import ObjectId
 
 
 class VisaData:
-    def __init__(self):
+    def __init__(self, mongo_client: Optional[MongoDBClient] = None):
+        """
+        Args:
+            mongo_client: The client to read from, e.g. one connected to a local mongod in tests; defaults to the
+                shared MongoDBClient.
+        """
         try:
             # Connect to MongoDB
-            self.mongo_client = MongoDBClient(database_name=DATABASE_NAME)
+            self.mongo_client = mongo_client if mongo_client is not None else MongoDBClient(database_name=DATABASE_NAME)
         except Exception as e:
             raise CustomException(e, sys) from e
 
 
+    def get_collection(self, collection_name: str, database_name: Optional[str] = None):
+        if database_name is None:
+            return self.mongo_client.database[collection_name]
+        return self.mongo_client.client[database_name][collection_name]
+
+
     def export_collection_as_dataframe(self, collection_name: str, database_name: Optional[str] = None) -> pd.DataFrame:
         """Exports entire MongoDB collection as pandas dataframe."""
         try:
-            if database_name is None:
-                collection = self.mongo_client.database[collection_name]
-            else:
-                collection = self.mongo_client[database_name][collection_name]
+            collection = self.get_collection(collection_name, database_name)
 
             df = pd.DataFrame(list(collection.find()))
             if "_id" in df.columns.to_list():
@@ -33,3 +50,284 @@ class VisaData:
             return df
         except Exception as e:
             raise CustomException(e, sys) from e
+
+
+    @staticmethod
+    def to_typed_dataframe(documents: List[dict], column_types: Dict[str, str]) -> pd.DataFrame:
+        """
+        Builds a dataframe of the schema columns from documents, with "na" as missing values.
+
+        Numeric columns get a nullable dtype, integer when every value is integral, so that missing values do not
+        turn the integers of a batch into floats.
+
+        """
+        df = pd.DataFrame.from_records(documents, columns=list(column_types))
+        for column, column_type in column_types.items():
+            values = df[column].mask(df[column] == "na")
+            if column_type in ("int", "float"):
+                df[column] = pd.to_numeric(values, errors="coerce").convert_dtypes()
+            else:
+                df[column] = values.astype("string")
+        return df
+
+
+    def write_cursor_to_csv(self, cursor, csv_file: TextIO, column_types: Dict[str, str], batch_size: int,
+                            header: bool = True, watermark_field: Optional[str] = None, overlap_start: object = None,
+                            overlap_documents: Optional[list] = None) -> Tuple[int, object]:
+        """
+        Writes the documents of a cursor to an open CSV file in typed batches of batch_size documents.
+
+        With overlap_documents, the [watermark_field value, _id] pair of every written document whose
+        watermark_field value is at least overlap_start is appended to it.
+
+        Returns:
+            The number of written documents and the watermark_field value of the last one, or None.
+
+        """
+        n_documents = 0
+        watermark = None
+        batch = []
+        for document in cursor:
+            batch.append(document)
+            if overlap_documents is not None and document[watermark_field] >= overlap_start:
+                overlap_documents.append([document[watermark_field], document["_id"]])
+            if len(batch) == batch_size:
+                self.to_typed_dataframe(batch, column_types).to_csv(csv_file, index=False,
+                                                                    header=header and n_documents == 0)
+                n_documents += len(batch)
+                watermark = batch[-1].get(watermark_field) if watermark_field else None
+                batch = []
+        if batch or (header and n_documents == 0):
+            self.to_typed_dataframe(batch, column_types).to_csv(csv_file, index=False,
+                                                                header=header and n_documents == 0)
+            n_documents += len(batch)
+            if batch and watermark_field:
+                watermark = batch[-1].get(watermark_field)
+        return n_documents, watermark
+
+
+    @staticmethod
+    def get_partition_bounds(collection, query: dict, partition_field: str, n_partitions: int) -> list:
+        """
+        Splits the partition_field values of the documents matching query into at most n_partitions ranges.
+
+        The smallest and largest values are read through the index of partition_field. ObjectId, number and date
+        ranges are split into equal intervals, so ObjectIds split by creation time; other values are split at
+        quantiles computed by the server with $bucketAuto.
+
+        Returns:
+            The ascending lower bounds of the ranges followed by the largest value, or an empty list when no
+            document matches query.
+
+        """
+        lowest = list(collection.find(query, projection={partition_field: 1})
+                      .sort(partition_field, pymongo.ASCENDING).limit(1))
+        highest = list(collection.find(query, projection={partition_field: 1})
+                       .sort(partition_field, pymongo.DESCENDING).limit(1))
+        if not lowest:
+            return []
+        low, high = lowest[0][partition_field], highest[0][partition_field]
+
+        if isinstance(low, ObjectId) and isinstance(high, ObjectId):
+            start, end = low.generation_time.timestamp(), high.generation_time.timestamp()
+            bounds = [low] + [ObjectId.from_datetime(datetime.fromtimestamp(start + (end - start) * i / n_partitions,
+                                                                             tz=low.generation_time.tzinfo))
+                              for i in range(1, n_partitions)]
+        elif isinstance(low, (int, float, datetime)) and not isinstance(low, bool) and type(low) is type(high):
+            bounds = [low + (high - low) * i / n_partitions if not isinstance(low, int)
+                      else low + (high - low) * i // n_partitions
+                      for i in range(n_partitions)]
+        else:
+            buckets = collection.aggregate([{"$match": query},
+                                            {"$bucketAuto": {"groupBy": f"${partition_field}",
+                                                             "buckets": n_partitions}}])
+            bounds = [bucket["_id"]["min"] for bucket in buckets]
+        # Ranges narrower than the resolution of the split collapse
+        bounds = [bound for i, bound in enumerate(bounds) if i == 0 or bounds[i - 1] < bound]
+        return [bound for bound in bounds if bound <= high] + [high]
+
+
+    def write_query_to_csv(self, collection, query: dict, projection: dict, csv_file: TextIO,
+                           column_types: Dict[str, str], batch_size: int, header: bool = True,
+                           sort_field: Optional[str] = None, watermark_field: Optional[str] = None,
+                           n_partitions: int = 1, partition_field: str = "_id", overlap_start: object = None,
+                           overlap_documents: Optional[list] = None) -> Tuple[int, object]:
+        """
+        Writes the documents matching query to an open CSV file, reading them over n_partitions cursors at a time.
+
+        With several partitions, the partition_field range of the documents is split by get_partition_bounds and
+        every range is read by its own thread into its own temporary file, over the connection pool of the client.
+        The files are then appended to csv_file in range order, each sorted by sort_field (partition_field by
+        default), so the output does not depend on which range finishes first. overlap_start and overlap_documents
+        are passed to write_cursor_to_csv.
+
+        Returns:
+            The number of written documents and the largest watermark_field value of the last documents of the
+            ranges, or None.
+
+        """
+        if n_partitions <= 1:
+            cursor = collection.find(query, projection=projection, batch_size=batch_size)
+            if sort_field is not None:
+                cursor = cursor.sort(sort_field, pymongo.ASCENDING)
+            return self.write_cursor_to_csv(cursor, csv_file, column_types, batch_size, header=header,
+                                            watermark_field=watermark_field, overlap_start=overlap_start,
+                                            overlap_documents=overlap_documents)
+
+        bounds = self.get_partition_bounds(collection, query, partition_field, n_partitions)
+        # The last range includes the largest value
+        range_conditions = [{"$gte": bounds[i], "$lt" if i < len(bounds) - 2 else "$lte": bounds[i + 1]}
+                            for i in range(len(bounds) - 1)]
+        range_queries = [{"$and": [query, {partition_field: condition}]} if query
+                         else {partition_field: condition} for condition in range_conditions]
+        logging.info(f"Reading {len(range_queries)} {partition_field} ranges in parallel")
+
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(csv_file.name))) as tmp_dir_path:
+            def write_range(i: int) -> Tuple[int, object]:
+                cursor = collection.find(range_queries[i], projection=projection, batch_size=batch_size)
+                cursor = cursor.sort(sort_field or partition_field, pymongo.ASCENDING)
+                with open(os.path.join(tmp_dir_path, f"{i}.csv"), "w", newline="") as range_file:
+                    return self.write_cursor_to_csv(cursor, range_file, column_types, batch_size, header=False,
+                                                    watermark_field=watermark_field, overlap_start=overlap_start,
+                                                    overlap_documents=overlap_documents)
+
+            with ThreadPoolExecutor(max_workers=len(range_queries) or 1) as executor:
+                range_results = list(executor.map(write_range, range(len(range_queries))))
+
+            if header:
+                self.to_typed_dataframe([], column_types).to_csv(csv_file, index=False)
+            for i in range(len(range_queries)):
+                with open(os.path.join(tmp_dir_path, f"{i}.csv"), newline="") as range_file:
+                    shutil.copyfileobj(range_file, csv_file)
+        watermarks = [watermark for _, watermark in range_results if watermark is not None]
+        return sum(n_documents for n_documents, _ in range_results), max(watermarks, default=None)
+
+
+    def export_collection_to_csv(self, collection_name: str, file_path: str, column_types: Dict[str, str],
+                                 batch_size: int = 10000, database_name: Optional[str] = None,
+                                 n_partitions: int = 1, partition_field: str = "_id") -> int:
+        """
+        Streams a MongoDB collection to a CSV file, batch_size documents at a time.
+
+        Only the schema columns are sent by the server. Each batch is converted to typed columns and appended to the
+        file, so memory use depends on the batch size, not on the size of the collection. The file is replaced only
+        once the whole collection is written.
+
+        Args:
+            collection_name: The name of the collection to export.
+            file_path: The CSV file to write.
+            column_types: The schema column types ("int", "float" or "category") by column name, in file order.
+            batch_size: The number of documents read from the cursor and written at a time.
+            database_name: The database of the collection; defaults to the database of the client.
+            n_partitions: The number of partition_field ranges read concurrently; see write_query_to_csv.
+            partition_field: The indexed field that splits the collection into ranges.
+
+        Returns:
+            The number of exported documents.
+
+        """
+        try:
+            collection = self.get_collection(collection_name, database_name)
+            projection = {"_id": 0, **{column: 1 for column in column_types}}
+
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            tmp_file_path = f"{file_path}.tmp"
+            with open(tmp_file_path, "w", newline="") as csv_file:
+                n_documents, _ = self.write_query_to_csv(collection, {}, projection, csv_file, column_types,
+                                                         batch_size, n_partitions=n_partitions,
+                                                         partition_field=partition_field)
+            os.replace(tmp_file_path, file_path)
+            logging.info(f"Exported {n_documents} documents of {collection_name} to {file_path}")
+            return n_documents
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    @staticmethod
+    def get_overlap_start(watermark: object, overlap_seconds: float) -> object:
+        """Returns an ObjectId or date watermark moved back by overlap_seconds, or any other watermark as it is."""
+        if isinstance(watermark, ObjectId):
+            return ObjectId.from_datetime(watermark.generation_time - timedelta(seconds=overlap_seconds))
+        if isinstance(watermark, datetime):
+            return watermark - timedelta(seconds=overlap_seconds)
+        return watermark
+
+
+    def export_new_documents_to_csv(self, collection_name: str, file_path: str, column_types: Dict[str, str],
+                                    watermark_field: str = "_id", watermark: object = None, batch_size: int = 10000,
+                                    database_name: Optional[str] = None, n_partitions: int = 1,
+                                    partition_field: str = "_id", overlap_seconds: float = 0.0,
+                                    overlap_documents: Optional[list] = None) -> Tuple[int, object, list]:
+        """
+        Appends the documents of a MongoDB collection that are newer than a watermark to a CSV file.
+
+        Documents are read in watermark_field order, only those above watermark (all of them without a watermark)
+        and up to the largest watermark_field value when the export starts, with the same projection and batches as
+        export_collection_to_csv. The default _id field orders documents by insertion time, through the timestamp of
+        their ObjectId; another field should be indexed and set to an increasing value, such as an insertion date, on
+        every new document.
+
+        ObjectIds are generated by the clients, so a document can be committed after the watermark was taken with a
+        smaller _id. The documents of an ObjectId or date watermark_field are therefore read from overlap_seconds
+        before the watermark, and those already appended, which overlap_documents lists, are skipped. A document
+        committed later than that is missed, as is a late document of a number field, which must be set increasing
+        by the server.
+
+        Args:
+            collection_name: The name of the collection to export.
+            file_path: The CSV file to append to; its header is written when the file is new or empty.
+            column_types: The schema column types ("int", "float" or "category") by column name, in file order.
+            watermark_field: The field that orders the documents by insertion.
+            watermark: The watermark_field value of the last exported document, or None to export every document.
+            batch_size: The number of documents read from the cursor and written at a time.
+            database_name: The database of the collection; defaults to the database of the client.
+            n_partitions: The number of partition_field ranges read concurrently; see write_query_to_csv.
+            partition_field: The indexed field that splits the new documents into ranges.
+            overlap_seconds: How long before the watermark documents are read again.
+            overlap_documents: The [watermark_field value, _id] pairs of the appended documents from overlap_seconds
+                before the watermark, as returned by the previous export.
+
+        Returns:
+            The number of appended documents, the new watermark (the largest watermark_field value read, or the
+            given watermark when there were no new documents) and the overlap_documents of the new watermark.
+
+        """
+        try:
+            collection = self.get_collection(collection_name, database_name)
+            overlap_documents = list(overlap_documents or [])
+            # Documents committed after this snapshot are left to the next export
+            highest = list(collection.find({watermark_field: {"$exists": True}}, projection={watermark_field: 1})
+                           .sort(watermark_field, pymongo.DESCENDING).limit(1))
+            if not highest:
+                logging.info(f"No documents with {watermark_field} in {collection_name}")
+                return 0, watermark, overlap_documents
+            new_watermark = (highest[0][watermark_field] if watermark is None
+                             else max(watermark, highest[0][watermark_field]))
+
+            condition = {"$lte": new_watermark}
+            if watermark is not None:
+                overlap_start = self.get_overlap_start(watermark, overlap_seconds)
+                condition["$gte" if overlap_start < watermark else "$gt"] = overlap_start
+            query = {watermark_field: condition}
+            if overlap_documents:
+                query = {"$and": [query, {"_id": {"$nin": [_id for _, _id in overlap_documents]}}]}
+            new_overlap_start = self.get_overlap_start(new_watermark, overlap_seconds)
+            new_overlap_documents = ([document for document in overlap_documents if document[0] >= new_overlap_start]
+                                     if new_overlap_start < new_watermark else None)
+            projection = {"_id": 0, **{column: 1 for column in column_types}, watermark_field: 1}
+            if new_overlap_documents is not None:
+                projection["_id"] = 1
+
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            header = not os.path.exists(file_path) or os.path.getsize(file_path) == 0
+            with open(file_path, "a", newline="") as csv_file:
+                n_documents, _ = self.write_query_to_csv(collection, query, projection, csv_file, column_types,
+                                                         batch_size, header=header, sort_field=watermark_field,
+                                                         watermark_field=watermark_field, n_partitions=n_partitions,
+                                                         partition_field=partition_field,
+                                                         overlap_start=new_overlap_start,
+                                                         overlap_documents=new_overlap_documents)
+            logging.info(f"Appended {n_documents} new documents of {collection_name} to {file_path}")
+            return n_documents, new_watermark, new_overlap_documents or []
+        except Exception as e:
+            raise CustomException(e, sys) from e
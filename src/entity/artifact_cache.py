@@ -0,0 +1,93 @@
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from pandas import DataFrame
+
+from src.exception import CustomException
+from src.logger import logging
+
+
+class ArtifactCache:
+    """Hands the artifacts of one train pipeline run from stage to stage in memory.
+
+    A saved artifact is kept in memory under its file path and written to that file by a background thread, so the
+    run stays reproducible from its artifact folder without the next stage waiting for the write or reading the
+    file back. Writes run one at a time in the order they were submitted. A saved object must not be changed
+    afterwards; loaded DataFrames are copies, so the stages can add columns to them.
+
+    Without in_memory, as when a stage runs standalone, save writes the file right away and load reads it.
+    """
+    def __init__(self, in_memory: bool = True):
+        self.in_memory = in_memory
+        self._objects: Dict[str, object] = {}
+        self._futures: List[Future] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact-writer") if in_memory else None
+
+
+    def save(self, file_path: str, obj, save_function: Callable[[str, object], None]) -> None:
+        """Keeps obj as the artifact of file_path and writes it there with save_function(file_path, obj)."""
+        if not self.in_memory:
+            save_function(file_path, obj)
+            return
+        with self._lock:
+            self._objects[os.path.abspath(file_path)] = obj
+        self.submit(save_function, file_path, obj)
+
+
+    def load(self, file_path: str, load_function: Callable[[str], object]):
+        """Returns the artifact of file_path saved in this run, or reads it with load_function(file_path)."""
+        with self._lock:
+            obj = self._objects.get(os.path.abspath(file_path))
+        if obj is None:
+            return load_function(file_path)
+        logging.info(f"Loaded {file_path} from memory")
+        return obj.copy() if isinstance(obj, DataFrame) else obj
+
+
+    def submit(self, function: Callable, *args, **kwargs) -> Future:
+        """Runs function in the background after the writes submitted so far, or right away without in_memory."""
+        if not self.in_memory:
+            future = Future()
+            future.set_result(function(*args, **kwargs))
+            return future
+        future = self._executor.submit(function, *args, **kwargs)
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+
+    def flush(self) -> None:
+        """Waits for the background writes and raises the error of the first one that failed."""
+        try:
+            with self._lock:
+                futures, self._futures = self._futures, []
+            errors = [future.exception() for future in futures]
+            errors = [error for error in errors if error is not None]
+            if errors:
+                raise errors[0]
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def close(self, raise_errors: bool = True) -> None:
+        """
+        Flushes the writes, stops the writer thread and forgets the artifacts kept in memory.
+
+        Without raise_errors, as when the run failed already, the error of a failed write is logged instead, so that
+        it does not replace the error of the run.
+
+        """
+        try:
+            self.flush()
+        except Exception as e:
+            if raise_errors:
+                raise
+            logging.info(f"An artifact write of the failed run failed too: {e}")
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+            self._objects.clear()
@@ -1,10 +1,12 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
 class DataIngestionArtifact:
     train_file_path: str
     test_file_path: str
+    new_train_row_count: Optional[int] = None  # The rows added to the end of train by incremental ingestion
 
 
 @dataclass
@@ -12,6 +14,7 @@ class DataValidationArtifact:
     is_validated: bool
     message: str
     drift_report_file_path: str
+    is_drift_detected: bool = False
 
 
 @dataclass
@@ -19,6 +22,9 @@ class DataTransformationArtifact:
     transformed_object_file_path: str
     transformed_train_file_path: str
     transformed_test_file_path: str
+    input_train_file_path: str  # The train features before preprocessing, for incremental training
+    input_test_file_path: str  # The test features before preprocessing, for the serving benchmark
+    new_train_row_count: Optional[int] = None  # The rows at the end of train added by incremental ingestion
 
 
 @dataclass
@@ -33,6 +39,8 @@ class ClassificationMetricArtifact:
 class ModelTrainerArtifact:
     trained_model_file_path: str
     metric_artifact: ClassificationMetricArtifact
+    search_report_file_path: Optional[str]  # The telemetry of every candidate of the model search, if searched
+    is_incremental: bool = False  # Whether the production model was updated instead of searching from scratch
 
 
 @dataclass
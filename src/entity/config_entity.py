@@ -2,7 +2,7 @@ import os
 
 from src.constants import *
 
-from dataclasses import dataclass
+from dataclasses import dataclass, fields, replace
 from datetime import datetime
 
 TIMESTAMP: str = datetime.now().strftime("%m_%d_%Y_%H_%M_%S")
@@ -13,19 +13,51 @@ class TrainingPipelineConfig:
     pipeline_name: str = PIPELINE_NAME
     artifact_dir: str = os.path.join(ARTIFACT_DIR, TIMESTAMP)
     timestamp: str = TIMESTAMP
+    checkpoint_file_path: str = os.path.join(artifact_dir, TRAIN_PIPELINE_CHECKPOINT_FILE_NAME)
 
 
 training_pipeline_config: TrainingPipelineConfig = TrainingPipelineConfig()
 
 
+def with_file_format(file_name: str, file_format: str) -> str:
+    """Returns file_name with the file extension of file_format."""
+    return f"{os.path.splitext(file_name)[0]}.{file_format}"
+
+
+def rebase_artifact_dir(config, artifact_dir: str):
+    """Returns a copy of a config whose paths in the artifact folder of this run point into artifact_dir instead."""
+    changes = {}
+    for config_field in fields(config):
+        value = getattr(config, config_field.name)
+        if isinstance(value, str) and value.startswith(training_pipeline_config.artifact_dir):
+            changes[config_field.name] = artifact_dir + value[len(training_pipeline_config.artifact_dir):]
+    return replace(config, **changes)
+
+
 @dataclass
 class DataIngestionConfig:
     data_ingestion_dir: str = os.path.join(training_pipeline_config.artifact_dir, DATA_INGESTION_DIR_NAME)
-    feature_store_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_FEATURE_STORE_DIR, FILE_NAME)
-    training_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_INGESTED_DIR, TRAIN_FILE_NAME)
-    testing_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_INGESTED_DIR, TEST_FILE_NAME)
+    # Checked when the data ingestion runs, which falls back to npz without pyarrow
+    file_format: str = DATAFRAME_FILE_FORMAT
+    feature_store_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_FEATURE_STORE_DIR,
+                                                with_file_format(FILE_NAME, file_format))
+    training_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_INGESTED_DIR,
+                                           with_file_format(TRAIN_FILE_NAME, file_format))
+    testing_file_path: str = os.path.join(data_ingestion_dir, DATA_INGESTION_INGESTED_DIR,
+                                          with_file_format(TEST_FILE_NAME, file_format))
     train_test_split_ratio: float = DATA_INGESTION_TRAIN_TEST_SPLIT_RATIO
+    split_key_column: str = DATA_INGESTION_SPLIT_KEY_COLUMN
     collection_name: str = DATA_INGESTION_COLLECTION_NAME
+    streaming_export: bool = DATA_INGESTION_STREAMING
+    export_batch_size: int = DATA_INGESTION_EXPORT_BATCH_SIZE
+    read_partitions: int = DATA_INGESTION_READ_PARTITIONS
+    partition_field: str = DATA_INGESTION_PARTITION_FIELD
+    incremental_ingestion: bool = DATA_INGESTION_INCREMENTAL
+    watermark_field: str = DATA_INGESTION_WATERMARK_FIELD
+    watermark_overlap_seconds: float = DATA_INGESTION_WATERMARK_OVERLAP_SECONDS
+    persistent_feature_store_dir: str = DATA_INGESTION_PERSISTENT_FEATURE_STORE_DIR
+    watermark_file_path: str = os.path.join(DATA_INGESTION_PERSISTENT_FEATURE_STORE_DIR,
+                                            DATA_INGESTION_WATERMARK_FILE_NAME)
 
 
 @dataclass
@@ -48,6 +80,12 @@ class DataTransformationConfig:
     transformed_object_file_path: str = os.path.join(data_transformation_dir,
                                                      DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR,
                                                      PREPROCESSOR_FILE_NAME)
+    input_train_file_path: str = os.path.join(data_transformation_dir,
+                                              DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
+                                              DATA_TRANSFORMATION_INPUT_TRAIN_FILE_NAME)
+    input_test_file_path: str = os.path.join(data_transformation_dir,
+                                             DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
+                                             DATA_TRANSFORMATION_INPUT_TEST_FILE_NAME)
 
 
 @dataclass
@@ -56,6 +94,14 @@ class ModelTrainerConfig:
     trained_model_file_path: str = os.path.join(model_trainer_dir, MODEL_TRAINER_TRAINED_MODEL_DIR, MODEL_FILE_NAME)
     expected_accuracy: float = MODEL_TRAINER_EXPECTED_SCORE
     model_config_file_path: str = MODEL_TRAINER_MODEL_CONFIG_FILE_PATH
+    search_checkpoint_file_path: str = os.path.join(model_trainer_dir, MODEL_TRAINER_SEARCH_CHECKPOINT_FILE_NAME)
+    search_report_file_path: str = os.path.join(model_trainer_dir, MODEL_TRAINER_SEARCH_REPORT_FILE_NAME)
+    incremental_training: bool = MODEL_TRAINER_INCREMENTAL
+    max_score_drop: float = MODEL_TRAINER_INCREMENTAL_MAX_SCORE_DROP
+    warm_start_stages_ratio: float = MODEL_TRAINER_WARM_START_STAGES_RATIO
+    warm_start_max_stages_ratio: float = MODEL_TRAINER_WARM_START_MAX_STAGES_RATIO
+    bucket_name: str = MODEL_BUCKET_NAME
+    s3_model_key_path: str = MODEL_FILE_NAME
 
 
 @dataclass
@@ -75,3 +121,22 @@ class ModelPusherConfig:
 class VisaPredictonConfig:
     model_file_path: str = MODEL_FILE_NAME
     model_bucket_name: str = MODEL_BUCKET_NAME
+    local_model_file_path: str = PREDICTION_LOCAL_MODEL_FILE_PATH
+    model_check_interval: float = PREDICTION_MODEL_CHECK_INTERVAL_SECONDS
+    use_s3: bool = PREDICTION_USE_S3
+    fast_encoder: bool = PREDICTION_FAST_ENCODER
+    prediction_cache: bool = PREDICTION_CACHE
+    executor_type: str = PREDICTION_EXECUTOR_TYPE
+    executor_workers: int = PREDICTION_EXECUTOR_WORKERS
+    batch_chunk_size: int = PREDICTION_BATCH_CHUNK_SIZE
+    batch_max_records: int = PREDICTION_BATCH_MAX_RECORDS
+    micro_batching: bool = PREDICTION_MICRO_BATCHING
+    micro_batch_max_size: int = PREDICTION_MICRO_BATCH_MAX_SIZE
+    micro_batch_max_wait_ms: float = PREDICTION_MICRO_BATCH_MAX_WAIT_MS
+
+
+@dataclass
+class TrainingJobConfig:
+    max_concurrent_jobs: int = TRAINING_JOB_MAX_CONCURRENT
+    cpu_budget: int = TRAINING_JOB_CPU_BUDGET
+    niceness: int = TRAINING_JOB_NICENESS
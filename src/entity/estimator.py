@@ -1,29 +1,92 @@
 import sys
+from typing import TYPE_CHECKING, Dict, Mapping, Optional, Sequence, Set
 
 from pandas import DataFrame
-from sklearn.pipeline import Pipeline
 
 from src.exception import CustomException
 from src.logger import logging
+from src.metrics import measure
+from src.constants import PREDICTION_FAST_ENCODER_MAX_ROWS
+
+if TYPE_CHECKING:
+    # scikit-learn is imported when a model is unpickled or compiled, not when this module is imported
+    from sklearn.pipeline import Pipeline
+    from src.entity.fast_encoder import CompiledFeatureEncoder
+    from src.entity.artifact_entity import ClassificationMetricArtifact
 
 
 class VisaModel:
-    def __init__(self, preprocessor: Pipeline, trained_model: object):
+    def __init__(self, preprocessor: "Pipeline", trained_model: object,
+                 fast_encoder: Optional["CompiledFeatureEncoder"] = None,
+                 metric_artifact: Optional["ClassificationMetricArtifact"] = None):
         self.preprocessor = preprocessor
         self.trained_model = trained_model
+        self.fast_encoder = fast_encoder
+        # Test set metrics at training time, the baseline of incremental training
+        self.metric_artifact = metric_artifact
 
 
     def __repr__(self):
         return (f"{self.__class__.__name__}()")
 
 
+    def get_known_categories(self) -> Dict[str, Set[str]]:
+        """Returns the categories seen by the fitted encoders that reject unknown values, keyed by column name."""
+        known_categories = {}
+        for _, transformer, columns in getattr(self.preprocessor, "transformers_", []):
+            categories = getattr(transformer, "categories_", None)
+            if categories is None or getattr(transformer, "handle_unknown", "error") != "error":
+                continue
+            for column, column_categories in zip(columns, categories):
+                known_categories[column] = set(column_categories)
+        return known_categories
+
+
+    def compile_fast_encoder(self) -> bool:
+        """Compiles the preprocessor into the encoder used for small inputs and returns whether it succeeded."""
+        try:
+            from src.entity.fast_encoder import CompiledFeatureEncoder
+            self.fast_encoder = CompiledFeatureEncoder.from_preprocessor(self.preprocessor)
+            logging.info("Compiled the fast feature encoder")
+            return True
+        except Exception as e:
+            self.fast_encoder = None
+            logging.info(f"Fast feature encoder is not available, using the preprocessor: {e}")
+            return False
+
+
+    def transform(self, dataframe: DataFrame):
+        """Transforms raw input with the fast encoder when it is available and the input is small."""
+        # Models saved before the fast encoder existed do not have the attribute
+        fast_encoder = getattr(self, "fast_encoder", None)
+        if fast_encoder is not None and len(dataframe) <= PREDICTION_FAST_ENCODER_MAX_ROWS:
+            return fast_encoder.transform(dataframe)
+        return self.preprocessor.transform(dataframe)
+
+
+    def predict_dict(self, visa_dict: Mapping[str, Sequence]):
+        """Predicts from raw values keyed by column name, without building a DataFrame when possible."""
+        try:
+            fast_encoder = getattr(self, "fast_encoder", None)
+            if fast_encoder is None:
+                return self.predict(DataFrame(visa_dict))
+            with measure("preprocess"):
+                transformed_features = fast_encoder.transform_columns(visa_dict)
+            with measure("predict"):
+                return self.trained_model.predict(transformed_features)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
     def predict(self, dataframe: DataFrame) -> DataFrame:
         """Preprocess raw input and predict using the transformed features."""
         logging.info("Entered predict method of VisaModel class")
         try:
             logging.info("Using the trained model to get predictions")
-            transformed_features = self.preprocessor.transform(dataframe)
+            with measure("preprocess"):
+                transformed_features = self.transform(dataframe)
             logging.info("Used the trained model to get predictions")
-            return self.trained_model.predict(transformed_features)
+            with measure("predict"):
+                return self.trained_model.predict(transformed_features)
         except Exception as e:
             raise CustomException(e, sys) from e
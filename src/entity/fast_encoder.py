@@ -0,0 +1,205 @@
+import sys
+from typing import Dict, List, Mapping, Sequence, Tuple
+
+import numpy as np
+from pandas import DataFrame
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, PowerTransformer, StandardScaler
+
+from src.exception import CustomException
+
+
+# Numeric values used, together with every known category, to check a compiled encoder against its preprocessor
+PROBE_NUMERIC_VALUES = (-1.0, 0.0, 0.5, 1.0, 3.0, 17.0, 250.0, 1234.5, 80000.0, 2500000.0)
+
+
+class CompiledFeatureEncoder:
+    """Reproduces the transform of a fitted ColumnTransformer without pandas or scikit-learn input validation.
+
+    Categories of the OneHotEncoder and OrdinalEncoder steps are compiled to lookup tables, and the
+    PowerTransformer (Yeo-Johnson) and StandardScaler steps to their fitted parameters. Raw column values are
+    written straight into a float64 array with the same layout as the preprocessor output. Only the transformers
+    created by DataTransformation.get_data_transformer_object are supported; from_preprocessor raises ValueError
+    for anything else, or when the compiled output is not identical to the preprocessor output.
+    """
+    def __init__(self, n_features: int, input_columns: List[str],
+                 one_hot_steps: List[Tuple[str, Dict[object, int]]],
+                 ordinal_steps: List[Tuple[str, int, Dict[object, float]]],
+                 numeric_steps: List[Tuple[List[str], slice, List[tuple]]]):
+        self.n_features = n_features
+        self.input_columns = input_columns
+        self.one_hot_steps = one_hot_steps
+        self.ordinal_steps = ordinal_steps
+        self.numeric_steps = numeric_steps
+
+
+    @classmethod
+    def from_preprocessor(cls, preprocessor: ColumnTransformer) -> "CompiledFeatureEncoder":
+        """Compiles a fitted ColumnTransformer and verifies that the result matches it exactly."""
+        if not isinstance(preprocessor, ColumnTransformer) or not hasattr(preprocessor, "transformers_"):
+            raise ValueError("Expected a fitted ColumnTransformer")
+        one_hot_steps, ordinal_steps, numeric_steps = [], [], []
+        input_columns = set()
+        for name, transformer, columns in preprocessor.transformers_:
+            if transformer == "drop":
+                continue
+            if isinstance(transformer, str) or isinstance(columns, str) or len(columns) == 0:
+                raise ValueError(f"Unsupported transformer {name}: {transformer}")
+            columns = list(columns)
+            output_slice = preprocessor.output_indices_[name]
+            input_columns.update(columns)
+            if isinstance(transformer, Pipeline) and len(transformer.steps) == 1:
+                transformer = transformer.steps[0][1]
+            if isinstance(transformer, OneHotEncoder):
+                one_hot_steps.extend(cls._compile_one_hot_encoder(transformer, columns, output_slice))
+            elif isinstance(transformer, OrdinalEncoder):
+                ordinal_steps.extend(cls._compile_ordinal_encoder(transformer, columns, output_slice))
+            elif isinstance(transformer, PowerTransformer):
+                numeric_steps.append((columns, output_slice, cls._compile_power_transformer(transformer)))
+            elif isinstance(transformer, StandardScaler):
+                numeric_steps.append((columns, output_slice, [cls._compile_standard_scaler(transformer)]))
+            else:
+                raise ValueError(f"Unsupported transformer {name}: {type(transformer).__name__}")
+
+        n_features = max(output_slice.stop for output_slice in preprocessor.output_indices_.values())
+        fast_encoder = cls(n_features=n_features,
+                           input_columns=sorted(input_columns),
+                           one_hot_steps=one_hot_steps,
+                           ordinal_steps=ordinal_steps,
+                           numeric_steps=numeric_steps)
+        fast_encoder.verify(preprocessor)
+        return fast_encoder
+
+
+    @staticmethod
+    def _compile_one_hot_encoder(encoder: OneHotEncoder, columns: List[str], output_slice: slice) -> list:
+        if (encoder.handle_unknown != "error" or encoder.drop_idx_ is not None
+                or getattr(encoder, "_infrequent_enabled", False)):
+            raise ValueError("Only OneHotEncoder without drop, infrequent categories or ignored unknowns is supported")
+        steps, offset = [], output_slice.start
+        for column, categories in zip(columns, encoder.categories_):
+            CompiledFeatureEncoder._check_categories(categories)
+            steps.append((column, {category: offset + i for i, category in enumerate(categories)}))
+            offset += len(categories)
+        return steps
+
+
+    @staticmethod
+    def _compile_ordinal_encoder(encoder: OrdinalEncoder, columns: List[str], output_slice: slice) -> list:
+        if encoder.handle_unknown != "error" or getattr(encoder, "_infrequent_enabled", False):
+            raise ValueError("Only OrdinalEncoder without infrequent categories or unknown values is supported")
+        steps = []
+        for i, (column, categories) in enumerate(zip(columns, encoder.categories_)):
+            CompiledFeatureEncoder._check_categories(categories)
+            codes = {category: float(code) for code, category in enumerate(categories)}
+            steps.append((column, output_slice.start + i, codes))
+        return steps
+
+
+    @staticmethod
+    def _compile_power_transformer(transformer: PowerTransformer) -> List[tuple]:
+        if transformer.method != "yeo-johnson":
+            raise ValueError(f"Unsupported PowerTransformer method: {transformer.method}")
+        operations = [("yeo-johnson", np.asarray(transformer.lambdas_, dtype=np.float64))]
+        if transformer.standardize:
+            operations.append(CompiledFeatureEncoder._compile_standard_scaler(transformer._scaler))
+        return operations
+
+
+    @staticmethod
+    def _compile_standard_scaler(scaler: StandardScaler) -> tuple:
+        mean = np.asarray(scaler.mean_, dtype=np.float64) if scaler.with_mean else None
+        scale = np.asarray(scaler.scale_, dtype=np.float64) if scaler.with_std else None
+        return "standard", mean, scale
+
+
+    @staticmethod
+    def _check_categories(categories) -> None:
+        for category in categories:
+            if isinstance(category, float) and np.isnan(category):
+                raise ValueError("Categories with missing values are not supported")
+
+
+    def transform(self, dataframe: DataFrame) -> np.ndarray:
+        return self.transform_columns({column: dataframe[column].to_numpy() for column in self.input_columns})
+
+
+    def transform_columns(self, columns: Mapping[str, Sequence]) -> np.ndarray:
+        """Encodes raw values given as a mapping of column name to the sequence of its values, one per row."""
+        n_rows = len(columns[self.input_columns[0]])
+        features = np.zeros((n_rows, self.n_features), dtype=np.float64)
+        for column, lookup in self.one_hot_steps:
+            for row, value in enumerate(columns[column]):
+                index = lookup.get(value)
+                if index is None:
+                    raise ValueError(f"Found unknown category {value!r} in column {column}")
+                features[row, index] = 1.0
+        for column, index, codes in self.ordinal_steps:
+            for row, value in enumerate(columns[column]):
+                code = codes.get(value)
+                if code is None:
+                    raise ValueError(f"Found unknown category {value!r} in column {column}")
+                features[row, index] = code
+        for step_columns, output_slice, operations in self.numeric_steps:
+            values = np.empty((n_rows, len(step_columns)), dtype=np.float64)
+            for i, column in enumerate(step_columns):
+                values[:, i] = columns[column]
+            for operation in operations:
+                if operation[0] == "yeo-johnson":
+                    for i, lmbda in enumerate(operation[1]):
+                        values[:, i] = CompiledFeatureEncoder.yeo_johnson(values[:, i], lmbda)
+                else:
+                    _, mean, scale = operation
+                    if mean is not None:
+                        values -= mean
+                    if scale is not None:
+                        values /= scale
+            features[:, output_slice] = values
+        return features
+
+
+    @staticmethod
+    def yeo_johnson(x: np.ndarray, lmbda: float) -> np.ndarray:
+        """Yeo-Johnson transform using the same operations as scipy.stats.yeojohnson."""
+        eps = np.finfo(np.float64).eps
+        out = np.zeros_like(x, dtype=np.float64)
+        pos = x >= 0
+        if abs(lmbda) < eps:
+            out[pos] = np.log1p(x[pos])
+        else:
+            out[pos] = np.expm1(lmbda * np.log1p(x[pos])) / lmbda
+        if abs(lmbda - 2) > eps:
+            out[~pos] = -np.expm1((2 - lmbda) * np.log1p(-x[~pos])) / (2 - lmbda)
+        else:
+            out[~pos] = -np.log1p(-x[~pos])
+        return out
+
+
+    def verify(self, preprocessor: ColumnTransformer) -> None:
+        """Raises ValueError unless the compiled encoder reproduces preprocessor.transform bit for bit."""
+        try:
+            probe_df = self.get_probe_dataframe(preprocessor)
+            expected = preprocessor.transform(probe_df)
+            if hasattr(expected, "toarray"):
+                expected = expected.toarray()
+            actual = self.transform(probe_df)
+            if actual.shape != expected.shape or not np.array_equal(actual, expected, equal_nan=True):
+                raise ValueError("Compiled encoder output does not match the preprocessor output")
+        except ValueError:
+            raise
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def get_probe_dataframe(self, preprocessor: ColumnTransformer) -> DataFrame:
+        """Builds rows that cover every known category and a spread of numeric values."""
+        categorical_values = {column: list(lookup) for column, lookup in self.one_hot_steps}
+        categorical_values.update({column: list(codes) for column, _, codes in self.ordinal_steps})
+        n_rows = max([len(PROBE_NUMERIC_VALUES)] + [len(values) for values in categorical_values.values()])
+        probe = {}
+        for j, column in enumerate(getattr(preprocessor, "feature_names_in_", self.input_columns)):
+            values = categorical_values.get(column, PROBE_NUMERIC_VALUES)
+            # Shift each column differently so that rows mix values across columns
+            probe[column] = [values[(row + j) % len(values)] for row in range(n_rows)]
+        return DataFrame(probe)
@@ -0,0 +1,215 @@
+import os
+import sys
+import time
+import threading
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Dict, Hashable, Optional, Tuple
+
+from src.exception import CustomException
+from src.logger import logging
+from src.metrics import measure
+from src.utils import load_object
+from src.constants import PREDICTION_MODEL_CHECK_INTERVAL_SECONDS, PREDICTION_FAST_ENCODER
+
+if TYPE_CHECKING:
+    from src.entity.estimator import VisaModel
+    from src.entity.s3_estimator import VisaEstimator
+
+
+class ModelSource(ABC):
+    """Describes where a VisaModel artifact lives and how to load it.
+
+    Subclasses provide a cheap version check so that callers can tell whether the artifact changed
+    without paying for a full deserialization.
+    """
+    @property
+    @abstractmethod
+    def key(self) -> str:
+        ...
+
+
+    @abstractmethod
+    def get_version(self) -> Hashable:
+        ...
+
+
+    @abstractmethod
+    def load(self) -> "VisaModel":
+        ...
+
+
+class LocalModelSource(ModelSource):
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+
+    @property
+    def key(self) -> str:
+        return f"file://{os.path.abspath(self.file_path)}"
+
+
+    def get_version(self) -> Tuple[int, int]:
+        """Returns the modification time and size of the model file."""
+        try:
+            stat = os.stat(self.file_path)
+            return stat.st_mtime_ns, stat.st_size
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def load(self) -> "VisaModel":
+        return load_object(file_path=self.file_path)
+
+
+class S3ModelSource(ModelSource):
+    def __init__(self, bucket_name: str, model_path: str):
+        self.bucket_name = bucket_name
+        self.model_path = model_path
+        self._visa_estimator: Optional["VisaEstimator"] = None
+
+
+    @property
+    def key(self) -> str:
+        return f"s3://{self.bucket_name}/{self.model_path}"
+
+
+    @property
+    def visa_estimator(self) -> "VisaEstimator":
+        # Import boto3 and connect to s3 only when the model is actually needed
+        if self._visa_estimator is None:
+            from src.entity.s3_estimator import VisaEstimator
+            self._visa_estimator = VisaEstimator(bucket_name=self.bucket_name, model_path=self.model_path)
+        return self._visa_estimator
+
+
+    def get_version(self) -> str:
+        """Returns the ETag of the model object in s3 bucket."""
+        return self.visa_estimator.get_model_version()
+
+
+    def load(self) -> "VisaModel":
+        return self.visa_estimator.load_model()
+
+
+class ModelCache:
+    """Keeps a single deserialized VisaModel in memory and swaps it when the artifact changes.
+
+    The first call to get_model loads the model synchronously; concurrent callers wait on the same load instead
+    of starting their own. Afterwards, at most once per check_interval seconds, a background thread compares
+    the artifact version and, if it changed, loads the new model and replaces the old one in a single assignment.
+    Callers keep being served by the old model until the swap happens. With fast_encoder, every loaded model gets
+    a compiled feature encoder before it is swapped in; without it, the fast encoder of the model is disabled.
+    """
+    def __init__(self, model_source: ModelSource, check_interval: float = PREDICTION_MODEL_CHECK_INTERVAL_SECONDS,
+                 fast_encoder: bool = PREDICTION_FAST_ENCODER):
+        self.model_source = model_source
+        self.check_interval = check_interval
+        self.fast_encoder = fast_encoder
+        self._state: Tuple[Optional["VisaModel"], Optional[Hashable]] = (None, None)
+        self._load_lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._reloading = False
+        self._last_check = time.monotonic()
+
+
+    @property
+    def model(self) -> Optional["VisaModel"]:
+        return self._state[0]
+
+
+    @property
+    def version(self) -> Optional[Hashable]:
+        return self._state[1]
+
+
+    def get_model(self) -> "VisaModel":
+        """Returns the cached model, loading it on first use and scheduling a version check when due."""
+        return self.get_model_and_version()[0]
+
+
+    def get_model_and_version(self) -> Tuple["VisaModel", Hashable]:
+        """Like get_model, but also returns the version of that model, read together with it across reloads."""
+        try:
+            state = self._state
+            if state[0] is None:
+                return self._load_initial_model()
+            self._schedule_version_check()
+            return state
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def reload(self) -> "VisaModel":
+        """Loads the model again regardless of its version and swaps it in."""
+        try:
+            with self._load_lock:
+                self._load_and_swap()
+            return self._state[0]
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def _load_initial_model(self) -> Tuple["VisaModel", Hashable]:
+        with self._load_lock:
+            # Another caller may have finished loading while this one was waiting for the lock
+            if self._state[0] is None:
+                self._load_and_swap()
+            return self._state
+
+
+    def _load_and_swap(self) -> None:
+        # Read the version before loading so that a change during the load is picked up by the next check
+        version = self.model_source.get_version()
+        logging.info(f"Loading model from {self.model_source.key} (version: {version})")
+        start = time.perf_counter()
+        with measure("load_model"):
+            model = self.model_source.load()
+            if not self.fast_encoder:
+                model.fast_encoder = None
+            elif getattr(model, "fast_encoder", None) is None:
+                model.compile_fast_encoder()
+        self._state = (model, version)
+        self._last_check = time.monotonic()
+        logging.info(f"Loaded model from {self.model_source.key} in {time.perf_counter() - start:.3f}s")
+
+
+    def _schedule_version_check(self) -> None:
+        if time.monotonic() - self._last_check < self.check_interval:
+            return
+        with self._check_lock:
+            if self._reloading or time.monotonic() - self._last_check < self.check_interval:
+                return
+            self._reloading = True
+            self._last_check = time.monotonic()
+        threading.Thread(target=self._reload_if_changed, name="model-cache-reload", daemon=True).start()
+
+
+    def _reload_if_changed(self) -> None:
+        try:
+            if self.model_source.get_version() != self._state[1]:
+                with self._load_lock:
+                    self._load_and_swap()
+        except Exception as e:
+            # Keep serving the current model; the next check will try again
+            logging.info(f"Failed to reload model from {self.model_source.key}: {e}")
+        finally:
+            self._reloading = False
+
+
+_model_caches: Dict[str, ModelCache] = {}
+_model_caches_lock = threading.Lock()
+
+
+def get_model_cache(model_source: ModelSource,
+                    check_interval: float = PREDICTION_MODEL_CHECK_INTERVAL_SECONDS,
+                    fast_encoder: bool = PREDICTION_FAST_ENCODER) -> ModelCache:
+    """Returns the process-wide ModelCache for model_source, creating it on first use."""
+    model_cache = _model_caches.get(model_source.key)
+    if model_cache is None:
+        with _model_caches_lock:
+            model_cache = _model_caches.get(model_source.key)
+            if model_cache is None:
+                model_cache = ModelCache(model_source=model_source, check_interval=check_interval,
+                                         fast_encoder=fast_encoder)
+                _model_caches[model_source.key] = model_cache
+    return model_cache
@@ -27,6 +27,14 @@ class VisaEstimator:
             return False
 
 
+    def get_model_version(self) -> str:
+        """Returns the ETag of the model in s3 bucket, which changes whenever the model is re-uploaded."""
+        try:
+            return self.s3.get_object_etag(bucket_name=self.bucket_name, s3_key=self.model_path)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
     def load_model(self) -> VisaModel:
         """Loads the model from the model_path."""
         return self.s3.load_model(self.model_path, bucket_name=self.bucket_name)
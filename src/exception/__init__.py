@@ -18,3 +18,15 @@ class CustomException(Exception):
 
     def __str__(self):
         return self.error_message
+
+
+    def __reduce__(self):
+        # Rebuild from the formatted message when the exception is sent to another process
+        return _rebuild_custom_exception, (self.error_message,)
+
+
+def _rebuild_custom_exception(error_message: str) -> CustomException:
+    exception = CustomException.__new__(CustomException)
+    Exception.__init__(exception, error_message)
+    exception.error_message = error_message
+    return exception
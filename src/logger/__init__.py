@@ -1,15 +1,184 @@
 import logging
+import logging.handlers
 import os
+import copy
+import json
+import time
+import queue
+import atexit
+import threading
 from datetime import datetime
+from typing import Dict, Optional
 
 
 LOG_FOLDER = "logs"
 os.makedirs(LOG_FOLDER, exist_ok=True)
 LOG_FILE = f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
 LOG_FILE_PATH = os.path.join(os.getcwd(), LOG_FOLDER, LOG_FILE)
+LOG_FORMAT_STRING = "[ %(asctime)s ] %(lineno)d %(name)s - %(levelname)s - %(message)s"
 
-logging.basicConfig(
-    filename=LOG_FILE_PATH,
-    format="[ %(asctime)s ] %(lineno)d %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-)
+# Write log records from a background thread so that callers never wait on the log file, e.g. LOG_QUEUE=false
+LOG_QUEUE: bool = os.getenv("LOG_QUEUE", "true").lower() == "true"
+# "text" or "json" (one JSON object per line)
+LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text").lower()
+# Fraction of INFO and DEBUG records kept per call site, by source, e.g. "src.pipeline.predict=0.01,src.utils=0.1"
+LOG_SAMPLE_RATES: str = os.getenv("LOG_SAMPLE_RATES", "")
+# Maximum INFO and DEBUG records per second per call site, by source, e.g. "src.entity.estimator=5"
+LOG_RATE_LIMITS: str = os.getenv("LOG_RATE_LIMITS", "")
+
+
+def parse_source_settings(value: str) -> Dict[str, float]:
+    """Parses "source=number,source=number" into a dictionary."""
+    settings = {}
+    for item in value.split(","):
+        if item.strip():
+            source, number = item.split("=")
+            settings[source.strip()] = float(number)
+    return settings
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as a single-line JSON object."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+            "process": record.process,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Puts records on a queue for the background writer.
+
+    The message and traceback are rendered in the logging thread, since its arguments may change afterwards. The
+    layout is left to the formatter of the writer.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only part of the INFO and DEBUG records of hot call sites; WARNING and above always pass.
+
+    A record's source is its logger name, or the dotted path of the module that logged it (for example
+    "src.pipeline.predict"), since most modules log through the root logger. Rules apply to a source and every
+    source below it. With a sample rate r, one record in every 1/r is kept per call site; with a rate limit n, at
+    most n records per second are kept per call site.
+    """
+    def __init__(self, sample_rates: Optional[Dict[str, float]] = None,
+                 rate_limits: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+        self.rate_limits = rate_limits or {}
+        self._sources: Dict[str, str] = {}
+        # Per call site: records seen, and the start and count of the current one second window
+        self._call_sites: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+
+    def get_source(self, record: logging.LogRecord) -> str:
+        if record.name != "root":
+            return record.name
+        source = self._sources.get(record.pathname)
+        if source is None:
+            path = os.path.splitext(os.path.relpath(record.pathname))[0]
+            source = path.replace(os.sep, ".")
+            if source.endswith(".__init__"):
+                source = source[:-len(".__init__")]
+            self._sources[record.pathname] = source
+        return source
+
+
+    @staticmethod
+    def find_rule(rules: Dict[str, float], source: str) -> Optional[float]:
+        while source:
+            if source in rules:
+                return rules[source]
+            source = source.rpartition(".")[0]
+        return None
+
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not (self.sample_rates or self.rate_limits):
+            return True
+        source = self.get_source(record)
+        sample_rate = self.find_rule(self.sample_rates, source)
+        rate_limit = self.find_rule(self.rate_limits, source)
+        if sample_rate is None and rate_limit is None:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            call_site = self._call_sites.setdefault((record.pathname, record.lineno), [0, now, 0])
+            call_site[0] += 1
+            if sample_rate is not None:
+                if sample_rate <= 0 or (call_site[0] - 1) % max(1, round(1 / sample_rate)):
+                    return False
+            if rate_limit is not None:
+                if now - call_site[1] >= 1.0:
+                    call_site[1], call_site[2] = now, 0
+                if call_site[2] >= rate_limit:
+                    return False
+                call_site[2] += 1
+            return True
+
+
+def _create_file_handler() -> logging.Handler:
+    file_handler = logging.FileHandler(LOG_FILE_PATH)
+    file_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(LOG_FORMAT_STRING))
+    return file_handler
+
+
+_queue_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _start_queue_listener(log_queue: queue.SimpleQueue, file_handler: logging.Handler) -> None:
+    global _queue_listener
+    _queue_listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _queue_listener.start()
+
+
+def stop_queue_listener() -> None:
+    """Writes the queued records and stops the background writer thread."""
+    global _queue_listener
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+
+
+def configure_logging() -> None:
+    file_handler = _create_file_handler()
+    if LOG_QUEUE:
+        log_queue = queue.SimpleQueue()
+        handler = LogQueueHandler(log_queue)
+        _start_queue_listener(log_queue, file_handler)
+        atexit.register(stop_queue_listener)
+        # A forked child does not inherit the writer thread; start a new one on the inherited queue
+        os.register_at_fork(after_in_child=lambda: _start_queue_listener(log_queue, file_handler))
+    else:
+        handler = file_handler
+    # Sample before the record is queued so that dropped records cost as little as possible
+    handler.addFilter(SamplingFilter(sample_rates=parse_source_settings(LOG_SAMPLE_RATES),
+                                     rate_limits=parse_source_settings(LOG_RATE_LIMITS)))
+    logging.basicConfig(handlers=[handler], level=logging.INFO)
+
+
+configure_logging()
@@ -0,0 +1,181 @@
+import time
+import bisect
+import threading
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from src.constants import METRICS_ENABLED, METRICS_NAMESPACE
+
+
+# Upper bounds of the latency buckets in seconds: 10us to ~42s, two buckets per doubling
+LATENCY_BUCKETS: Tuple[float, ...] = tuple(1e-5 * 2 ** (i / 2) for i in range(45))
+LATENCY_QUANTILES: Tuple[float, ...] = (0.5, 0.95, 0.99)
+
+# Timings of the stages run for the current request, or None outside of a request
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram with fixed buckets; quantiles are interpolated within buckets."""
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+
+    def observe(self, seconds: float) -> None:
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+
+
+    def snapshot(self) -> Tuple[List[int], int, float]:
+        with self._lock:
+            return list(self.counts), self.count, self.sum
+
+
+    def quantile(self, q: float, counts: Optional[List[int]] = None) -> float:
+        if counts is None:
+            counts = self.snapshot()[0]
+        total = sum(counts)
+        if total == 0:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+
+_histograms: Dict[str, LatencyHistogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def get_histogram(stage: str) -> LatencyHistogram:
+    histogram = _histograms.get(stage)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(stage, LatencyHistogram())
+    return histogram
+
+
+def record(stage: str, seconds: float) -> None:
+    """Records the duration of a stage for the current request, or directly when there is no request."""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+    else:
+        get_histogram(stage).observe(seconds)
+
+
+def add_timings(timings: List[Tuple[str, float]]) -> None:
+    """Adds stage timings measured elsewhere, e.g. in an inference worker, to the current request."""
+    for stage, seconds in timings:
+        record(stage, seconds)
+
+
+class measure:
+    """Context manager that records the time spent in its block under stage.
+
+        with measure("predict"):
+            ...
+
+    """
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *exc_info):
+        if METRICS_ENABLED:
+            record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def run_with_timings(fn: Callable, *args):
+    """Runs fn(*args) and returns its result with the stage timings it recorded.
+
+    Used to carry timings back from executor threads and processes, which do not share the request context.
+    """
+    token = _request_timings.set([])
+    try:
+        result = fn(*args)
+        return result, _request_timings.get()
+    finally:
+        _request_timings.reset(token)
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware that collects the stage timings of each request under paths.
+
+    The timings and the total request time are added to the latency histograms and returned to the client in a
+    Server-Timing header.
+    """
+    def __init__(self, app, paths: Sequence[str] = ("/",)):
+        self.app = app
+        self.paths = tuple(paths)
+
+
+    async def __call__(self, scope, receive, send):
+        if not METRICS_ENABLED or scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_server_timing(message):
+            if message["type"] == "http.response.start":
+                timings.append(("request", time.perf_counter() - start))
+                header = ", ".join(f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in timings)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_server_timing)
+        finally:
+            _request_timings.reset(token)
+            for stage, seconds in timings:
+                get_histogram(stage).observe(seconds)
+
+
+def render_prometheus() -> str:
+    """Renders the stage latency histograms and their quantiles in Prometheus text format."""
+    histogram_name = f"{METRICS_NAMESPACE}_stage_latency_seconds"
+    summary_name = f"{METRICS_NAMESPACE}_stage_latency_quantile_seconds"
+    histogram_lines = [f"# HELP {histogram_name} Time spent in each serving stage.",
+                       f"# TYPE {histogram_name} histogram"]
+    summary_lines = [f"# HELP {summary_name} Latency quantiles of each serving stage.",
+                     f"# TYPE {summary_name} summary"]
+    for stage, histogram in sorted(_histograms.items()):
+        counts, count, total = histogram.snapshot()
+        cumulative = 0
+        for bound, bucket_count in zip(histogram.buckets, counts):
+            cumulative += bucket_count
+            histogram_lines.append(f'{histogram_name}_bucket{{stage="{stage}",le="{bound:.6g}"}} {cumulative}')
+        histogram_lines.append(f'{histogram_name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+        histogram_lines.append(f'{histogram_name}_sum{{stage="{stage}"}} {total:.9f}')
+        histogram_lines.append(f'{histogram_name}_count{{stage="{stage}"}} {count}')
+        for q in LATENCY_QUANTILES:
+            summary_lines.append(
+                f'{summary_name}{{stage="{stage}",quantile="{q}"}} {histogram.quantile(q, counts):.9f}'
+            )
+        summary_lines.append(f'{summary_name}_sum{{stage="{stage}"}} {total:.9f}')
+        summary_lines.append(f'{summary_name}_count{{stage="{stage}"}} {count}')
+
+    return "\n".join(histogram_lines + summary_lines) + "\n"
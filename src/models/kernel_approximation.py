@@ -0,0 +1,66 @@
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.svm import LinearSVC
+from sklearn.utils.validation import check_is_fitted
+
+
+# Kernel map classes by the name of the approximation
+KERNEL_APPROXIMATIONS = {"nystroem": Nystroem, "rbf_sampler": RBFSampler}
+
+
+class KernelApproximationSVC(ClassifierMixin, BaseEstimator):
+    """
+    A linear SVM on an approximate RBF kernel feature map, a scalable alternative to SVC(kernel="rbf").
+
+    SVC fits in quadratic to cubic time in the number of rows and predicts in time proportional to its number of
+    support vectors. This classifier maps the rows to n_components features whose dot products approximate the RBF
+    kernel, with Nystroem (a sample of the training rows as landmarks) or random Fourier features (RBFSampler), and
+    fits LinearSVC on them: fitting is linear in the number of rows and prediction costs n_components kernel
+    evaluations per row, however large the training set. C and gamma mean the same as for SVC.
+
+    Args:
+        approximation: "nystroem" or "rbf_sampler".
+        n_components: The number of features of the kernel map; more is closer to the exact kernel and slower.
+        gamma: The RBF kernel coefficient.
+        C: The regularization parameter of the linear SVM.
+        max_iter: The maximum number of iterations of LinearSVC.
+        random_state: The seed of the landmark sample or of the random features.
+
+    """
+    def __init__(self, approximation="nystroem", n_components=300, gamma=0.1, C=1.0, max_iter=1000,
+                 random_state=None):
+        self.approximation = approximation
+        self.n_components = n_components
+        self.gamma = gamma
+        self.C = C
+        self.max_iter = max_iter
+        self.random_state = random_state
+
+
+    def fit(self, X, y):
+        if self.approximation not in KERNEL_APPROXIMATIONS:
+            raise ValueError(f"approximation must be one of {sorted(KERNEL_APPROXIMATIONS)}, "
+                             f"got {self.approximation!r}")
+        kernel_map_params = {"gamma": self.gamma, "n_components": self.n_components,
+                             "random_state": self.random_state}
+        if self.approximation == "nystroem":
+            # Nystroem cannot pick more landmarks than there are rows
+            kernel_map_params.update(kernel="rbf", n_components=min(self.n_components, len(X)))
+        self.kernel_map_ = KERNEL_APPROXIMATIONS[self.approximation](**kernel_map_params)
+        features = self.kernel_map_.fit_transform(X)
+        self.classifier_ = LinearSVC(C=self.C, dual="auto", max_iter=self.max_iter, random_state=self.random_state)
+        self.classifier_.fit(features, y)
+        self.classes_ = self.classifier_.classes_
+        self.n_features_in_ = self.kernel_map_.n_features_in_
+        return self
+
+
+    def decision_function(self, X) -> np.ndarray:
+        check_is_fitted(self, "classifier_")
+        return self.classifier_.decision_function(self.kernel_map_.transform(X))
+
+
+    def predict(self, X) -> np.ndarray:
+        check_is_fitted(self, "classifier_")
+        return self.classifier_.predict(self.kernel_map_.transform(X))
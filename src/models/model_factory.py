@@ -1,24 +1,50 @@
+import os
 import sys
+import time
 import yaml
+import inspect
+import tempfile
 import importlib
+import multiprocessing
 
 from collections import namedtuple
-from typing import List
-
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+import sklearn
+from joblib import effective_n_jobs
+from sklearn.base import clone
+from sklearn.model_selection import GridSearchCV, ParameterGrid, ParameterSampler
+
+from src.models.trial_store import TrialStore
+from src.models.shared_array import SharedArray, share_array, attach_array
+from src.models.search_telemetry import fit_search_with_peak_memory, build_search_report, write_search_report
+from src.models.serving_benchmark import benchmark_visa_model, get_model_size_mb
+from src.entity.estimator import VisaModel
 from src.exception import CustomException
 from src.logger import logging
 from src.constants import (GRID_SEARCH_KEY, MODULE_KEY, CLASS_KEY, PARAM_KEY,
-                           MODEL_SELECTION_KEY, SEARCH_PARAM_GRID_KEY)
+                           MODEL_SELECTION_KEY, SEARCH_PARAM_GRID_KEY, PARALLEL_SEARCH_KEY, CPU_BUDGET_KEY,
+                           MAX_PARALLEL_MODELS_KEY, RANDOM_STATE_KEY, TRIAL_CACHE_KEY, FILE_PATH_KEY,
+                           MAX_ENTRIES_KEY, MAX_SIZE_MB_KEY, SERVING_CONSTRAINTS_KEY, BATCH_SIZES_KEY, REPEAT_KEY,
+                           MAX_P99_LATENCY_MS_KEY, MAX_MODEL_SIZE_MB_KEY, LATENCY_PENALTY_PER_MS_KEY)
 
 
+# search_config is the grid_search section that applies to the model: module, class and params of the search
 InitializedModelDetail = namedtuple("InitializedModelDetail",
-                                    ["model_serial_number", "model", "param_grid_search", "model_name"])
+                                    ["model_serial_number", "model", "param_grid_search", "model_name",
+                                     "search_config"],
+                                    defaults=[None])
 
+# best_model is None until the winner of all the searches is refitted; cv_results summarizes every candidate
 GridSearchedBestModel = namedtuple("GridSearchedBestModel", ["model_serial_number",
                                                              "model",
                                                              "best_model",
                                                              "best_parameters",
-                                                             "best_score"])
+                                                             "best_score",
+                                                             "cv_results"],
+                                   defaults=[None])
 
 BestModel = namedtuple("BestModel", ["model_serial_number",
                                      "model",
@@ -26,15 +52,96 @@ BestModel = namedtuple("BestModel", ["model_serial_number",
                                      "best_parameters",
                                      "best_score"])
 
+# Search classes that scikit-learn only exposes after their experimental flag is imported
+EXPERIMENTAL_SEARCH_MODULES = {
+    "HalvingGridSearchCV": "sklearn.experimental.enable_halving_search_cv",
+    "HalvingRandomSearchCV": "sklearn.experimental.enable_halving_search_cv",
+}
+
+# Search classes whose candidates are known before any fit, so that the trial cache can look up each of them
+ENUMERABLE_SEARCH_CLASSES = ("GridSearchCV", "RandomizedSearchCV")
+# Search params that change the scores of a trial
+SCORE_SEARCH_PARAMS = ("cv", "scoring", "error_score")
+# Search params that only change how a search runs, not what it finds
+EXECUTION_SEARCH_PARAMS = ("n_jobs", "pre_dispatch", "verbose")
+# Estimator params that only change how a model is fitted, such as the threads the CPU budget gives it, not the model
+EXECUTION_MODEL_PARAMS = ("n_jobs", "nthread", "thread_count", "verbose", "verbosity")
+# Columns of the cv_results_ of a search that are kept for reporting; the iteration columns are only in halving searches
+CV_RESULT_KEYS = ("params", "mean_test_score", "std_test_score", "split_test_scores", "rank_test_score",
+                  "mean_fit_time", "mean_score_time", "peak_rss_mb", "iter", "n_resources")
+
+# CPUs given to the search of one model: n_jobs parallel fits, each limited to n_threads threads
+SearchResources = namedtuple("SearchResources", ["model_serial_number", "n_jobs", "n_threads"])
+
+
+def execute_grid_search_in_worker(model_factory: "ModelFactory",
+                                  initialized_model: InitializedModelDetail,
+                                  input_feature,
+                                  output_feature,
+                                  search_resources: SearchResources) -> GridSearchedBestModel:
+    """
+    Runs the parameter search of one model within its share of the CPU budget.
+
+    The features may be SharedArray references, which are attached read-only instead of being copied into the
+    process; the joblib workers of the search then map the same file pages too.
+
+    """
+    from joblib import parallel_config
+    from joblib.externals.loky import get_reusable_executor
+    from threadpoolctl import threadpool_limits
+
+    try:
+        if isinstance(input_feature, SharedArray):
+            input_feature = attach_array(input_feature)
+        if isinstance(output_feature, SharedArray):
+            output_feature = attach_array(output_feature)
+        n_threads = search_resources.n_threads
+        if "n_jobs" in initialized_model.model.get_params():
+            initialized_model.model.set_params(n_jobs=n_threads)
+        # Limit BLAS/OpenMP threads here and in the joblib workers started by the search
+        with threadpool_limits(limits=n_threads), parallel_config(backend="loky", inner_max_num_threads=n_threads):
+            return model_factory.execute_grid_search_operation(initialized_model=initialized_model,
+                                                               input_feature=input_feature,
+                                                               output_feature=output_feature,
+                                                               n_jobs=search_resources.n_jobs)
+    except Exception as e:
+        raise CustomException(e, sys) from e
+    finally:
+        # joblib keeps its workers alive for reuse; stop them so that they do not hold on to the CPUs of the next
+        # search and do not block the exit of a pool or training job process, which waits for its child processes
+        get_reusable_executor().shutdown(wait=True)
+
 
 class ModelFactory:
-    def __init__(self, model_config_path: str = None):
+    def __init__(self, model_config_path: str = None, checkpoint_file_path: Optional[str] = None,
+                 search_report_file_path: Optional[str] = None):
+        """
+        Args:
+            model_config_path: The model.yaml file.
+            checkpoint_file_path: The file that keeps the trials of this training run as they finish, so that a
+                resumed run only fits the trials that are not in it yet; None to not checkpoint.
+            search_report_file_path: The JSON file get_best_model writes the telemetry of every searched candidate
+                to; None to not write it.
+
+        """
         try:
             self.config: dict = ModelFactory.read_params(model_config_path)
             self.grid_search_cv_module: str = self.config[GRID_SEARCH_KEY][MODULE_KEY]
             self.grid_search_class_name: str = self.config[GRID_SEARCH_KEY][CLASS_KEY]
             self.grid_search_property_data: dict = dict(self.config[GRID_SEARCH_KEY][PARAM_KEY])
             self.models_initialization_config: dict = dict(self.config[MODEL_SELECTION_KEY])
+            # Without a parallel_search section the models are searched one after another with the grid_search params
+            self.parallel_search_config: Optional[dict] = self.config.get(PARALLEL_SEARCH_KEY)
+            # Without a trial_cache section every trial is fitted
+            self.trial_cache_config: Optional[dict] = self.config.get(TRIAL_CACHE_KEY)
+            self._trial_store: Optional[TrialStore] = None
+            self.checkpoint_file_path: Optional[str] = checkpoint_file_path
+            self._checkpoint_store: Optional[TrialStore] = None
+            self.search_report_file_path: Optional[str] = search_report_file_path
+            # Without a serving_constraints section the model with the best CV score wins
+            self.serving_constraints_config: Optional[dict] = self.config.get(SERVING_CONSTRAINTS_KEY)
+            # Latency, size and violated limits of every benchmarked model, by model serial number
+            self.serving_benchmarks: dict = {}
             self.initialized_model_list = None
             self.grid_searched_best_model_list = None
         except Exception as e:
@@ -94,7 +201,8 @@ class ModelFactory:
     def execute_grid_search_operation(self,
                                       initialized_model: InitializedModelDetail,
                                       input_feature,
-                                      output_feature) -> GridSearchedBestModel:
+                                      output_feature,
+                                      n_jobs: Optional[int] = None) -> GridSearchedBestModel:
         """
         Perform parameter search operation and return the best model with its set of best parameters.
 
@@ -102,6 +210,7 @@ class ModelFactory:
             initialized_model: The InitializedModelDetail object.
             input_feature: The features used for training the model.
             output_feature: The target/dependent feature in the prediction.
+            n_jobs: The number of parallel fits, overriding the n_jobs of the grid_search params.
 
         Returns:
             The GridSearchedBestModel object.
@@ -114,30 +223,299 @@ class ModelFactory:
             # Instantiate the GridSearchCV class
             message = "*" * 50, f"training {type(initialized_model.model).__name__}", "*" * 50
             logging.info(message)
-            grid_search_cv_ref = ModelFactory.class_for_name(module_name=self.grid_search_cv_module,
-                                                             class_name=self.grid_search_class_name)
-
-            grid_search_cv = grid_search_cv_ref(
-                estimator=initialized_model.model,
-                param_grid=initialized_model.param_grid_search
-            )
-            grid_search_cv = ModelFactory.update_property_of_class(
-                grid_search_cv,
-                self.grid_search_property_data
-            )
-            grid_search_cv.fit(input_feature, output_feature)
+            search_config = initialized_model.search_config or self.get_search_config()
+            trial_stores = self.get_trial_stores()
+            if trial_stores:
+                return self.execute_cached_search_operation(initialized_model=initialized_model,
+                                                            search_config=search_config,
+                                                            input_feature=input_feature,
+                                                            output_feature=output_feature,
+                                                            trial_stores=trial_stores,
+                                                            n_jobs=n_jobs)
+
+            grid_search_cv = self.create_search(initialized_model.model, initialized_model.param_grid_search,
+                                                search_config, n_jobs=n_jobs)
+            # Only the winner of all the model families is refitted, by get_best_model
+            refit = grid_search_cv.refit
+            grid_search_cv.refit = False
+            peak_rss_mb = fit_search_with_peak_memory(grid_search_cv, input_feature, output_feature)
+            best_parameters, best_score, cv_results = self.get_search_outcome(grid_search_cv, refit, peak_rss_mb)
             grid_searched_best_model = GridSearchedBestModel(
                 model_serial_number=initialized_model.model_serial_number,
                 model=initialized_model.model,
-                best_model=grid_search_cv.best_estimator_,
-                best_parameters=grid_search_cv.best_params_,
-                best_score=grid_search_cv.best_score_
+                best_model=None,
+                best_parameters=best_parameters,
+                best_score=best_score,
+                cv_results=cv_results
             )
             return grid_searched_best_model
         except Exception as e:
             raise CustomException(e, sys) from e
 
 
+    @staticmethod
+    def create_search(model, param_grid, search_config: dict, n_jobs: Optional[int] = None):
+        """
+        Instantiate the search class of search_config for a model and its parameter grid.
+
+        Args:
+            model: The estimator to tune.
+            param_grid: The grid or distributions of the parameters to search.
+            search_config: The module, class and params of the search.
+            n_jobs: The number of parallel fits, overriding the n_jobs of the search params.
+
+        Returns:
+            The unfitted search object.
+
+        """
+        if search_config[CLASS_KEY] in EXPERIMENTAL_SEARCH_MODULES:
+            importlib.import_module(EXPERIMENTAL_SEARCH_MODULES[search_config[CLASS_KEY]])
+        grid_search_cv_ref = ModelFactory.class_for_name(module_name=search_config[MODULE_KEY],
+                                                         class_name=search_config[CLASS_KEY])
+
+        # The grid is the second argument of every search class: param_grid or param_distributions
+        grid_search_cv = grid_search_cv_ref(model, param_grid)
+        grid_search_cv = ModelFactory.update_property_of_class(grid_search_cv, search_config[PARAM_KEY])
+        if n_jobs is not None:
+            grid_search_cv.n_jobs = n_jobs
+        return grid_search_cv
+
+
+    @staticmethod
+    def get_search_outcome(grid_search_cv, refit=True,
+                           peak_rss_mb: Optional[List[Optional[float]]] = None) -> Tuple[dict, float, dict]:
+        """
+        Select the best candidate of a search fitted with refit=False.
+
+        Args:
+            grid_search_cv: The fitted search object.
+            refit: The refit param of the search config, which names the metric that selects the best candidate
+                when the search has several scoring metrics.
+            peak_rss_mb: The peak RSS of each candidate, added to the summary.
+
+        Returns:
+            The best parameters, their mean CV score and the summary of cv_results_.
+
+        """
+        cv_results = grid_search_cv.cv_results_
+        if not grid_search_cv.multimetric_:
+            # Search classes select the best candidate without refitting when they have a single metric
+            metric = "score"
+            best_index = grid_search_cv.best_index_
+        else:
+            metric = refit
+            best_index = int(np.argmin(cv_results[f"rank_test_{metric}"]))
+        # Report the columns of the selecting metric under the names of a single metric search
+        columns = {key: key.replace("test_score", f"test_{metric}") for key in CV_RESULT_KEYS}
+        summary = {key: cv_results[column] for key, column in columns.items() if column in cv_results}
+        summary["split_test_scores"] = np.column_stack([cv_results[f"split{split}_test_{metric}"]
+                                                        for split in range(grid_search_cv.n_splits_)])
+        if peak_rss_mb is not None:
+            summary["peak_rss_mb"] = peak_rss_mb
+        summary = ModelFactory.summarize_cv_results(summary)
+        return cv_results["params"][best_index], float(cv_results[f"mean_test_{metric}"][best_index]), summary
+
+
+    @staticmethod
+    def summarize_cv_results(cv_results: dict) -> dict:
+        """Convert the kept columns of cv_results_ to plain lists, so that they can be logged and stored as JSON."""
+        return {key: [value.tolist() if isinstance(value, (np.generic, np.ndarray)) else value
+                      for value in cv_results[key]]
+                for key in CV_RESULT_KEYS if key in cv_results}
+
+
+    def get_trial_store(self) -> Optional[TrialStore]:
+        """Return the trial store of the trial_cache config, or None when the config has no trial_cache."""
+        if self.trial_cache_config is None:
+            return None
+        if self._trial_store is None:
+            self._trial_store = TrialStore(file_path=self.trial_cache_config[FILE_PATH_KEY],
+                                           max_entries=self.trial_cache_config.get(MAX_ENTRIES_KEY, 100000),
+                                           max_size_mb=self.trial_cache_config.get(MAX_SIZE_MB_KEY, 256))
+        return self._trial_store
+
+
+    def get_checkpoint_store(self) -> Optional[TrialStore]:
+        """Return the trial store of the checkpoint file of this run, or None when the run is not checkpointed."""
+        if self.checkpoint_file_path is None:
+            return None
+        if self._checkpoint_store is None:
+            self._checkpoint_store = TrialStore(file_path=self.checkpoint_file_path)
+        return self._checkpoint_store
+
+
+    def get_trial_stores(self) -> List[TrialStore]:
+        """Return the checkpoint of this run and the trial cache shared by all runs, leaving out those not in use."""
+        return [trial_store for trial_store in (self.get_checkpoint_store(), self.get_trial_store())
+                if trial_store is not None]
+
+
+    def execute_cached_search_operation(self,
+                                        initialized_model: InitializedModelDetail,
+                                        search_config: dict,
+                                        input_feature,
+                                        output_feature,
+                                        trial_stores: List[TrialStore],
+                                        n_jobs: Optional[int] = None) -> GridSearchedBestModel:
+        """
+        Perform parameter search operation, reusing the trials that are in the trial stores.
+
+        Trials are keyed by the dataset fingerprint, the estimator class and its full set of params, the CV settings
+        and the scikit-learn version. For GridSearchCV and RandomizedSearchCV every candidate is looked up on its own
+        and only the missing ones are cross-validated, so a grown grid only fits its new points. The missing ones are
+        cross-validated n_jobs at a time and stored after each batch, so that an interrupted search keeps the trials
+        it finished. Adaptive searches (successive halving, time budget) pick candidates from earlier scores, so their
+        whole outcome is stored instead, once they finish. Either way the best model is not refitted here;
+        get_best_model refits the winner of all the models.
+
+        Args:
+            initialized_model: The InitializedModelDetail object.
+            search_config: The module, class and params of the search.
+            input_feature: The features used for training the model.
+            output_feature: The target/dependent feature in the prediction.
+            trial_stores: The stores of trial results, looked up in order; new results are put in all of them.
+            n_jobs: The number of parallel fits, overriding the n_jobs of the search params.
+
+        Returns:
+            The GridSearchedBestModel object.
+
+        Raises:
+            CustomException: If the search failed.
+
+        """
+        try:
+            model = initialized_model.model
+            param_grid = initialized_model.param_grid_search
+            search_params = search_config[PARAM_KEY]
+            key_fields = dict(dataset=TrialStore.get_dataset_fingerprint(input_feature, output_feature),
+                              estimator=f"{type(model).__module__}.{type(model).__name__}",
+                              sklearn_version=sklearn.__version__,
+                              cv={name: search_params.get(name) for name in SCORE_SEARCH_PARAMS})
+            base_params = {name: value for name, value in model.get_params(deep=False).items()
+                           if name not in EXECUTION_MODEL_PARAMS}
+            single_metric = not isinstance(search_params.get("scoring"), (list, tuple, dict))
+
+            if search_config[CLASS_KEY] not in ENUMERABLE_SEARCH_CLASSES or not single_metric:
+                search_fields = {**search_config, PARAM_KEY: {name: value for name, value in search_params.items()
+                                                              if name not in EXECUTION_SEARCH_PARAMS}}
+                key = TrialStore.get_key(**key_fields, params=base_params, grid=param_grid,
+                                         search=search_fields)
+                cached_search = next((cached_search for cached_search in (trial_store.get(key)
+                                                                          for trial_store in trial_stores)
+                                      if cached_search is not None), None)
+                if cached_search is not None:
+                    logging.info(f"Found the {search_config[CLASS_KEY]} result of {initialized_model.model_name} "
+                                 f"in the trial cache")
+                    best_parameters, best_score = cached_search["best_parameters"], cached_search["best_score"]
+                    cv_results = cached_search.get("cv_results")
+                else:
+                    grid_search_cv = self.create_search(model, param_grid, search_config, n_jobs=n_jobs)
+                    refit = grid_search_cv.refit
+                    grid_search_cv.refit = False
+                    peak_rss_mb = fit_search_with_peak_memory(grid_search_cv, input_feature, output_feature)
+                    best_parameters, best_score, cv_results = self.get_search_outcome(grid_search_cv, refit,
+                                                                                      peak_rss_mb)
+                    for trial_store in trial_stores:
+                        trial_store.put(key, {"best_parameters": best_parameters, "best_score": best_score,
+                                              "cv_results": cv_results})
+                return GridSearchedBestModel(model_serial_number=initialized_model.model_serial_number,
+                                             model=model,
+                                             best_model=None,
+                                             best_parameters=best_parameters,
+                                             best_score=best_score,
+                                             cv_results=cv_results)
+
+            if search_config[CLASS_KEY] == "GridSearchCV":
+                candidates = list(ParameterGrid(param_grid))
+            else:
+                candidates = list(ParameterSampler(param_grid, n_iter=search_params.get("n_iter", 10),
+                                                   random_state=search_params.get(RANDOM_STATE_KEY)))
+            keys = [TrialStore.get_key(**key_fields, params={**base_params, **candidate}) for candidate in candidates]
+            trials = {}
+            for trial_store in trial_stores:
+                trials.update(trial_store.get_many([key for key in keys if key not in trials]))
+            missing = [i for i, key in enumerate(keys) if key not in trials]
+            logging.info(f"Found {len(candidates) - len(missing)} of {len(candidates)} trials of "
+                         f"{initialized_model.model_name} in the trial stores")
+
+            # Cross-validate only the missing candidates, each as a grid of a single point
+            grid_search_params = inspect.signature(GridSearchCV).parameters
+            grid_search_config = {
+                MODULE_KEY: "sklearn.model_selection",
+                CLASS_KEY: "GridSearchCV",
+                PARAM_KEY: {**{name: value for name, value in search_params.items() if name in grid_search_params},
+                            "refit": False},
+            }
+            # n_jobs candidates at a time keep every worker busy between two stores of the results
+            batch_size = effective_n_jobs(n_jobs if n_jobs is not None else search_params.get("n_jobs"))
+            for start in range(0, len(missing), batch_size):
+                batch = missing[start:start + batch_size]
+                single_point_grid = [{name: [value] for name, value in candidates[i].items()} for i in batch]
+                grid_search_cv = self.create_search(model, single_point_grid, grid_search_config, n_jobs=n_jobs)
+                peak_rss_mb = fit_search_with_peak_memory(grid_search_cv, input_feature, output_feature)
+                cv_results = grid_search_cv.cv_results_
+                new_trials = {}
+                for j, i in enumerate(batch):
+                    new_trials[keys[i]] = {
+                        "split_test_scores": [float(cv_results[f"split{split}_test_score"][j])
+                                              for split in range(grid_search_cv.n_splits_)],
+                        "mean_fit_time": float(cv_results["mean_fit_time"][j]),
+                        "mean_score_time": float(cv_results["mean_score_time"][j]),
+                        "peak_rss_mb": peak_rss_mb[j],
+                    }
+                for trial_store in trial_stores:
+                    trial_store.put_many(new_trials)
+                trials.update(new_trials)
+                logging.info(f"Stored {start + len(batch)} of {len(missing)} new trials of "
+                             f"{initialized_model.model_name}")
+
+            # The first of equally scored candidates wins, as in GridSearchCV
+            mean_scores = np.array([np.mean(trials[key]["split_test_scores"]) for key in keys])
+            best_index = int(np.nanargmax(mean_scores))
+            # Candidates that failed to score rank last, as in cv_results_
+            ranked_scores = -np.nan_to_num(mean_scores, nan=-np.inf)
+            cv_results = self.summarize_cv_results({
+                "params": candidates,
+                "mean_test_score": mean_scores,
+                "std_test_score": [np.std(trials[key]["split_test_scores"]) for key in keys],
+                "split_test_scores": [trials[key]["split_test_scores"] for key in keys],
+                "rank_test_score": np.searchsorted(np.sort(ranked_scores), ranked_scores) + 1,
+                "mean_fit_time": [trials[key]["mean_fit_time"] for key in keys],
+                "mean_score_time": [trials[key]["mean_score_time"] for key in keys],
+                "peak_rss_mb": [trials[key].get("peak_rss_mb") for key in keys],
+            })
+            return GridSearchedBestModel(model_serial_number=initialized_model.model_serial_number,
+                                         model=model,
+                                         best_model=None,
+                                         best_parameters=candidates[best_index],
+                                         best_score=float(mean_scores[best_index]),
+                                         cv_results=cv_results)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def get_search_config(self, model_initialization_config: Optional[dict] = None) -> dict:
+        """
+        Retrieve the search settings of a model entry.
+
+        A grid_search section in the model entry selects another search class, such as HalvingGridSearchCV,
+        RandomizedSearchCV or TimeBudgetSearchCV, and adds to or overrides the params of the top-level section.
+
+        Args:
+            model_initialization_config: The model entry of the model_selection config.
+
+        Returns:
+            The module, class and params of the search.
+
+        """
+        model_search_config = (model_initialization_config or {}).get(GRID_SEARCH_KEY) or {}
+        return {
+            MODULE_KEY: model_search_config.get(MODULE_KEY, self.grid_search_cv_module),
+            CLASS_KEY: model_search_config.get(CLASS_KEY, self.grid_search_class_name),
+            PARAM_KEY: {**self.grid_search_property_data, **dict(model_search_config.get(PARAM_KEY) or {})},
+        }
+
+
     def get_initialized_model_list(self) -> List[InitializedModelDetail]:
         """
         Retrieve a list of model details.
@@ -162,12 +540,19 @@ class ModelFactory:
                     model = ModelFactory.update_property_of_class(instance_ref=model,
                                                                   property_data=model_obj_property_data)
 
+                # Seed the models that are not seeded in their params so that the search is reproducible
+                random_state = (self.parallel_search_config or {}).get(RANDOM_STATE_KEY)
+                if random_state is not None and getattr(model, "random_state", 0) is None:
+                    model.random_state = random_state
+
                 param_grid_search = model_initialization_config[SEARCH_PARAM_GRID_KEY]
                 model_name = f"{model_initialization_config[MODULE_KEY]}.{model_initialization_config[CLASS_KEY]}"
+                search_config = self.get_search_config(model_initialization_config)
                 model_initialization_config = InitializedModelDetail(model_serial_number=model_serial_number,
                                                                      model=model,
                                                                      param_grid_search=param_grid_search,
-                                                                     model_name=model_name)
+                                                                     model_name=model_name,
+                                                                     search_config=search_config)
                 initialized_model_list.append(model_initialization_config)
 
             self.initialized_model_list = initialized_model_list
@@ -208,6 +593,13 @@ class ModelFactory:
                                                               input_feature,
                                                               output_feature) -> List[GridSearchedBestModel]:
         try:
+            if self.parallel_search_config is not None:
+                self.grid_searched_best_model_list = self.execute_parallel_search(
+                    initialized_model_list=initialized_model_list,
+                    input_feature=input_feature,
+                    output_feature=output_feature)
+                return self.grid_searched_best_model_list
+
             self.grid_searched_best_model_list = []
             for initialized_model_list in initialized_model_list:
                 grid_searched_best_model = self.initiate_best_parameter_search_for_initialized_model(
@@ -220,6 +612,139 @@ class ModelFactory:
             raise CustomException(e, sys) from e
 
 
+    @staticmethod
+    def get_available_cpu_count() -> int:
+        """Returns the number of CPUs this process may run on."""
+        if hasattr(os, "sched_getaffinity"):
+            return len(os.sched_getaffinity(0))
+        return os.cpu_count() or 1
+
+
+    @staticmethod
+    def split_cpu_budget(cpu_budget: int, fit_counts: List[int]) -> List[int]:
+        """
+        Split CPUs between models searched at the same time, in proportion to their number of fits.
+
+        Every model gets at least one CPU and none gets more CPUs than it has fits.
+
+        Args:
+            cpu_budget: The number of CPUs to split.
+            fit_counts: The number of fits (parameter candidates times CV folds) of each model.
+
+        Returns:
+            The number of CPUs of each model.
+
+        """
+        shares = [1] * len(fit_counts)
+        for _ in range(cpu_budget - len(fit_counts)):
+            # Give the next CPU to the model with the most fits per CPU
+            candidates = [i for i, fit_count in enumerate(fit_counts) if shares[i] < fit_count]
+            if not candidates:
+                break
+            shares[max(candidates, key=lambda i: fit_counts[i] / shares[i])] += 1
+        return shares
+
+
+    @staticmethod
+    def get_fit_count(initialized_model: InitializedModelDetail) -> int:
+        """Estimate the number of fits that the search of a model can run in parallel: candidates times CV folds."""
+        search_params = (initialized_model.search_config or {}).get(PARAM_KEY) or {}
+        cv = search_params.get("cv", 5)
+        n_folds = cv if isinstance(cv, int) else 5
+        try:
+            n_candidates = len(ParameterGrid(initialized_model.param_grid_search))
+        except TypeError:
+            # Distributions instead of lists of values
+            n_candidates = None
+        # Randomized and halving searches may evaluate fewer candidates than the grid has
+        for key in ("n_iter", "n_candidates"):
+            if isinstance(search_params.get(key), int):
+                n_candidates = min(n_candidates or search_params[key], search_params[key])
+        return (n_candidates or 1) * n_folds
+
+
+    def get_search_resources(self,
+                             initialized_model_list: List[InitializedModelDetail]) -> Tuple[int, List[SearchResources]]:
+        """
+        Split the CPU budget of the parallel_search config across models, CV fits and estimator threads.
+
+        The budget is capped at the CPUs available to this process so that searches never oversubscribe them.
+
+        Args:
+            initialized_model_list: The models to search.
+
+        Returns:
+            The number of models searched at the same time, and the SearchResources of each model.
+
+        """
+        available_cpus = ModelFactory.get_available_cpu_count()
+        cpu_budget = min(self.parallel_search_config.get(CPU_BUDGET_KEY) or available_cpus, available_cpus)
+        n_models = len(initialized_model_list)
+        max_parallel_models = self.parallel_search_config.get(MAX_PARALLEL_MODELS_KEY) or n_models
+        n_parallel_models = max(1, min(n_models, max_parallel_models, cpu_budget))
+
+        fit_counts = [ModelFactory.get_fit_count(initialized_model) for initialized_model in initialized_model_list]
+        if n_parallel_models == n_models:
+            shares = ModelFactory.split_cpu_budget(cpu_budget, fit_counts)
+        else:
+            # Models run in waves and any of them may run together, so split the budget evenly
+            shares = [cpu_budget // n_parallel_models] * n_models
+
+        search_resources = []
+        for initialized_model, share, fit_count in zip(initialized_model_list, shares, fit_counts):
+            n_jobs = max(1, min(share, fit_count))
+            search_resources.append(SearchResources(model_serial_number=initialized_model.model_serial_number,
+                                                    n_jobs=n_jobs,
+                                                    n_threads=max(1, share // n_jobs)))
+        return n_parallel_models, search_resources
+
+
+    def execute_parallel_search(self,
+                                initialized_model_list: List[InitializedModelDetail],
+                                input_feature,
+                                output_feature) -> List[GridSearchedBestModel]:
+        """
+        Search the models at the same time, each in its own process, within the CPU budget of parallel_search.
+
+        The results are returned in the order of the model_selection config and do not depend on the budget, since
+        every fit is seeded and the CV splits are fixed. The processes attach to one read-only memory map of the
+        training data instead of receiving a copy of it each: the memory-mapped file the arrays are views of, or a
+        temporary copy of them.
+
+        Args:
+            initialized_model_list: The models to search.
+            input_feature: The features used for training the model.
+            output_feature: The target/dependent feature in the prediction.
+
+        Returns:
+            The GridSearchedBestModel of each model.
+
+        Raises:
+            CustomException: If the search of any model failed.
+
+        """
+        try:
+            n_parallel_models, search_resources = self.get_search_resources(initialized_model_list)
+            logging.info(f"Searching {len(initialized_model_list)} models, {n_parallel_models} at a time: "
+                         f"{search_resources}")
+            if n_parallel_models == 1:
+                return [execute_grid_search_in_worker(self, initialized_model, input_feature, output_feature, resources)
+                        for initialized_model, resources in zip(initialized_model_list, search_resources)]
+
+            # Spawn instead of fork: joblib and BLAS thread pools do not survive a fork
+            with tempfile.TemporaryDirectory() as shared_dir_path, \
+                    ProcessPoolExecutor(max_workers=n_parallel_models,
+                                        mp_context=multiprocessing.get_context("spawn")) as executor:
+                shared_input_feature = share_array(np.asarray(input_feature), shared_dir_path, "input_feature")
+                shared_output_feature = share_array(np.asarray(output_feature), shared_dir_path, "output_feature")
+                futures = [executor.submit(execute_grid_search_in_worker, self, initialized_model,
+                                           shared_input_feature, shared_output_feature, resources)
+                           for initialized_model, resources in zip(initialized_model_list, search_resources)]
+                return [future.result() for future in futures]
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
     @staticmethod
     def get_model_detail(model_details: List[InitializedModelDetail],
                          model_serial_number: str) -> InitializedModelDetail:
@@ -238,31 +763,203 @@ class ModelFactory:
             best_model = None
             for grid_searched_best_model in grid_searched_best_model_list:
                 if base_accuracy < grid_searched_best_model.best_score:
-                    logging.info(f"Acceptable model found: {grid_searched_best_model}")
+                    logging.info(f"Acceptable model found: {grid_searched_best_model.model_serial_number} "
+                                 f"{grid_searched_best_model.best_parameters} "
+                                 f"score: {grid_searched_best_model.best_score}")
                     base_accuracy = grid_searched_best_model.best_score
                     best_model = grid_searched_best_model
             if not best_model:
                 raise CustomException(f"None of the model has base accuracy: {base_accuracy}")
-            logging.info(f"Best model: {best_model}")
+            logging.info(f"Best model: {best_model.model_serial_number} {best_model.best_parameters}")
+            return best_model
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def write_search_report(self, file_path: str) -> dict:
+        """
+        Write the fit and score time, peak RSS, CV scores and params of every searched candidate to a JSON file,
+        with a summary that ranks the candidates by CV score per CPU-second.
+
+        Args:
+            file_path: The JSON file.
+
+        Returns:
+            The report.
+
+        """
+        try:
+            report = build_search_report([(grid_searched_best_model.model_serial_number,
+                                            type(grid_searched_best_model.model).__name__,
+                                            grid_searched_best_model.cv_results)
+                                           for grid_searched_best_model in self.grid_searched_best_model_list or []])
+            if self.serving_benchmarks:
+                report["serving_benchmarks"] = self.serving_benchmarks
+            write_search_report(file_path, report)
+            return report
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    @staticmethod
+    def refit_best_model(grid_searched_best_model: GridSearchedBestModel, X, y) -> BestModel:
+        """
+        Fit the best parameters of the selected model on all of the training data.
+
+        Args:
+            grid_searched_best_model: The GridSearchedBestModel object selected on its CV score.
+            X: The input features.
+            y: The target feature.
+
+        Returns:
+            The BestModel object.
+
+        """
+        try:
+            best_model = grid_searched_best_model.best_model
+            if best_model is None:
+                start = time.perf_counter()
+                best_model = clone(grid_searched_best_model.model)
+                best_model.set_params(**grid_searched_best_model.best_parameters).fit(X, y)
+                logging.info(f"Refitted {type(best_model).__name__} on {len(X)} rows in "
+                             f"{time.perf_counter() - start:.1f}s")
+            return BestModel(model_serial_number=grid_searched_best_model.model_serial_number,
+                             model=grid_searched_best_model.model,
+                             best_model=best_model,
+                             best_parameters=grid_searched_best_model.best_parameters,
+                             best_score=grid_searched_best_model.best_score)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def benchmark_best_model(self, best_model: BestModel, preprocessor, benchmark_dataframe) -> dict:
+        """
+        Time a refitted model inside a VisaModel and check it against the limits of the serving_constraints config.
+
+        Args:
+            best_model: The BestModel object.
+            preprocessor: The fitted preprocessor of the input features.
+            benchmark_dataframe: Input features as the serving app receives them.
+
+        Returns:
+            The latency by batch size, the model size and the violated limits of the model.
+
+        """
+        try:
+            visa_model = VisaModel(preprocessor=preprocessor, trained_model=best_model.best_model)
+            visa_model.compile_fast_encoder()
+            latency_ms = benchmark_visa_model(visa_model, benchmark_dataframe,
+                                              batch_sizes=self.serving_constraints_config[BATCH_SIZES_KEY],
+                                              repeat=self.serving_constraints_config.get(REPEAT_KEY, 100))
+            model_size_mb = get_model_size_mb(visa_model)
+
+            violations = []
+            max_p99_latency_ms = self.serving_constraints_config.get(MAX_P99_LATENCY_MS_KEY) or {}
+            for batch_size, max_latency in max_p99_latency_ms.items():
+                p99_ms = latency_ms.get(int(batch_size), {}).get("p99_ms")
+                if p99_ms is not None and p99_ms > max_latency:
+                    violations.append(f"p99 latency at batch size {batch_size}: {p99_ms:.1f}ms > {max_latency}ms")
+            max_model_size_mb = self.serving_constraints_config.get(MAX_MODEL_SIZE_MB_KEY)
+            if max_model_size_mb is not None and model_size_mb > max_model_size_mb:
+                violations.append(f"model size: {model_size_mb:.1f}MB > {max_model_size_mb}MB")
+
+            benchmark = {"model": type(best_model.best_model).__name__,
+                         "best_parameters": best_model.best_parameters,
+                         "best_score": best_model.best_score,
+                         "latency_ms": latency_ms,
+                         "model_size_mb": model_size_mb,
+                         "violations": violations}
+            self.serving_benchmarks[best_model.model_serial_number] = benchmark
+            return benchmark
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def get_best_model_within_serving_constraints(self,
+                                                  grid_searched_best_model_list: List[GridSearchedBestModel],
+                                                  X, y,
+                                                  base_accuracy: float,
+                                                  preprocessor,
+                                                  benchmark_dataframe) -> BestModel:
+        """
+        Select the best model among those that meet the serving constraints.
+
+        Models above base_accuracy are refitted and benchmarked in order of CV score. Without a latency penalty the
+        first one within the limits wins, so that usually only the winner is refitted. With a penalty every one of
+        them is benchmarked and, of those within the limits, the highest CV score minus the penalty per millisecond
+        of p99 latency at the smallest batch size wins.
+
+        Args:
+            grid_searched_best_model_list: The GridSearchedBestModel objects of every model.
+            X: The input features.
+            y: The target feature.
+            base_accuracy: The expected baseline accuracy.
+            preprocessor: The fitted preprocessor of the input features.
+            benchmark_dataframe: Input features as the serving app receives them.
+
+        Returns:
+            The BestModel object.
+
+        Raises:
+            CustomException: If none of the models met the expected baseline accuracy and the serving constraints.
+
+        """
+        try:
+            acceptable_models = sorted((grid_searched_best_model
+                                        for grid_searched_best_model in grid_searched_best_model_list
+                                        if base_accuracy < grid_searched_best_model.best_score),
+                                       key=lambda grid_searched_best_model: grid_searched_best_model.best_score,
+                                       reverse=True)
+            if not acceptable_models:
+                raise CustomException(f"None of the model has base accuracy: {base_accuracy}")
+            latency_penalty_per_ms = self.serving_constraints_config.get(LATENCY_PENALTY_PER_MS_KEY) or 0
+            smallest_batch_size = min(self.serving_constraints_config[BATCH_SIZES_KEY])
+
+            best_model, best_objective = None, -np.inf
+            for grid_searched_best_model in acceptable_models:
+                refitted_model = self.refit_best_model(grid_searched_best_model, X, y)
+                benchmark = self.benchmark_best_model(refitted_model, preprocessor, benchmark_dataframe)
+                if benchmark["violations"]:
+                    logging.info(f"{refitted_model.model_serial_number} does not meet the serving constraints: "
+                                 f"{benchmark['violations']}")
+                    continue
+                p99_ms = benchmark["latency_ms"][smallest_batch_size]["p99_ms"]
+                benchmark["objective"] = refitted_model.best_score - latency_penalty_per_ms * p99_ms
+                if benchmark["objective"] > best_objective:
+                    best_model, best_objective = refitted_model, benchmark["objective"]
+                if not latency_penalty_per_ms:
+                    break
+            if best_model is None:
+                raise CustomException("None of the models meets the serving constraints")
+            logging.info(f"Best model within the serving constraints: {best_model.model_serial_number} "
+                         f"{best_model.best_parameters}")
             return best_model
         except Exception as e:
             raise CustomException(e, sys) from e
 
 
-    def get_best_model(self, X, y, base_accuracy: float = 0.6) -> BestModel:
+    def get_best_model(self, X, y, base_accuracy: float = 0.6, preprocessor=None,
+                       benchmark_dataframe=None) -> BestModel:
         """
         Retrieve the best model.
 
+        Every model family is searched on CV scores alone; only the best configuration of all of them is refitted on
+        X and y. The CV results of every family stay in grid_searched_best_model_list for reporting. With a
+        serving_constraints config, a preprocessor and benchmark data, the winner must also serve within the latency
+        and size limits.
+
         Args:
             X: The input features.
             y: The target feature.
             base_accuracy: The expected baseline accuracy.
+            preprocessor: The fitted preprocessor of the input features, for the serving benchmark.
+            benchmark_dataframe: Input features as the serving app receives them, for the serving benchmark.
 
         Returns:
             The BestModel object.
 
         Raises:
-            CustomException: If none of the models met the expected baseline accuracy.
+            CustomException: If none of the models met the expected baseline accuracy or the serving constraints.
 
         """
         try:
@@ -274,9 +971,24 @@ class ModelFactory:
                 input_feature=X,
                 output_feature=y
             )
-            return ModelFactory.get_best_model_from_grid_searched_best_model_list(
-                grid_searched_best_model_list,
-                base_accuracy=base_accuracy
-            )
+            try:
+                if self.serving_constraints_config is not None and preprocessor is not None \
+                        and benchmark_dataframe is not None:
+                    return self.get_best_model_within_serving_constraints(
+                        grid_searched_best_model_list,
+                        X, y,
+                        base_accuracy=base_accuracy,
+                        preprocessor=preprocessor,
+                        benchmark_dataframe=benchmark_dataframe
+                    )
+                grid_searched_best_model = ModelFactory.get_best_model_from_grid_searched_best_model_list(
+                    grid_searched_best_model_list,
+                    base_accuracy=base_accuracy
+                )
+                return ModelFactory.refit_best_model(grid_searched_best_model, X, y)
+            finally:
+                # Written even when no model is acceptable, to show why
+                if self.search_report_file_path is not None:
+                    self.write_search_report(self.search_report_file_path)
         except Exception as e:
             raise CustomException(e, sys) from e
@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import tempfile
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+from sklearn.metrics import check_scoring
+
+from src.exception import CustomException
+from src.logger import logging
+
+
+def _to_json(value):
+    # Parameters found by scikit-learn may be numpy scalars or arrays, or estimators
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    return repr(value)
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    """Return the peak resident set size of this process in MB, or None when the platform does not report it."""
+    try:
+        # Linux: the peak since the last reset_peak_rss
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # The peak over the life of the process, in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def reset_peak_rss() -> None:
+    """Start a new peak resident set size measurement where the platform allows it (Linux)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+class PeakMemoryScorer:
+    """
+    Wrap the scorer of a search to record the peak RSS of the process that fitted each candidate.
+
+    The scorer runs in the same process as the fit, right after it, so it reads the peak reached while fitting and
+    scoring the split, then resets it for the next fit. Each call appends the params of the estimator and the peak
+    as one JSON line to log_file_path, which the processes of the search share.
+
+    Args:
+        scorer: The scorer of the search, as returned by check_scoring.
+        log_file_path: The file the records are appended to.
+
+    """
+    def __init__(self, scorer, log_file_path: str):
+        self.scorer = scorer
+        self.log_file_path = log_file_path
+
+
+    def __call__(self, estimator, X, y=None, **kwargs):
+        score = self.scorer(estimator, X, y, **kwargs)
+        record = {"params": estimator.get_params(deep=True), "peak_rss_mb": get_peak_rss_mb()}
+        reset_peak_rss()
+        with open(self.log_file_path, "a") as log_file:
+            log_file.write(json.dumps(record, sort_keys=True, default=_to_json) + "\n")
+        return score
+
+
+def fit_search_with_peak_memory(search, input_feature, output_feature) -> List[Optional[float]]:
+    """
+    Fit a search and return, for every row of its cv_results_, the peak RSS in MB of the processes that fitted it.
+
+    The peak is None where it cannot be measured: searches with several scoring metrics, candidates whose fits
+    all failed and platforms without a peak RSS.
+
+    Args:
+        search: The unfitted search object.
+        input_feature: The features used for training the model.
+        output_feature: The target/dependent feature in the prediction.
+
+    Returns:
+        The peak RSS of each candidate, the largest of its CV splits.
+
+    """
+    try:
+        scoring = search.scoring
+        if isinstance(scoring, (list, tuple, set, dict)):
+            search.fit(input_feature, output_feature)
+            return [None] * len(search.cv_results_["params"])
+
+        file_descriptor, log_file_path = tempfile.mkstemp(suffix=".jsonl")
+        os.close(file_descriptor)
+        try:
+            search.scoring = PeakMemoryScorer(check_scoring(search.estimator, scoring=scoring), log_file_path)
+            search.fit(input_feature, output_feature)
+            with open(log_file_path) as log_file:
+                records = [json.loads(line) for line in log_file]
+        finally:
+            search.scoring = scoring
+            os.remove(log_file_path)
+
+        # Match the records to the candidates by the params the candidates set
+        peaks = {}
+        for candidate in search.cv_results_["params"]:
+            names = tuple(sorted(candidate))
+            if names in peaks:
+                continue
+            peaks[names] = {}
+            for record in records:
+                key = json.dumps({name: record["params"].get(name) for name in names}, sort_keys=True)
+                if record["peak_rss_mb"] is not None:
+                    peaks[names][key] = max(peaks[names].get(key, 0.0), record["peak_rss_mb"])
+        return [peaks[tuple(sorted(candidate))].get(json.dumps(candidate, sort_keys=True, default=_to_json))
+                for candidate in search.cv_results_["params"]]
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def build_search_report(model_cv_results: List[tuple]) -> dict:
+    """
+    Build the telemetry report of a model search.
+
+    CPU-seconds of a candidate are the fit and score wall time of all of its CV splits, counting one CPU per fit. The
+    summary ranks the candidates by mean CV score per CPU-second and totals the CPU-seconds of each model.
+
+    Args:
+        model_cv_results: (model_serial_number, model name, cv_results summary) of each searched model.
+
+    Returns:
+        The report with every candidate, the totals of each model and the ranking.
+
+    """
+    candidates = []
+    models = []
+    for model_serial_number, model_name, cv_results in model_cv_results:
+        model_candidates = []
+        for i, params in enumerate((cv_results or {}).get("params", [])):
+            candidate = {"model_serial_number": model_serial_number, "model": model_name, "params": params}
+            candidate.update({key: values[i] for key, values in cv_results.items() if key != "params"})
+            split_test_scores = candidate.get("split_test_scores")
+            cpu_seconds = None
+            if split_test_scores is not None:
+                cpu_seconds = (candidate["mean_fit_time"] + candidate["mean_score_time"]) * len(split_test_scores)
+            candidate["cpu_seconds"] = cpu_seconds
+            candidate["score_per_cpu_second"] = (candidate["mean_test_score"] / cpu_seconds
+                                                 if cpu_seconds and candidate["mean_test_score"] is not None
+                                                 and not np.isnan(candidate["mean_test_score"]) else None)
+            model_candidates.append(candidate)
+
+        peaks = [candidate["peak_rss_mb"] for candidate in model_candidates
+                 if candidate.get("peak_rss_mb") is not None]
+        scores = [candidate["mean_test_score"] for candidate in model_candidates
+                  if candidate["mean_test_score"] is not None and not np.isnan(candidate["mean_test_score"])]
+        models.append({
+            "model_serial_number": model_serial_number,
+            "model": model_name,
+            "candidates": len(model_candidates),
+            "cpu_seconds": sum(candidate["cpu_seconds"] or 0.0 for candidate in model_candidates),
+            "best_score": max(scores, default=None),
+            "max_peak_rss_mb": max(peaks, default=None),
+        })
+        candidates.extend(model_candidates)
+
+    ranked = sorted((candidate for candidate in candidates if candidate["score_per_cpu_second"] is not None),
+                    key=lambda candidate: candidate["score_per_cpu_second"], reverse=True)
+    ranking = [{key: candidate[key] for key in ("model_serial_number", "model", "params", "mean_test_score",
+                                                "cpu_seconds", "score_per_cpu_second")}
+               for candidate in ranked]
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "models": models,
+        "ranking_by_score_per_cpu_second": ranking,
+        "candidates": candidates,
+    }
+
+
+def write_search_report(file_path: str, report: dict) -> None:
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        with open(file_path, "w") as report_file:
+            json.dump(report, report_file, indent=2, default=_to_json)
+        logging.info(f"Saved the search report of {len(report['candidates'])} candidates to {file_path}")
+    except Exception as e:
+        raise CustomException(e, sys) from e
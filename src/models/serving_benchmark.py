@@ -0,0 +1,64 @@
+import sys
+import time
+from typing import Dict, List
+
+import dill
+import numpy as np
+from pandas import DataFrame
+
+from src.entity.estimator import VisaModel
+from src.exception import CustomException
+from src.logger import logging
+
+
+def get_model_size_mb(visa_model: VisaModel) -> float:
+    """Return the size of the pickled model in MB, as saved by the model trainer and loaded by the serving app."""
+    return len(dill.dumps(visa_model)) / 1024 / 1024
+
+
+def benchmark_visa_model(visa_model: VisaModel, dataframe: DataFrame, batch_sizes: List[int],
+                         repeat: int = 100) -> Dict[int, dict]:
+    """
+    Time the predictions of a model the way the serving app makes them.
+
+    A batch of one row is predicted from a dictionary of columns, like a /predict request; larger batches are
+    predicted from a DataFrame, like a batch request. Batches are sampled from dataframe, with replacement when it
+    has fewer rows than the batch size.
+
+    Args:
+        visa_model: The preprocessor and the fitted model.
+        dataframe: Input features as the serving app receives them.
+        batch_sizes: The numbers of rows predicted at a time.
+        repeat: The number of timed predictions per batch size.
+
+    Returns:
+        The p50, p99 and mean latency in milliseconds of each batch size.
+
+    """
+    try:
+        random_state = np.random.RandomState(0)
+        latencies = {}
+        for batch_size in batch_sizes:
+            batches = [dataframe.iloc[random_state.choice(len(dataframe), size=batch_size,
+                                                          replace=len(dataframe) < batch_size)]
+                       for _ in range(min(repeat, 10))]
+            if batch_size == 1:
+                batches = [batch.to_dict(orient="list") for batch in batches]
+                predict = visa_model.predict_dict
+            else:
+                predict = visa_model.predict
+            # Warm up caches and lazy imports before timing
+            predict(batches[0])
+            timings = []
+            for i in range(repeat):
+                start = time.perf_counter()
+                predict(batches[i % len(batches)])
+                timings.append((time.perf_counter() - start) * 1000)
+            latencies[batch_size] = {"p50_ms": float(np.percentile(timings, 50)),
+                                     "p99_ms": float(np.percentile(timings, 99)),
+                                     "mean_ms": float(np.mean(timings))}
+            logging.info(f"Latency of {type(visa_model.trained_model).__name__} at batch size {batch_size}: "
+                         f"{latencies[batch_size]}")
+        return latencies
+    except Exception as e:
+        raise CustomException(e, sys) from e
@@ -0,0 +1,68 @@
+import os
+import sys
+import mmap
+from collections import namedtuple
+from typing import Optional
+
+import numpy as np
+
+from src.exception import CustomException
+
+
+# A view of a memory-mapped file: the byte position of its first element in the file, its shape, strides and dtype
+SharedArray = namedtuple("SharedArray", ["file_path", "file_offset", "shape", "strides", "dtype"])
+
+
+def get_memmap_root(array: np.ndarray) -> Optional[np.memmap]:
+    """Return the memmap of the file the array is a view of, or None when the array is not backed by a file."""
+    base = array
+    while isinstance(base, np.ndarray):
+        if isinstance(base, np.memmap) and isinstance(base.base, mmap.mmap):
+            return base
+        base = base.base
+    return None
+
+
+def share_array(array: np.ndarray, dir_path: str, name: str) -> SharedArray:
+    """
+    Return a reference to the array that other processes can attach to without copying the data.
+
+    A view of a memory-mapped file, such as a slice of an array loaded by load_numpy_array_data with mmap_mode,
+    refers to that file. Other arrays are saved once to dir_path/name.npy and referred to there.
+
+    Args:
+        array: The array to share.
+        dir_path: The directory of the file of an array that is not memory-mapped yet.
+        name: The file name, without extension, of an array that is not memory-mapped yet.
+
+    Returns:
+        The reference to pass to attach_array in the other processes.
+
+    """
+    try:
+        root = get_memmap_root(array)
+        if root is None or root.filename is None or any(stride < 0 for stride in array.strides):
+            file_path = os.path.join(dir_path, f"{name}.npy")
+            np.save(file_path, array)
+            array = np.load(file_path, mmap_mode="r")
+            root = array
+        file_offset = root.offset + array.__array_interface__["data"][0] - root.__array_interface__["data"][0]
+        return SharedArray(file_path=root.filename, file_offset=file_offset, shape=array.shape,
+                           strides=array.strides, dtype=array.dtype.str)
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def attach_array(shared_array: SharedArray) -> np.ndarray:
+    """Map the array a SharedArray refers to, read-only: the processes that attach to it share its pages."""
+    try:
+        dtype = np.dtype(shared_array.dtype)
+        if 0 in shared_array.shape:
+            return np.empty(shared_array.shape, dtype=dtype)
+        n_bytes = dtype.itemsize + sum((size - 1) * stride for size, stride in zip(shared_array.shape,
+                                                                                   shared_array.strides))
+        buffer = np.memmap(shared_array.file_path, dtype=np.uint8, mode="r", offset=shared_array.file_offset,
+                           shape=(n_bytes,))
+        return np.ndarray(shape=shared_array.shape, dtype=dtype, buffer=buffer, strides=shared_array.strides)
+    except Exception as e:
+        raise CustomException(e, sys) from e
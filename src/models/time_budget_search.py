@@ -0,0 +1,60 @@
+import time
+
+import numpy as np
+from joblib import effective_n_jobs
+from sklearn.model_selection import ParameterGrid, ParameterSampler
+from sklearn.model_selection._search import BaseSearchCV
+
+from src.logger import logging
+
+
+class TimeBudgetSearchCV(BaseSearchCV):
+    """
+    Cross-validate parameter candidates in random order until a wall-clock budget is spent.
+
+    Candidates are drawn from param_distributions like RandomizedSearchCV does and evaluated in batches that keep
+    n_jobs workers busy. A new batch is only started when, at the pace of the previous batches, it is expected to
+    finish within time_budget seconds, so the search ends close to the budget instead of being cut off mid-batch.
+    At least one batch is always evaluated. The fitted attributes are the same as those of GridSearchCV.
+
+    Args:
+        estimator: The estimator to tune.
+        param_distributions: Lists of values or scipy distributions keyed by parameter name, or a list of them.
+        time_budget: The wall-clock budget of the search in seconds.
+        n_iter: The maximum number of candidates; defaults to every combination when all values are lists.
+        batch_size: The number of candidates evaluated at a time; defaults to enough fits for n_jobs workers.
+        random_state: The seed of the candidate order.
+
+    """
+    def __init__(self, estimator, param_distributions, *, time_budget=600.0, n_iter=None, batch_size=None,
+                 random_state=None, scoring=None, n_jobs=None, refit=True, cv=None, verbose=0,
+                 pre_dispatch="2*n_jobs", error_score=np.nan, return_train_score=False):
+        self.param_distributions = param_distributions
+        self.time_budget = time_budget
+        self.n_iter = n_iter
+        self.batch_size = batch_size
+        self.random_state = random_state
+        super().__init__(estimator=estimator, scoring=scoring, n_jobs=n_jobs, refit=refit, cv=cv, verbose=verbose,
+                         pre_dispatch=pre_dispatch, error_score=error_score, return_train_score=return_train_score)
+
+
+    def _run_search(self, evaluate_candidates):
+        if self.time_budget <= 0:
+            raise ValueError(f"time_budget must be positive, got {self.time_budget}")
+        # ParameterGrid raises TypeError for distributions, which need an explicit n_iter
+        n_iter = self.n_iter if self.n_iter is not None else len(ParameterGrid(self.param_distributions))
+        candidate_params = list(ParameterSampler(self.param_distributions, n_iter, random_state=self.random_state))
+        batch_size = self.batch_size or max(1, -(-effective_n_jobs(self.n_jobs) // self.n_splits_))
+
+        start = time.monotonic()
+        n_evaluated = 0
+        while n_evaluated < len(candidate_params):
+            evaluate_candidates(candidate_params[n_evaluated:n_evaluated + batch_size])
+            n_evaluated = min(n_evaluated + batch_size, len(candidate_params))
+            elapsed = time.monotonic() - start
+            seconds_per_candidate = elapsed / n_evaluated
+            if elapsed + seconds_per_candidate * batch_size > self.time_budget:
+                break
+        logging.info(f"Evaluated {n_evaluated} of {len(candidate_params)} candidates of "
+                     f"{type(self.estimator).__name__} in {time.monotonic() - start:.1f}s "
+                     f"(time budget: {self.time_budget}s)")
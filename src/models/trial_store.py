@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from src.exception import CustomException
+from src.logger import logging
+
+
+def _to_json(value):
+    # Parameters and scores found by scikit-learn may be numpy scalars or arrays
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class TrialStore:
+    """
+    Keep the results of hyperparameter trials across training runs in a SQLite file.
+
+    Each entry maps a trial key, a hash of everything that determines the result of a trial (dataset fingerprint,
+    estimator class and params, CV settings), to a JSON document such as the fold scores and timings of the trial.
+    Reads refresh the last use of an entry; when the store holds more than max_entries entries or max_size_mb
+    megabytes of results, the least recently used entries are evicted. Several processes may share the file.
+
+    Args:
+        file_path: The SQLite file, created with its folder on first use.
+        max_entries: The maximum number of entries.
+        max_size_mb: The maximum total size of the stored results in megabytes.
+
+    """
+    def __init__(self, file_path: str, max_entries: int = 100000, max_size_mb: float = 256.0):
+        try:
+            self.file_path = file_path
+            self.max_entries = max_entries
+            self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+            os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+            with self._connect() as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("CREATE TABLE IF NOT EXISTS trials (key TEXT PRIMARY KEY, result TEXT NOT NULL, "
+                                   "size INTEGER NOT NULL, last_used REAL NOT NULL)")
+                connection.execute("CREATE INDEX IF NOT EXISTS trials_last_used ON trials (last_used)")
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    @contextmanager
+    def _connect(self):
+        # Wait for other training processes instead of failing when they hold the write lock
+        connection = sqlite3.connect(self.file_path, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+
+    @staticmethod
+    def get_dataset_fingerprint(input_feature, output_feature) -> str:
+        """Hash the shape, dtype and content of the training data."""
+        digest = hashlib.sha256()
+        for array in (input_feature, output_feature):
+            array = np.ascontiguousarray(array)
+            digest.update(f"{array.shape}{array.dtype}".encode())
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+
+    @staticmethod
+    def get_key(**fields) -> str:
+        """Hash the fields that determine the result of a trial; values that are not JSON are hashed by repr."""
+        document = json.dumps(fields, sort_keys=True, default=repr)
+        return hashlib.sha256(document.encode()).hexdigest()
+
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, dict]:
+        """Return the stored results of the given keys that are in the store."""
+        try:
+            keys = list(keys)
+            results = {}
+            with self._connect() as connection:
+                # SQLite limits the number of parameters of a statement
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = connection.execute(f"SELECT key, result FROM trials WHERE key IN ({placeholders})", chunk)
+                    results.update((key, json.loads(result)) for key, result in rows)
+                    connection.execute(f"UPDATE trials SET last_used = ? WHERE key IN ({placeholders})",
+                                       [time.time(), *chunk])
+            return results
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.get_many([key]).get(key)
+
+
+    def put_many(self, results: Dict[str, dict]) -> None:
+        """Store results by key, then evict the least recently used entries beyond the limits."""
+        try:
+            now = time.time()
+            rows = []
+            for key, result in results.items():
+                document = json.dumps(result, default=_to_json)
+                rows.append((key, document, len(document), now))
+            with self._connect() as connection:
+                connection.executemany("INSERT OR REPLACE INTO trials (key, result, size, last_used) "
+                                       "VALUES (?, ?, ?, ?)", rows)
+                self._evict(connection)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def put(self, key: str, result: dict) -> None:
+        self.put_many({key: result})
+
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        count, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM trials").fetchone()
+        if count <= self.max_entries and size <= self.max_size_bytes:
+            return
+        evicted = 0
+        rows = connection.execute("SELECT key, size FROM trials ORDER BY last_used").fetchall()
+        for key, entry_size in rows:
+            if count - evicted <= self.max_entries and size <= self.max_size_bytes:
+                break
+            evicted += 1
+            size -= entry_size
+        connection.executemany("DELETE FROM trials WHERE key = ?", [(key,) for key, _ in rows[:evicted]])
+        logging.info(f"Evicted {evicted} trials from {self.file_path}")
+
+
+    def stats(self) -> dict:
+        with self._connect() as connection:
+            count, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM trials").fetchone()
+        return {"entries": count, "size_bytes": size, "max_entries": self.max_entries,
+                "max_size_bytes": self.max_size_bytes}
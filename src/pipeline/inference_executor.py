@@ -0,0 +1,136 @@
+import sys
+import asyncio
+import threading
+import multiprocessing
+from functools import partial
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, List, Optional
+
+from pandas import DataFrame
+
+from src.entity.config_entity import VisaPredictonConfig
+from src.pipeline.predict import VisaData, VisaBatchData, VisaClassifier
+from src.pipeline.prediction_cache import get_prediction_cache
+
+from src.exception import CustomException
+from src.logger import logging
+from src.metrics import add_timings, run_with_timings
+
+
+EXECUTOR_TYPES = ("thread", "process")
+
+# The classifier used by the functions below; set per process by initialize_worker
+_worker_classifier: Optional[VisaClassifier] = None
+
+
+def initialize_worker(prediction_pipeline_config: VisaPredictonConfig) -> None:
+    """Creates the worker's classifier and preloads its model so that the first request does not pay for it."""
+    global _worker_classifier
+    _worker_classifier = VisaClassifier(prediction_pipeline_config=prediction_pipeline_config)
+    try:
+        _worker_classifier.get_model_cache().get_model()
+    except Exception as e:
+        # The model may not be trained yet; the first prediction will try to load it again
+        logging.info(f"Failed to preload model in inference worker: {e}")
+
+
+def is_worker_ready() -> bool:
+    return _worker_classifier is not None
+
+
+def predict_visa_data(visa_data: VisaData) -> str:
+    """Returns the case status predicted for a single applicant."""
+    return _worker_classifier.predict_visa_data(visa_data)
+
+
+def get_prediction_cache_stats() -> dict:
+    return get_prediction_cache().stats()
+
+
+def predict_dataframe(dataframe: DataFrame):
+    return _worker_classifier.predict(dataframe=dataframe)
+
+
+def predict_batch_content(content: bytes, data_format: str) -> List[dict]:
+    """Parses and scores an uploaded batch, returning one result per record."""
+    visa_batch_data = VisaBatchData.from_content(content=content, data_format=data_format)
+    return _worker_classifier.predict_batch(visa_batch_data)
+
+
+class InferenceExecutor:
+    """Runs CPU-bound inference outside the asyncio event loop.
+
+    With executor_type "thread" the functions above run in a thread pool sharing this process's model cache.
+    With executor_type "process" they run in a pool of spawned worker processes, each holding its own preloaded
+    model, so that inference does not compete with the event loop for the GIL. The pool is created by start() or on
+    first use.
+    """
+    def __init__(self, prediction_pipeline_config: VisaPredictonConfig = VisaPredictonConfig()):
+        try:
+            self.prediction_pipeline_config = prediction_pipeline_config
+            self.executor_type = prediction_pipeline_config.executor_type
+            self.max_workers = prediction_pipeline_config.executor_workers
+            if self.executor_type not in EXECUTOR_TYPES:
+                raise ValueError(f"Unknown executor type: {self.executor_type}. Expected one of {EXECUTOR_TYPES}")
+            self._executor: Optional[Executor] = None
+            self._executor_lock = threading.Lock()
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = self._create_executor()
+        return self._executor
+
+
+    def _create_executor(self) -> Executor:
+        logging.info(f"Starting {self.executor_type} inference executor with {self.max_workers} workers")
+        if self.executor_type == "process":
+            # Spawn instead of fork: the serving process already runs threads
+            return ProcessPoolExecutor(max_workers=self.max_workers,
+                                       mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=initialize_worker,
+                                       initargs=(self.prediction_pipeline_config,))
+        # Threads share one classifier; initialize it here so that the pool threads do not race on it
+        initialize_worker(self.prediction_pipeline_config)
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+
+
+    def start(self) -> None:
+        """Creates the pool and waits until every worker has loaded its model."""
+        try:
+            executor = self.executor
+            if self.executor_type == "process":
+                # Process pools spawn workers on demand; keep them all busy so that each one gets started
+                futures = [executor.submit(is_worker_ready) for _ in range(self.max_workers)]
+                for future in futures:
+                    future.result()
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    async def run(self, fn: Callable, *args):
+        """Runs fn(*args) in the executor and waits for its result without blocking the event loop.
+
+        The stage timings recorded by fn are added to the current request.
+        """
+        loop = asyncio.get_running_loop()
+        result, timings = await loop.run_in_executor(self.executor, partial(run_with_timings, fn, *args))
+        add_timings(timings)
+        return result
+
+
+    def predict_dataframe(self, dataframe: DataFrame):
+        """Scores dataframe in the executor, blocking the calling thread until the predictions are ready."""
+        return self.executor.submit(predict_dataframe, dataframe).result()
+
+
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
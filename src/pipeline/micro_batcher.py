@@ -0,0 +1,170 @@
+import sys
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import pandas as pd
+from pandas import DataFrame
+
+from src.exception import CustomException
+from src.logger import logging
+from src.constants import PREDICTION_MICRO_BATCH_MAX_SIZE, PREDICTION_MICRO_BATCH_MAX_WAIT_MS
+
+
+# Upper bounds of the histogram buckets reported by MicroBatcherMetrics
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+QUEUE_WAIT_MS_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100)
+
+
+class MicroBatcherMetrics:
+    """Thread-safe counters and cumulative histograms of batch sizes and queue waits."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batch_count = 0
+        self.request_count = 0
+        self.max_batch_size = 0
+        self.queue_wait_ms_sum = 0.0
+        self.max_queue_wait_ms = 0.0
+        self.batch_size_buckets = [0] * len(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms_buckets = [0] * len(QUEUE_WAIT_MS_BUCKETS)
+
+
+    def record_batch(self, queue_waits_ms: List[float]) -> None:
+        batch_size = len(queue_waits_ms)
+        with self._lock:
+            self.batch_count += 1
+            self.request_count += batch_size
+            self.max_batch_size = max(self.max_batch_size, batch_size)
+            for i, bound in enumerate(BATCH_SIZE_BUCKETS):
+                if batch_size <= bound:
+                    self.batch_size_buckets[i] += 1
+            for queue_wait_ms in queue_waits_ms:
+                self.queue_wait_ms_sum += queue_wait_ms
+                self.max_queue_wait_ms = max(self.max_queue_wait_ms, queue_wait_ms)
+                for i, bound in enumerate(QUEUE_WAIT_MS_BUCKETS):
+                    if queue_wait_ms <= bound:
+                        self.queue_wait_ms_buckets[i] += 1
+
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "batch_count": self.batch_count,
+                "request_count": self.request_count,
+                "mean_batch_size": self.request_count / self.batch_count if self.batch_count else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "batch_size_buckets": dict(zip(BATCH_SIZE_BUCKETS, self.batch_size_buckets)),
+                "mean_queue_wait_ms": self.queue_wait_ms_sum / self.request_count if self.request_count else 0.0,
+                "max_queue_wait_ms": self.max_queue_wait_ms,
+                "queue_wait_ms_buckets": dict(zip(QUEUE_WAIT_MS_BUCKETS, self.queue_wait_ms_buckets)),
+            }
+
+
+class MicroBatcher:
+    """Groups concurrent single-row predictions into one call of predict_fn.
+
+    A background thread takes the first queued request, then keeps collecting requests until either
+    max_batch_size rows are queued or max_wait_ms has passed since the first one arrived. The rows are
+    concatenated into one DataFrame, scored with a single predict_fn call and each caller's future is resolved
+    with the predictions of its own rows.
+    """
+    def __init__(self,
+                 predict_fn: Callable[[DataFrame], Sequence],
+                 max_batch_size: int = PREDICTION_MICRO_BATCH_MAX_SIZE,
+                 max_wait_ms: float = PREDICTION_MICRO_BATCH_MAX_WAIT_MS,
+                 name: str = "micro-batcher"):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.name = name
+        self.metrics = MicroBatcherMetrics()
+        self._queue: "queue.Queue[Tuple[DataFrame, Future, float]]" = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+
+    def submit(self, dataframe: DataFrame) -> Future:
+        """Queues dataframe for prediction and returns a future resolved with its predictions."""
+        try:
+            future = Future()
+            self._queue.put((dataframe, future, time.perf_counter()))
+            self._ensure_worker()
+            return future
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+
+    def _run(self) -> None:
+        max_wait = self.max_wait_ms / 1000
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0][2] + max_wait
+            while len(batch) < self.max_batch_size:
+                # Requests that are already queued join the batch even when the deadline has passed
+                timeout = max(deadline - time.perf_counter(), 0)
+                try:
+                    batch.append(self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._predict_batch(batch)
+
+
+    def _predict_batch(self, batch: List[Tuple[DataFrame, Future, float]]) -> None:
+        started = time.perf_counter()
+        self.metrics.record_batch([(started - enqueued) * 1000 for _, _, enqueued in batch])
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            dataframe = pd.concat([item[0] for item in batch], ignore_index=True)
+            predictions = self.predict_fn(dataframe)
+            offset = 0
+            for item_dataframe, future, _ in batch:
+                future.set_result(predictions[offset:offset + len(item_dataframe)])
+                offset += len(item_dataframe)
+        except Exception as batch_error:
+            logging.info(f"Batch of {len(batch)} failed, predicting requests one by one: {batch_error}")
+            # Score each request on its own so that only the failing ones receive the error
+            for item_dataframe, future, _ in batch:
+                try:
+                    future.set_result(self.predict_fn(item_dataframe))
+                except Exception as e:
+                    future.set_exception(e)
+
+
+_micro_batchers: Dict[str, MicroBatcher] = {}
+_micro_batchers_lock = threading.Lock()
+
+
+def get_micro_batcher(key: str,
+                      predict_fn: Callable[[DataFrame], Sequence],
+                      max_batch_size: int = PREDICTION_MICRO_BATCH_MAX_SIZE,
+                      max_wait_ms: float = PREDICTION_MICRO_BATCH_MAX_WAIT_MS) -> MicroBatcher:
+    """Returns the process-wide MicroBatcher registered under key, creating it on first use."""
+    micro_batcher = _micro_batchers.get(key)
+    if micro_batcher is None:
+        with _micro_batchers_lock:
+            micro_batcher = _micro_batchers.get(key)
+            if micro_batcher is None:
+                micro_batcher = MicroBatcher(predict_fn=predict_fn,
+                                             max_batch_size=max_batch_size,
+                                             max_wait_ms=max_wait_ms,
+                                             name=f"micro-batcher-{len(_micro_batchers)}")
+                _micro_batchers[key] = micro_batcher
+    return micro_batcher
+
+
+def get_micro_batcher_metrics() -> Dict[str, dict]:
+    """Returns a metrics snapshot of every MicroBatcher in the process, keyed by its registration key."""
+    return {key: micro_batcher.metrics.snapshot() for key, micro_batcher in list(_micro_batchers.items())}
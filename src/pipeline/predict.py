@@ -1,16 +1,39 @@
 import sys
+import json
+from concurrent.futures import Future
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import pandas as pd
 from pandas import DataFrame
-import os
-from src.utils import load_object
 
 from src.entity.config_entity import VisaPredictonConfig
-from src.entity.s3_estimator import VisaEstimator
+from src.entity.model_cache import ModelCache, LocalModelSource, S3ModelSource, get_model_cache
+from src.pipeline.micro_batcher import get_micro_batcher
+from src.pipeline.prediction_cache import get_prediction_cache
 
 from src.exception import CustomException
 from src.logger import logging
+from src.metrics import measure
 from src.constants import CURRENT_YEAR
 
 
+CATEGORICAL_INPUT_COLUMNS = ["continent", "education_of_employee", "has_job_experience", "requires_job_training",
+                             "region_of_employment", "unit_of_wage", "full_time_position"]
+INTEGER_INPUT_COLUMNS = ["no_of_employees", "yr_of_estab"]
+FLOAT_INPUT_COLUMNS = ["prevailing_wage"]
+# Column order of the DataFrame built by VisaData.convert_to_dataframe
+MODEL_INPUT_COLUMNS = ["continent", "education_of_employee", "has_job_experience", "requires_job_training",
+                       "no_of_employees", "region_of_employment", "prevailing_wage", "unit_of_wage",
+                       "full_time_position", "company_age"]
+BATCH_DATA_FORMATS = ("json", "jsonl", "csv")
+
+
+def get_case_status(outcome) -> str:
+    """Maps a model outcome to the case status shown to the user."""
+    return "Certified" if outcome == 1 else "Denied"
+
+
 class VisaData:
     def __init__(self, continent: str, employee_education: str, has_job_experience: str,
                  requires_job_training: str, no_of_employees: int, region_of_employment: str,
@@ -34,12 +57,21 @@ class VisaData:
     def convert_to_dataframe(self) -> DataFrame:
         """Converts visa data to DataFrame and returns the DataFrame."""
         try:
-            visa_dict = self.convert_to_dict()
-            return DataFrame(visa_dict)
+            with measure("build_dataframe"):
+                visa_dict = self.convert_to_dict()
+                return DataFrame(visa_dict)
         except Exception as e:
             raise CustomException(e, sys) from e
 
 
+    def get_cache_key(self) -> tuple:
+        """Returns the model features of the applicant as a tuple of canonical Python values."""
+        return (str(self.continent), str(self.employee_education), str(self.has_job_experience),
+                str(self.requires_job_training), int(self.no_of_employees), str(self.region_of_employment),
+                float(self.prevailing_wage), str(self.unit_of_wage), str(self.full_time_position),
+                int(self.company_age))
+
+
     def convert_to_dict(self):
         """Converts visa data to dictionary and returns the dictionary."""
         logging.info("Entered convert_to_dict method of VisaData class")
@@ -63,6 +95,116 @@ class VisaData:
             raise CustomException(e, sys) from e
 
 
+class VisaBatchData:
+    """Holds a batch of raw visa applications, one row per record in the uploaded order.
+
+    Records are validated together column by column; rows that fail validation are reported by row number
+    and left out of the DataFrame passed to the model.
+    """
+    def __init__(self, dataframe: DataFrame, errors: Optional[Dict[int, str]] = None):
+        try:
+            self.dataframe = dataframe.reset_index(drop=True)
+            self.errors: Dict[int, str] = dict(errors or {})
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def __len__(self) -> int:
+        return len(self.dataframe)
+
+
+    @classmethod
+    def from_content(cls, content: bytes, data_format: str) -> "VisaBatchData":
+        """Parses a JSON array, JSON Lines or CSV payload into a VisaBatchData."""
+        try:
+            if data_format == "json":
+                records = json.loads(content)
+                if not isinstance(records, list):
+                    raise ValueError("Expected a JSON array of records")
+                return cls.from_records(records)
+            if data_format == "jsonl":
+                records, errors = [], {}
+                lines = [line for line in content.splitlines() if line.strip()]
+                for row, line in enumerate(lines):
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError as e:
+                        records.append(None)
+                        errors[row] = f"Invalid JSON: {e}"
+                return cls.from_records(records, errors=errors)
+            if data_format == "csv":
+                dataframe = pd.read_csv(BytesIO(content), dtype=str, keep_default_na=False, na_values=[""])
+                return cls(dataframe)
+            raise ValueError(f"Unsupported batch format: {data_format}. Expected one of {BATCH_DATA_FORMATS}")
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    @classmethod
+    def from_records(cls, records: list, errors: Optional[Dict[int, str]] = None) -> "VisaBatchData":
+        errors = dict(errors or {})
+        for row, record in enumerate(records):
+            if not isinstance(record, dict):
+                records[row] = {}
+                errors.setdefault(row, "Expected a JSON object")
+        return cls(DataFrame(records), errors=errors)
+
+
+    def convert_to_dataframe(self,
+                             known_categories: Optional[Dict[str, Set[str]]] = None) -> Tuple[DataFrame, Dict[int, str]]:
+        """Validates all rows and returns the DataFrame of valid rows, indexed by row number, with the row errors."""
+        logging.info("Entered convert_to_dataframe method of VisaBatchData class")
+        try:
+            known_categories = known_categories or {}
+            dataframe = self.dataframe
+            problems: Dict[int, List[str]] = {row: [message] for row, message in self.errors.items()}
+
+            def add_problems(mask: pd.Series, describe) -> None:
+                for row in mask.index[mask.to_numpy()]:
+                    # Rows that could not be parsed only report the parse error
+                    if row not in self.errors:
+                        problems.setdefault(row, []).append(describe(row))
+
+            columns = {}
+            for column in CATEGORICAL_INPUT_COLUMNS + INTEGER_INPUT_COLUMNS + FLOAT_INPUT_COLUMNS:
+                if column not in dataframe.columns:
+                    add_problems(pd.Series(True, index=dataframe.index), lambda row, c=column: f"{c} is required")
+                    continue
+                values = dataframe[column]
+                missing = values.isna()
+                add_problems(missing, lambda row, c=column: f"{c} is required")
+                if column in CATEGORICAL_INPUT_COLUMNS:
+                    values = values.astype(str)
+                    if column in known_categories:
+                        unknown = ~missing & ~values.isin(known_categories[column])
+                        add_problems(unknown, lambda row, c=column, v=values: f"{c} has unknown value '{v[row]}'")
+                else:
+                    numbers = pd.to_numeric(values, errors="coerce")
+                    invalid = ~missing & numbers.isna()
+                    if column in INTEGER_INPUT_COLUMNS:
+                        invalid |= ~numbers.isna() & (numbers % 1 != 0)
+                    add_problems(invalid, lambda row, c=column, v=values: f"{c} has invalid number '{v[row]}'")
+                    values = numbers
+                columns[column] = values
+
+            errors = {row: "; ".join(messages) for row, messages in problems.items()}
+            valid_rows = dataframe.index.difference(list(errors))
+            visa_df = DataFrame({column: values.loc[valid_rows] for column, values in columns.items()},
+                                index=valid_rows)
+            if len(visa_df) > 0:
+                for column in INTEGER_INPUT_COLUMNS:
+                    visa_df[column] = visa_df[column].astype(int)
+                visa_df["company_age"] = CURRENT_YEAR - visa_df.pop("yr_of_estab")
+                visa_df = visa_df[MODEL_INPUT_COLUMNS]
+            else:
+                visa_df = DataFrame(columns=MODEL_INPUT_COLUMNS)
+            logging.info(f"Validated {len(dataframe)} records: {len(visa_df)} valid, {len(errors)} invalid")
+            logging.info("Exited convert_to_dataframe method of VisaBatchData class")
+            return visa_df, errors
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
 class VisaClassifier:
     def __init__(self, prediction_pipeline_config: VisaPredictonConfig = VisaPredictonConfig()) -> None:
         try:
@@ -71,14 +213,80 @@ class VisaClassifier:
             raise CustomException(e, sys) from e
 
 
+    def get_s3_model_cache(self) -> ModelCache:
+        """Returns the process-wide cache of the production model in s3 bucket."""
+        model_source = S3ModelSource(bucket_name=self.prediction_pipeline_config.model_bucket_name,
+                                     model_path=self.prediction_pipeline_config.model_file_path)
+        return get_model_cache(model_source,
+                               check_interval=self.prediction_pipeline_config.model_check_interval,
+                               fast_encoder=self.prediction_pipeline_config.fast_encoder)
+
+
+    def get_local_model_cache(self) -> ModelCache:
+        """Returns the process-wide cache of the model trained in local artifact folder."""
+        model_source = LocalModelSource(file_path=self.prediction_pipeline_config.local_model_file_path)
+        return get_model_cache(model_source,
+                               check_interval=self.prediction_pipeline_config.model_check_interval,
+                               fast_encoder=self.prediction_pipeline_config.fast_encoder)
+
+
+    def get_model_cache(self) -> ModelCache:
+        """Returns the cache of the model selected by the use_s3 setting of the prediction config."""
+        if self.prediction_pipeline_config.use_s3:
+            return self.get_s3_model_cache()
+        return self.get_local_model_cache()
+
+
+    def predict(self, dataframe: DataFrame) -> str:
+        """Returns the prediction result of the model selected by the use_s3 setting of the prediction config."""
+        try:
+            logging.info("Entered predict method of VisaClassifier class")
+            model = self.get_model_cache().get_model()
+            return model.predict(dataframe)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def predict_dict(self, visa_dict: dict) -> str:
+        """Returns the prediction result for raw values keyed by column name, as built by VisaData.convert_to_dict."""
+        try:
+            model = self.get_model_cache().get_model()
+            return model.predict_dict(visa_dict)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def predict_visa_data(self, visa_data: VisaData) -> str:
+        """Returns the case status predicted for one applicant, from the prediction cache when it is enabled."""
+        try:
+            model_cache = self.get_model_cache()
+            # A single read, so that a concurrent reload cannot store the prediction of one model under the
+            # version of another
+            model, version = model_cache.get_model_and_version()
+            if not self.prediction_pipeline_config.prediction_cache:
+                with measure("build_dataframe"):
+                    visa_dict = visa_data.convert_to_dict()
+                return get_case_status(model.predict_dict(visa_dict)[0])
+
+            prediction_cache = get_prediction_cache()
+            cache_key = visa_data.get_cache_key()
+            model_version = (model_cache.model_source.key, version)
+            status = prediction_cache.get(cache_key, model_version=model_version)
+            if status is None:
+                with measure("build_dataframe"):
+                    visa_dict = visa_data.convert_to_dict()
+                status = get_case_status(model.predict_dict(visa_dict)[0])
+                prediction_cache.put(cache_key, status, model_version=model_version)
+            return status
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
     def predict_s3(self, dataframe: DataFrame) -> str:
         """Returns the prediction result in string format for production use (AWS S3)."""
         try:
             logging.info("Entered predict method of VisaClassifier class")
-            model = VisaEstimator(
-                bucket_name=self.prediction_pipeline_config.model_bucket_name,
-                model_path=self.prediction_pipeline_config.model_file_path
-            )
+            model = self.get_s3_model_cache().get_model()
             result = model.predict(dataframe)
             return result
         except Exception as e:
@@ -89,14 +297,75 @@ class VisaClassifier:
         """Returns the prediction result in string format for local deployment."""
         try:
             logging.info("Entered predict method of VisaClassifier class")
-            # Change the model_path as needed after model training
-            model_path = os.path.join("artifact/02_20_2025_13_04_04/model_trainer/trained_model", "model.pkl")
-            print("Start loading")
-            model = load_object(file_path=model_path)
-            print("Completed loading")
-            print(dataframe)
+            model = self.get_local_model_cache().get_model()
             result = model.predict(dataframe)
-            print("Completed predicting: ", result)
+            logging.info(f"Completed predicting: {result}")
             return result
         except Exception as e:
             raise CustomException(e, sys) from e
+
+
+    def submit_to_micro_batcher(self, dataframe: DataFrame,
+                                predict_fn: Optional[Callable[[DataFrame], Sequence]] = None) -> Future:
+        """Queues dataframe to be scored together with concurrent requests and returns a future of the result.
+
+        Args:
+            dataframe: The rows to be scored.
+            predict_fn: The function that scores each batch; defaults to the cached model's predict. Only used
+                when the micro-batcher of the model is created.
+
+        Returns:
+            The future resolved with the predictions of dataframe.
+
+        """
+        try:
+            model_cache = self.get_model_cache()
+            if predict_fn is None:
+                predict_fn = lambda batch_df: model_cache.get_model().predict(batch_df)
+            micro_batcher = get_micro_batcher(
+                key=model_cache.model_source.key,
+                predict_fn=predict_fn,
+                max_batch_size=self.prediction_pipeline_config.micro_batch_max_size,
+                max_wait_ms=self.prediction_pipeline_config.micro_batch_max_wait_ms
+            )
+            return micro_batcher.submit(dataframe)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def predict_batch(self, visa_batch_data: VisaBatchData) -> List[dict]:
+        """Returns one result per record: the case status, or the error that prevented the prediction."""
+        try:
+            logging.info("Entered predict_batch method of VisaClassifier class")
+            if len(visa_batch_data) > self.prediction_pipeline_config.batch_max_records:
+                raise ValueError(f"Batch of {len(visa_batch_data)} records exceeds the limit of "
+                                 f"{self.prediction_pipeline_config.batch_max_records}")
+            model = self.get_model_cache().get_model()
+            with measure("build_dataframe"):
+                dataframe, errors = visa_batch_data.convert_to_dataframe(
+                    known_categories=model.get_known_categories())
+
+            outcomes = {}
+            chunk_size = self.prediction_pipeline_config.batch_chunk_size
+            for start in range(0, len(dataframe), chunk_size):
+                chunk = dataframe.iloc[start:start + chunk_size]
+                try:
+                    outcomes.update(zip(chunk.index, model.predict(chunk)))
+                except Exception:
+                    # Isolate the rows that break the chunk instead of failing all of them
+                    for row in chunk.index:
+                        try:
+                            outcomes[row] = model.predict(chunk.loc[[row]])[0]
+                        except Exception as e:
+                            errors[row] = str(e)
+
+            results = []
+            for row in range(len(visa_batch_data)):
+                if row in errors:
+                    results.append({"row": row, "error": errors[row]})
+                else:
+                    results.append({"row": row, "context": get_case_status(outcomes[row])})
+            logging.info("Exited predict_batch method of VisaClassifier class")
+            return results
+        except Exception as e:
+            raise CustomException(e, sys) from e
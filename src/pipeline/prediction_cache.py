@@ -0,0 +1,105 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from src.logger import logging
+from src.constants import PREDICTION_CACHE_MAX_SIZE, PREDICTION_CACHE_TTL_SECONDS, PREDICTION_CACHE_EVICTION
+
+
+EVICTION_POLICIES = ("lru", "fifo")
+
+
+class PredictionCache:
+    """Bounded cache of predictions keyed by normalized applicant features.
+
+    Entries expire ttl_seconds after they are stored. When the cache is full, the least recently used entry
+    ("lru") or the oldest stored entry ("fifo") is evicted. Every lookup and store carries the version of the
+    model that made the prediction; a version different from the one of the cached entries clears the cache.
+    """
+    def __init__(self, max_size: int = PREDICTION_CACHE_MAX_SIZE, ttl_seconds: float = PREDICTION_CACHE_TTL_SECONDS,
+                 eviction: str = PREDICTION_CACHE_EVICTION):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy: {eviction}. Expected one of {EVICTION_POLICIES}")
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.eviction = eviction
+        self._entries: "OrderedDict[Hashable, Tuple[object, float]]" = OrderedDict()
+        self._model_version: Optional[Hashable] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+
+    def get(self, key: Hashable, model_version: Hashable):
+        """Returns the cached prediction for key, or None when it is missing or expired."""
+        with self._lock:
+            self._check_model_version(model_version)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            if self.eviction == "lru":
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+
+    def put(self, key: Hashable, value, model_version: Hashable) -> None:
+        with self._lock:
+            self._check_model_version(model_version)
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+    def _check_model_version(self, model_version: Hashable) -> None:
+        if model_version != self._model_version:
+            if self._entries:
+                logging.info(f"Model version changed to {model_version}, clearing {len(self._entries)} predictions")
+                self.invalidations += 1
+            self._entries.clear()
+            self._model_version = model_version
+
+
+_prediction_cache: Optional[PredictionCache] = None
+_prediction_cache_lock = threading.Lock()
+
+
+def get_prediction_cache() -> PredictionCache:
+    """Returns the process-wide PredictionCache, creating it on first use."""
+    global _prediction_cache
+    if _prediction_cache is None:
+        with _prediction_cache_lock:
+            if _prediction_cache is None:
+                _prediction_cache = PredictionCache()
+    return _prediction_cache
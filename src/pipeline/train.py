@@ -1,7 +1,12 @@
+import os
 import sys
+from typing import Callable, Optional
 
 from src.logger import logging
 from src.exception import CustomException
+from src.constants import ARTIFACT_DIR, TRAIN_PIPELINE_CHECKPOINT_FILE_NAME
+from src.utils import load_object, save_object
+from src.entity.artifact_cache import ArtifactCache
 
 from src.components.data_ingestion import DataIngestion
 from src.components.data_validation import DataValidation
@@ -10,12 +15,15 @@ from src.components.model_trainer import ModelTrainer
 from src.components.model_evaluation import ModelEvaluation
 from src.components.model_pusher import ModelPusher
 
-from src.entity.config_entity import (DataIngestionConfig,
+from src.entity.config_entity import (TrainingPipelineConfig,
+                                      DataIngestionConfig,
                                       DataValidationConfig,
                                       DataTransformationConfig,
                                       ModelTrainerConfig,
                                       ModelEvaluationConfig,
-                                      ModelPusherConfig)
+                                      ModelPusherConfig,
+                                      training_pipeline_config,
+                                      rebase_artifact_dir)
 
 from src.entity.artifact_entity import (DataIngestionArtifact,
                                         DataValidationArtifact,
@@ -26,13 +34,100 @@ from src.entity.artifact_entity import (DataIngestionArtifact,
 
 
 class TrainPipeline:
-    def __init__(self):
-        self.data_ingestion_config = DataIngestionConfig()
-        self.data_validation_config = DataValidationConfig()
-        self.data_transformation_config = DataTransformationConfig()
-        self.model_trainer_config = ModelTrainerConfig()
-        self.model_evaluation_config = ModelEvaluationConfig()
-        self.model_pusher_config = ModelPusherConfig()
+    def __init__(self, stage_callback: Optional[Callable[[str], None]] = None,
+                 resume_timestamp: Optional[str] = None):
+        """
+        Args:
+            stage_callback: Called with the name of each stage in TRAIN_PIPELINE_STAGES before the stage starts.
+            resume_timestamp: The timestamp of an interrupted run to continue in its artifact folder instead of
+                starting a new run. Its finished stages are not repeated and its model search only fits the trials
+                that are not in its checkpoint yet.
+
+        """
+        try:
+            self.training_pipeline_config = training_pipeline_config
+            self.data_ingestion_config = DataIngestionConfig()
+            self.data_validation_config = DataValidationConfig()
+            self.data_transformation_config = DataTransformationConfig()
+            self.model_trainer_config = ModelTrainerConfig()
+            self.model_evaluation_config = ModelEvaluationConfig()
+            self.model_pusher_config = ModelPusherConfig()
+            self.stage_callback = stage_callback
+            # Artifacts of the finished stages by stage name, saved to the checkpoint file after each stage
+            self.completed_stages: dict = {}
+            # Hands the artifacts of run_pipeline from stage to stage in memory; the stages read them from disk
+            # when started on their own
+            self.artifact_cache: Optional[ArtifactCache] = None
+            if resume_timestamp is not None:
+                self.resume_run(resume_timestamp)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def resume_run(self, timestamp: str) -> None:
+        """Points every stage to the artifact folder of the run with this timestamp and loads its checkpoint."""
+        artifact_dir = os.path.join(ARTIFACT_DIR, timestamp)
+        self.training_pipeline_config = TrainingPipelineConfig(
+            artifact_dir=artifact_dir,
+            timestamp=timestamp,
+            checkpoint_file_path=os.path.join(artifact_dir, TRAIN_PIPELINE_CHECKPOINT_FILE_NAME)
+        )
+        if not os.path.exists(self.training_pipeline_config.checkpoint_file_path):
+            raise CustomException(f"No checkpoint of the train pipeline in {artifact_dir}")
+        self.data_ingestion_config = rebase_artifact_dir(self.data_ingestion_config, artifact_dir)
+        self.data_validation_config = rebase_artifact_dir(self.data_validation_config, artifact_dir)
+        self.data_transformation_config = rebase_artifact_dir(self.data_transformation_config, artifact_dir)
+        self.model_trainer_config = rebase_artifact_dir(self.model_trainer_config, artifact_dir)
+        checkpoint = load_object(self.training_pipeline_config.checkpoint_file_path)
+        self.completed_stages = checkpoint["completed_stages"]
+        logging.info(f"Resuming the train pipeline run {timestamp} after the stages: {list(self.completed_stages)}")
+
+
+    @staticmethod
+    def find_interrupted_run() -> Optional[str]:
+        """Returns the timestamp of the latest checkpointed run if it did not finish, otherwise None."""
+        try:
+            checkpoint_file_paths = [os.path.join(ARTIFACT_DIR, timestamp, TRAIN_PIPELINE_CHECKPOINT_FILE_NAME)
+                                     for timestamp in os.listdir(ARTIFACT_DIR)] if os.path.isdir(ARTIFACT_DIR) else []
+            checkpoint_file_paths = [file_path for file_path in checkpoint_file_paths if os.path.exists(file_path)]
+            if not checkpoint_file_paths:
+                return None
+            latest_file_path = max(checkpoint_file_paths, key=os.path.getmtime)
+            if load_object(latest_file_path)["finished"]:
+                return None
+            return os.path.basename(os.path.dirname(latest_file_path))
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def save_checkpoint(self, finished: bool = False, completed_stages: Optional[dict] = None) -> None:
+        # Write a new file and swap it in, so that a run killed while saving keeps its previous checkpoint
+        checkpoint_file_path = self.training_pipeline_config.checkpoint_file_path
+        completed_stages = completed_stages if completed_stages is not None else self.completed_stages
+        save_object(f"{checkpoint_file_path}.tmp", {"completed_stages": completed_stages, "finished": finished})
+        os.replace(f"{checkpoint_file_path}.tmp", checkpoint_file_path)
+
+
+    def run_stage(self, stage: str, start_stage: Callable, **kwargs):
+        """Runs a stage and checkpoints its artifact, or returns the artifact of a stage the resumed run finished."""
+        self.report_stage(stage)
+        if stage in self.completed_stages:
+            logging.info(f"Skipping {stage} stage, finished by run {self.training_pipeline_config.timestamp}")
+            return self.completed_stages[stage]
+        artifact = start_stage(**kwargs)
+        self.completed_stages[stage] = artifact
+        if self.artifact_cache is not None:
+            # Queued after the artifact writes of the stage, so a checkpointed stage has its files on disk
+            self.artifact_cache.submit(self.save_checkpoint, completed_stages=dict(self.completed_stages))
+        else:
+            self.save_checkpoint()
+        return artifact
+
+
+    def report_stage(self, stage: str) -> None:
+        logging.info(f"Starting {stage} stage of the train pipeline")
+        if self.stage_callback is not None:
+            self.stage_callback(stage)
 
 
     def start_data_ingestion(self) -> DataIngestionArtifact:
@@ -40,7 +135,8 @@ class TrainPipeline:
         try:
             logging.info("Entered the start_data_ingestion method of TrainPipeline class")
             logging.info("Retrieving data from MongoDB")
-            data_ingestion = DataIngestion(data_ingestion_config=self.data_ingestion_config)
+            data_ingestion = DataIngestion(data_ingestion_config=self.data_ingestion_config,
+                                           artifact_cache=self.artifact_cache)
             data_ingestion_artifact = data_ingestion.initiate_data_ingestion()
             logging.info("Retrieved train_set and test_set from MongoDB")
             logging.info("Exited the start_data_ingestion method of TrainPipeline class")
@@ -54,7 +150,8 @@ class TrainPipeline:
         logging.info("Entered the start_data_validation method of TrainPipeline class")
         try:
             data_validation = DataValidation(data_ingestion_artifact=data_ingestion_artifact,
-                                             data_validation_config=self.data_validation_config)
+                                             data_validation_config=self.data_validation_config,
+                                             artifact_cache=self.artifact_cache)
             data_validation_artifact = data_validation.initiate_data_validation()
             logging.info("Performed the data validation operation")
             logging.info("Exited the start_data_validation method of TrainPipeline class")
@@ -70,18 +167,23 @@ class TrainPipeline:
         try:
             data_transformation = DataTransformation(data_ingestion_artifact=data_ingestion_artifact,
                                                      data_transformation_config=self.data_transformation_config,
-                                                     data_validation_artifact=data_validation_artifact)
+                                                     data_validation_artifact=data_validation_artifact,
+                                                     artifact_cache=self.artifact_cache)
             data_transformation_artifact = data_transformation.initiate_data_transformation()
             return data_transformation_artifact
         except Exception as e:
             raise CustomException(e, sys) from e
 
 
-    def start_model_trainer(self, data_transformation_artifact: DataTransformationArtifact) -> ModelTrainerArtifact:
+    def start_model_trainer(self,
+                            data_transformation_artifact: DataTransformationArtifact,
+                            data_validation_artifact: Optional[DataValidationArtifact] = None) -> ModelTrainerArtifact:
         """Kickstarts model trainer component and returns the model trainer artifact."""
         try:
             model_trainer = ModelTrainer(data_transformation_artifact=data_transformation_artifact,
-                                         model_trainer_config=self.model_trainer_config)
+                                         model_trainer_config=self.model_trainer_config,
+                                         data_validation_artifact=data_validation_artifact,
+                                         artifact_cache=self.artifact_cache)
             model_trainer_artifact = model_trainer.initiate_model_trainer()
             return model_trainer_artifact
         except Exception as e:
@@ -95,7 +197,8 @@ class TrainPipeline:
         try:
             model_evaluation = ModelEvaluation(model_eval_config=self.model_evaluation_config,
                                                data_ingestion_artifact=data_ingestion_artifact,
-                                               model_trainer_artifact=model_trainer_artifact)
+                                               model_trainer_artifact=model_trainer_artifact,
+                                               artifact_cache=self.artifact_cache)
             model_evaluation_artifact = model_evaluation.initiate_model_evaluation()
             return model_evaluation_artifact
         except Exception as e:
@@ -113,21 +216,43 @@ class TrainPipeline:
             raise CustomException(e, sys) from e
 
 
-    def run_pipeline(self) -> None:
-        """Run the complete train pipeline."""
+    def run_pipeline(self) -> Optional[ModelPusherArtifact]:
+        """
+        Run the complete train pipeline and return the model pusher artifact if the model was accepted.
+
+        The stages hand their artifacts over in memory while the files are written in the background. The writes
+        are waited for before the model is pushed from its file and before the run is checkpointed as finished.
+
+        """
+        self.artifact_cache = ArtifactCache()
         try:
-            data_ingestion_artifact = self.start_data_ingestion()
-            data_validation_artifact = self.start_data_validation(data_ingestion_artifact=data_ingestion_artifact)
-            data_transformation_artifact = self.start_data_transformation(
-                data_ingestion_artifact=data_ingestion_artifact,
-                data_validation_artifact=data_validation_artifact
-            )
-            model_trainer_artifact = self.start_model_trainer(data_transformation_artifact=data_transformation_artifact)
-            model_evaluation_artifact = self.start_model_evaluation(data_ingestion_artifact=data_ingestion_artifact,
-                                                                    model_trainer_artifact=model_trainer_artifact)
+            data_ingestion_artifact = self.run_stage("data_ingestion", self.start_data_ingestion)
+            data_validation_artifact = self.run_stage("data_validation", self.start_data_validation,
+                                                      data_ingestion_artifact=data_ingestion_artifact)
+            data_transformation_artifact = self.run_stage("data_transformation", self.start_data_transformation,
+                                                          data_ingestion_artifact=data_ingestion_artifact,
+                                                          data_validation_artifact=data_validation_artifact)
+            model_trainer_artifact = self.run_stage("model_trainer", self.start_model_trainer,
+                                                    data_transformation_artifact=data_transformation_artifact,
+                                                    data_validation_artifact=data_validation_artifact)
+            model_evaluation_artifact = self.run_stage("model_evaluation", self.start_model_evaluation,
+                                                       data_ingestion_artifact=data_ingestion_artifact,
+                                                       model_trainer_artifact=model_trainer_artifact)
+            self.artifact_cache.flush()
             if not model_evaluation_artifact.is_model_accepted:
                 logging.info(f"Model is not accepted")
+                self.save_checkpoint(finished=True)
                 return None
-            model_pusher_artifact = self.start_model_pusher(model_evaluation_artifact=model_evaluation_artifact)
+            model_pusher_artifact = self.run_stage("model_pusher", self.start_model_pusher,
+                                                   model_evaluation_artifact=model_evaluation_artifact)
+            self.artifact_cache.flush()
+            self.save_checkpoint(finished=True)
+            return model_pusher_artifact
         except Exception as e:
+            artifact_cache, self.artifact_cache = self.artifact_cache, None
+            artifact_cache.close(raise_errors=False)
             raise CustomException(e, sys) from e
+        finally:
+            if self.artifact_cache is not None:
+                artifact_cache, self.artifact_cache = self.artifact_cache, None
+                artifact_cache.close()
@@ -0,0 +1,253 @@
+import os
+import sys
+import uuid
+import queue
+import signal
+import threading
+import multiprocessing
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from src.entity.config_entity import TrainingJobConfig
+from src.constants import TRAIN_PIPELINE_STAGES
+
+from src.exception import CustomException
+from src.logger import logging
+
+
+# Keep this module free of heavy imports: the job process imports it before its CPU budget is applied
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_JOB_STATUSES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+
+@dataclass
+class TrainingJob:
+    job_id: str
+    resume: bool = False
+    status: str = JOB_QUEUED
+    stage: Optional[str] = None
+    completed_stages: List[str] = field(default_factory=list)
+    progress: float = 0.0
+    message: Optional[str] = None
+    # Whether a succeeded run pushed its model, or rejected it in the model evaluation
+    model_accepted: Optional[bool] = None
+    submitted_at: str = field(default_factory=lambda: datetime.now().isoformat(timespec="seconds"))
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def apply_cpu_budget(cpu_budget: int, niceness: int) -> None:
+    """Restricts the current process to cpu_budget CPUs and lowers its scheduling priority."""
+    if cpu_budget > 0:
+        # Native thread pools read these when numpy/scikit-learn are first imported
+        for env_key in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "LOKY_MAX_CPU_COUNT"):
+            os.environ[env_key] = str(cpu_budget)
+        if hasattr(os, "sched_setaffinity"):
+            # Use the highest numbered CPUs and leave the lowest ones to the serving process
+            cpus = sorted(os.sched_getaffinity(0))
+            os.sched_setaffinity(0, cpus[-cpu_budget:])
+    if niceness > 0 and hasattr(os, "nice"):
+        os.nice(niceness)
+
+
+def run_training_job(job_id: str, events: multiprocessing.Queue, cpu_budget: int, niceness: int,
+                     resume: bool = False) -> None:
+    """Entry point of the job process: runs the train pipeline and reports its progress through events.
+
+    With resume, the latest run continues from its checkpoint if it was interrupted; otherwise a new run starts.
+    """
+    if hasattr(os, "setsid"):
+        # Own process group, so that cancelling the job also stops the search workers it starts
+        os.setsid()
+    apply_cpu_budget(cpu_budget=cpu_budget, niceness=niceness)
+    try:
+        from src.pipeline.train import TrainPipeline
+
+        resume_timestamp = TrainPipeline.find_interrupted_run() if resume else None
+        train_pipeline = TrainPipeline(stage_callback=lambda stage: events.put((job_id, "stage", stage)),
+                                       resume_timestamp=resume_timestamp)
+        model_pusher_artifact = train_pipeline.run_pipeline()
+        events.put((job_id, "model_accepted", model_pusher_artifact is not None))
+        message = "Model pushed" if model_pusher_artifact is not None else "Model is not accepted"
+        events.put((job_id, JOB_SUCCEEDED, message))
+    except Exception as e:
+        events.put((job_id, JOB_FAILED, str(e)))
+
+
+class TrainingJobManager:
+    """Runs train pipelines in separate processes, at most max_concurrent_jobs at a time.
+
+    Jobs beyond the limit wait in a FIFO queue. A monitor thread applies the progress events sent by the job
+    processes, notices processes that exit without reporting and starts queued jobs when a slot frees up.
+    """
+    def __init__(self, training_job_config: TrainingJobConfig = TrainingJobConfig()):
+        try:
+            self.training_job_config = training_job_config
+            self._context = multiprocessing.get_context("spawn")
+            self._events = self._context.Queue()
+            self._jobs: Dict[str, TrainingJob] = {}
+            self._pending: deque = deque()
+            self._processes: Dict[str, multiprocessing.Process] = {}
+            self._lock = threading.Lock()
+            self._monitor: Optional[threading.Thread] = None
+            self._stopped = threading.Event()
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def submit(self, resume: bool = False) -> TrainingJob:
+        """Queues a train pipeline run and returns its job right away; resume continues the latest interrupted run."""
+        try:
+            job = TrainingJob(job_id=uuid.uuid4().hex, resume=resume)
+            with self._lock:
+                self._jobs[job.job_id] = job
+                self._pending.append(job.job_id)
+                self._start_pending_jobs()
+            self._ensure_monitor()
+            logging.info(f"Submitted training job {job.job_id}")
+            return job
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def get(self, job_id: str) -> Optional[TrainingJob]:
+        return self._jobs.get(job_id)
+
+
+    def list_jobs(self) -> List[TrainingJob]:
+        return list(self._jobs.values())
+
+
+    def cancel(self, job_id: str) -> Optional[TrainingJob]:
+        """Removes a queued job from the queue or stops a running one."""
+        try:
+            process = None
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job.status in FINISHED_JOB_STATUSES:
+                    return job
+                if job.status == JOB_QUEUED:
+                    self._pending.remove(job_id)
+                else:
+                    process = self._processes.pop(job_id)
+                self._finish(job, JOB_CANCELLED, "Cancelled by request")
+            # Stopping a process can take seconds; the monitor and submit do not wait for it
+            if process is not None:
+                self._terminate(process)
+            with self._lock:
+                self._start_pending_jobs()
+            logging.info(f"Cancelled training job {job_id}")
+            return job
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+    def shutdown(self) -> None:
+        """Cancels every queued and running job and stops the monitor thread."""
+        for job in self.list_jobs():
+            self.cancel(job.job_id)
+        self._stopped.set()
+
+
+    def _ensure_monitor(self) -> None:
+        with self._lock:
+            if self._monitor is None or not self._monitor.is_alive():
+                self._monitor = threading.Thread(target=self._monitor_jobs, name="training-jobs", daemon=True)
+                self._monitor.start()
+
+
+    def _monitor_jobs(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                job_id, event, detail = self._events.get(timeout=1)
+                with self._lock:
+                    self._apply_event(job_id, event, detail)
+            except queue.Empty:
+                pass
+            with self._lock:
+                self._reap_processes()
+                self._start_pending_jobs()
+
+
+    def _apply_event(self, job_id: str, event: str, detail: object) -> None:
+        job = self._jobs.get(job_id)
+        if job is None or job.status != JOB_RUNNING:
+            return
+        if event == "model_accepted":
+            job.model_accepted = detail
+        elif event == "stage":
+            if job.stage is not None:
+                job.completed_stages.append(job.stage)
+            job.stage = detail
+            job.progress = len(job.completed_stages) / len(TRAIN_PIPELINE_STAGES)
+        else:
+            if event == JOB_SUCCEEDED:
+                job.completed_stages.append(job.stage)
+                job.stage = None
+                job.progress = 1.0
+            self._finish(job, event, detail)
+            process = self._processes.pop(job_id, None)
+            if process is not None:
+                process.join()
+
+
+    def _reap_processes(self) -> None:
+        for job_id, process in list(self._processes.items()):
+            if process.exitcode is None:
+                continue
+            # Give a final event that is still in the queue a chance to arrive before declaring a crash
+            try:
+                while True:
+                    self._apply_event(*self._events.get_nowait())
+            except queue.Empty:
+                pass
+            if job_id in self._processes:
+                self._processes.pop(job_id)
+                self._finish(self._jobs[job_id], JOB_FAILED, f"Job process exited with code {process.exitcode}")
+
+
+    def _start_pending_jobs(self) -> None:
+        while self._pending and len(self._processes) < self.training_job_config.max_concurrent_jobs:
+            job = self._jobs[self._pending.popleft()]
+            process = self._context.Process(target=run_training_job,
+                                            args=(job.job_id, self._events,
+                                                  self.training_job_config.cpu_budget,
+                                                  self.training_job_config.niceness,
+                                                  job.resume),
+                                            name=f"training-job-{job.job_id}")
+            process.start()
+            self._processes[job.job_id] = process
+            job.status = JOB_RUNNING
+            job.started_at = datetime.now().isoformat(timespec="seconds")
+            logging.info(f"Started training job {job.job_id} in process {process.pid}")
+
+
+    @staticmethod
+    def _terminate(process: multiprocessing.Process) -> None:
+        if process.exitcode is None:
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+            except (AttributeError, ProcessLookupError):
+                # No process groups on this platform, or the job has not created its group yet
+                process.terminate()
+            process.join(timeout=10)
+            if process.exitcode is None:
+                process.kill()
+        process.join()
+
+
+    @staticmethod
+    def _finish(job: TrainingJob, status: str, message: str) -> None:
+        job.status = status
+        job.message = message
+        job.finished_at = datetime.now().isoformat(timespec="seconds")
+        logging.info(f"Training job {job.job_id} {status}: {message}")
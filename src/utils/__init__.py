@@ -1,13 +1,17 @@
 import os
 import sys
+import json
+from typing import List, Optional
 
 import yaml
+import pandas as pd
 from pandas import DataFrame
 import numpy as np
 import dill
 
 from src.logger import logging
 from src.exception import CustomException
+from src.constants import DATAFRAME_FILE_FORMATS
 
 
 def read_yaml_file(file_path: str) -> dict:
@@ -75,12 +79,13 @@ def save_numpy_array_data(file_path: str, array: np.array) -> None:
         raise CustomException(e, sys)
 
 
-def load_numpy_array_data(file_path: str) -> np.array:
+def load_numpy_array_data(file_path: str, mmap_mode: Optional[str] = None) -> np.array:
     """
     Load numpy array data from file.
 
     Args:
         file_path: The string location of file to be loaded.
+        mmap_mode: Memory-map the file in this mode ("r" for read-only) instead of reading it into memory.
 
     Returns:
         The loaded numpy array data.
@@ -90,6 +95,8 @@ def load_numpy_array_data(file_path: str) -> np.array:
 
     """
     try:
+        if mmap_mode is not None:
+            return np.load(file_path, mmap_mode=mmap_mode)
         with open(file_path, 'rb') as file_obj:
             return np.load(file_obj)
     except Exception as e:
@@ -118,3 +125,154 @@ def drop_columns(df: DataFrame, cols: list) -> DataFrame:
         return df
     except Exception as e:
         raise CustomException(e, sys)
+
+
+# File formats of the dataframe artifacts by file extension; parquet and feather need pyarrow
+def get_dataframe_file_format(file_format: str) -> str:
+    """
+    Return the dataframe file format to use for file_format: npz instead of parquet or feather without pyarrow.
+
+    Raises:
+        CustomException: If file_format is not one of DATAFRAME_FILE_FORMATS.
+
+    """
+    try:
+        if file_format not in DATAFRAME_FILE_FORMATS:
+            raise ValueError(f"file_format must be one of {DATAFRAME_FILE_FORMATS}, got {file_format!r}")
+        if file_format in ("parquet", "feather"):
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                logging.info(f"pyarrow is not installed: saving npz instead of {file_format} files")
+                return "npz"
+        return file_format
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def _save_npz_dataframe(file_path: str, df: DataFrame) -> None:
+    # One array per column, plus codes and categories for categoricals and a mask for missing strings and nullable
+    # numbers, so that every column can be read alone and without pickle
+    arrays = {}
+    columns = []
+    for i, (name, series) in enumerate(df.items()):
+        key = f"column_{i}"
+        column = {"name": name, "dtype": str(series.dtype)}
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = series.cat.categories.to_numpy()
+            arrays[key] = series.cat.codes.to_numpy()
+            arrays[f"{key}_categories"] = categories.astype(str) if categories.dtype == object else categories
+            column.update(kind="category", ordered=bool(series.cat.ordered))
+        elif series.dtype == object or isinstance(series.dtype, pd.StringDtype):
+            arrays[key] = series.fillna("").astype(str).to_numpy(dtype=str)
+            arrays[f"{key}_mask"] = series.isna().to_numpy()
+            column.update(kind="string")
+        elif isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+            arrays[key] = series.to_numpy(dtype=series.dtype.numpy_dtype, na_value=0)
+            arrays[f"{key}_mask"] = series.isna().to_numpy()
+            column.update(kind="masked")
+        else:
+            arrays[key] = series.to_numpy()
+            column.update(kind="numpy")
+        columns.append(column)
+    arrays["columns"] = np.array(json.dumps(columns))
+    with open(file_path, "wb") as file_obj:
+        np.savez(file_obj, **arrays)
+
+
+def _load_npz_dataframe(file_path: str, columns: Optional[List[str]] = None) -> DataFrame:
+    with np.load(file_path, allow_pickle=False) as npz:
+        file_columns = json.loads(npz["columns"].item())
+        positions = {column["name"]: i for i, column in enumerate(file_columns)}
+        names = columns if columns is not None else [column["name"] for column in file_columns]
+        data = {}
+        # Only the arrays of the requested columns are read from the file
+        for name in names:
+            i = positions[name]
+            column, key = file_columns[i], f"column_{i}"
+            values = npz[key]
+            if column["kind"] == "category":
+                data[name] = pd.Categorical.from_codes(values, categories=npz[f"{key}_categories"],
+                                                       ordered=column["ordered"])
+            elif column["kind"] == "string":
+                series = pd.Series(values.astype(object)).mask(npz[f"{key}_mask"])
+                data[name] = series if column["dtype"] == "object" else series.astype(column["dtype"])
+            elif column["kind"] == "masked":
+                data[name] = pd.Series(values).astype(column["dtype"]).mask(npz[f"{key}_mask"])
+            else:
+                data[name] = values
+        return DataFrame(data, columns=names)
+
+
+def save_dataframe(file_path: str, df: DataFrame) -> None:
+    """
+    Save a pandas DataFrame, without its index, in the file format of the file extension of file_path.
+
+    Parquet, feather and npz files keep the column dtypes, categoricals included; csv files are text.
+
+    Args:
+        file_path: The string location of file to be saved, ending in one of DATAFRAME_FILE_FORMATS.
+        df: The pandas DataFrame to be saved.
+
+    Raises:
+        CustomException: If df is not successfully saved to the file location.
+
+    """
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        file_format = os.path.splitext(file_path)[1][1:]
+        if file_format == "parquet":
+            df.to_parquet(file_path, index=False)
+        elif file_format == "feather":
+            df.reset_index(drop=True).to_feather(file_path)
+        elif file_format == "npz":
+            _save_npz_dataframe(file_path, df)
+        elif file_format == "csv":
+            df.to_csv(file_path, index=False, header=True)
+        else:
+            raise ValueError(f"Unsupported dataframe file format: {file_path}")
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def load_dataframe(file_path: str, columns: Optional[List[str]] = None) -> DataFrame:
+    """
+    Load a pandas DataFrame saved by save_dataframe, or the concatenation of the part files of a directory.
+
+    Args:
+        file_path: The string location of file to be loaded, or a directory of files loaded in file name order.
+        columns: The columns to read, in this order; all of them by default. Columnar formats skip the others.
+
+    Returns:
+        The loaded pandas DataFrame.
+
+    Raises:
+        CustomException: If the DataFrame is not successfully loaded from the file location.
+
+    """
+    try:
+        if os.path.isdir(file_path):
+            parts = [load_dataframe(os.path.join(file_path, file_name), columns=columns)
+                     for file_name in sorted(os.listdir(file_path))]
+            if not parts:
+                return DataFrame(columns=columns)
+            df = pd.concat(parts, ignore_index=True)
+            # Parts with different categories concatenate to plain columns
+            category_columns = [column for column in df.columns
+                                if any(isinstance(part[column].dtype, pd.CategoricalDtype) for part in parts)]
+            return df.astype({column: "category" for column in category_columns})
+        file_format = os.path.splitext(file_path)[1][1:]
+        if file_format == "parquet":
+            df = pd.read_parquet(file_path, columns=columns)
+        elif file_format == "feather":
+            df = pd.read_feather(file_path, columns=columns)
+        elif file_format == "npz":
+            df = _load_npz_dataframe(file_path, columns=columns)
+        elif file_format == "csv":
+            df = pd.read_csv(file_path, usecols=columns)
+        else:
+            raise ValueError(f"Unsupported dataframe file format: {file_path}")
+        # Some readers return the columns in file order
+        return df if columns is None else df[columns]
+    except Exception as e:
+        raise CustomException(e, sys)